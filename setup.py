@@ -41,7 +41,13 @@ setup(
         'sceptre',
         'troposphere',
         'awacs',
+        'futures; python_version < "3"',
     ],
+    extras_require={
+        'schedule': ['jinja2'],
+        'flowlogs': ['numpy', 'pyarrow'],
+        'site': ['brotli'],
+    },
     packages=find_packages(
         'src',
         exclude=[
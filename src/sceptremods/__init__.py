@@ -13,4 +13,5 @@ MODULES = [
     'alb',
     'ecs_fargate',
     'rds',
+    'aurora',
 ]
@@ -12,7 +12,17 @@ Usage:
     sceptremods (-l | -h | -v)
     sceptremods -m MODULE
     sceptremods -p PROJECT [-d DIR] [-r REGION]
-    sceptremods (--update|--refresh) [-d DIR]
+    sceptremods (--update|--refresh) [-d DIR] [--dry-run] [--diff]
+    sceptremods workspace [-d DIR] [--update|--refresh] [--dry-run] [--diff]
+                [-j JOBS]
+    sceptremods --schedule ENV [-d DIR] [--launch] [--dry-run] [-j JOBS]
+                [--var-file FILE]...
+    sceptremods flowlogs analyze FILE... [--top N] [--subnet SUBNET]...
+                [--fields FIELDS] [--chunk-size SIZE] [--max-keys KEYS]
+    sceptremods site sync SITE_DIR (--stack STACK | --bucket BUCKET)
+                [--distribution ID] [--prefix PREFIX] [--delete] [--dry-run]
+                [-j JOBS] [--cache-control RULE]... [--max-paths N]
+                [--fingerprint] [--precompress]
 
 Options:
     -h, --help             Print usage message.
@@ -24,65 +34,130 @@ Options:
                            sceptre layout and sceptremods template wrappers.
     --update               Update an existing project with new template wrappers.
     --refresh              Update any wrappers already present in the project.
+                           Only files whose content differs are rewritten,
+                           each atomically.
     -d, --dir DIR          Path to parent directory of a project or the 
                            project directory itself if an existing project.
                            [default: .]
     -r, --region REGION    AWS region for initialized project. [default: us-west-2]
+    --schedule ENV         Render templates for all stacks in sceptre
+                           environment ENV in dependency order, running
+                           independent stacks in parallel.  Dependencies come
+                           from '!stack_output' references in stack configs.
+    --launch               With --schedule, launch stacks instead of only
+                           rendering templates.
+    --dry-run              With --schedule, print the dependency graph and
+                           critical path without running sceptre.  With
+                           site sync, --update or --refresh, list changes
+                           without making them.
+    --diff                 With --update or --refresh, show a diff of each
+                           changed file.
+    -j, --jobs JOBS        Number of stacks, uploads or projects to handle
+                           in parallel. [default: 4]
+    --var-file FILE        Sceptre var file to pass through to sceptre.
+
+Flow log analysis options:
+    flowlogs analyze       Report top talkers, rejected flows and bytes per
+                           subnet from VPC flow log files: text, gzipped
+                           text, or parquet (requires pyarrow).
+    --top N                Number of talkers and rejected flows to list.
+                           [default: 10]
+    --subnet SUBNET        Report bytes in and out of subnet SUBNET, given as
+                           CIDR or NAME=CIDR.  Without any, bytes are
+                           reported per subnet-id if the logs record it.
+    --fields FIELDS        Comma separated fields of text files without a
+                           header line.  Default is the default flow log
+                           format.
+    --chunk-size SIZE      Records read and aggregated at a time.
+                           [default: 100000]
+    --max-keys KEYS        Distinct flows kept per table before dropping the
+                           smallest. [default: 200000]
+
+Workspace options:
+    workspace              Find every sceptre project under DIR and report
+                           those whose config.yaml sceptremods_version is
+                           not the installed version.  Given an update or
+                           refresh option, also apply it to all of them at
+                           once.
+
+Site sync options:
+    site sync              Upload the files in SITE_DIR that changed since
+                           the last sync to a cloudfront_s3_website origin
+                           bucket, then invalidate them in its distribution.
+    --stack STACK          Name of the cloudfront_s3_website stack, whose
+                           OriginBucket and DistributionId outputs are used.
+    --bucket BUCKET        Origin bucket, instead of --stack.
+    --distribution ID      CloudFront distribution to invalidate, with --bucket.
+    --prefix PREFIX        Key prefix of the site in the bucket, i.e. the
+                           stack's OriginPath. [default: ]
+    --delete               Delete objects no longer in SITE_DIR.
+    --cache-control RULE   Cache-Control for files matching a glob, given as
+                           PATTERN=VALUE.  Checked in order before the
+                           defaults: no caching for *.html, an hour for
+                           everything else.
+    --max-paths N          Most invalidation paths to request; more changed
+                           paths are collapsed into wildcards. [default: 10]
+    --fingerprint          Also upload static assets under content hashed
+                           names with immutable caching, and point html and
+                           css references at them.
+    --precompress          Also upload brotli and gzip compressed variants
+                           of text files, for stacks with Precompressed set.
+                           Requires the brotli package.  Once used, every
+                           later sync of the bucket needs it too.
 
 Example:
     sceptremods -p sceptre-myprog -d ~/projects -r us-east-1 
+    sceptremods workspace -d ~/src/infra --refresh --dry-run
+    sceptremods --schedule dev --var-file var/dev.yaml --launch
+    sceptremods flowlogs analyze logs/*.log.gz --subnet app=10.128.1.0/24
+    sceptremods site sync build/html --stack sceptre-myweb-prod-site --delete
 '''
 
 
 import os
 import sys
-import shutil
 import importlib
 from inspect import getmembers, isclass
 from pkg_resources import Requirement, resource_filename
 
 import yaml
+from botocore.exceptions import BotoCoreError, ClientError
 from docopt import docopt
 
 import sceptremods
+from sceptremods import filesync, flowlogs, scheduler, site_sync, workspace
 from sceptremods.templates import BaseTemplate
 
 
 
-def refresh_files(src, dest):
+def refresh_files(src, dest, dry_run=False, diff=False):
     """
     Update contents of existing 'dest' files from 'src' file
-    of same name.
+    of same name.  Identical files are not rewritten.
     """
-    if not os.path.isdir(src):
-        print('Source directory "{}" not found'.format(src))
+    try:
+        changes = filesync.sync_project(src, dest, refresh=True, dry_run=dry_run)
+    except ValueError as e:
+        print(e)
         sys.exit(1)
-    if os.path.isdir(dest):
-        files = os.listdir(dest)
-        for f in files:
-            if os.path.isfile(os.path.join(src, f)):
-                shutil.copyfile(os.path.join(src, f), os.path.join(dest, f))
-            else:
-                print('File "{}" not found in source dir'.format(f))
+    filesync.print_changes(dest, changes, dry_run, diff)
 
 
-def recursive_overwrite(src, dest):
+def recursive_overwrite(src, dest, dry_run=False, diff=False):
     """
     Recursively copy 'src' directory into 'dest' directory.
-    Overwrites contents of existing 'dest' files from 'src' file
-    of same name.
+    Overwrites contents of existing 'dest' files which differ from the
+    'src' file of same name.
 
     example:
         recursive_overwrite(wrappers, sceptre_dir)
     """
-    if os.path.isdir(src):
-        if not os.path.isdir(dest):
-            os.makedirs(dest)
-        files = os.listdir(src)
-        for f in files:
-            recursive_overwrite(os.path.join(src, f), os.path.join(dest, f))
-    else:
-        shutil.copyfile(src, dest)
+    changes = filesync.sync_project(src, dest, dry_run=dry_run)
+    filesync.print_changes(dest, changes, dry_run, diff)
+
+
+def wrappers_dir():
+    return resource_filename(Requirement.parse('aws-sceptremods'), 'wrappers')
 
 
 def initialize_project(args):
@@ -90,7 +165,7 @@ def initialize_project(args):
     Generate project directories or update existing project.
     """
     project = args['--project']
-    wrappers = resource_filename(Requirement.parse('aws-sceptremods'), 'wrappers')
+    wrappers = wrappers_dir()
 
     if not args['--dir']:
         project_dir = os.getcwd()
@@ -104,8 +179,10 @@ def initialize_project(args):
             sys.exit(1)
         print('refreshing sceptre project at {}'.format(sceptre_dir))
         refresh_files(
-            os.path.join(wrappers, 'templates'), 
-            os.path.join(sceptre_dir, 'templates')
+            os.path.join(wrappers, 'templates'),
+            os.path.join(sceptre_dir, 'templates'),
+            args['--dry-run'],
+            args['--diff'],
         )
 
     elif args['--update']:
@@ -113,7 +190,8 @@ def initialize_project(args):
             print('sceptre project not found at {}'.format(sceptre_dir))
             sys.exit(1)
         print('updating sceptre project at {}'.format(sceptre_dir))
-        recursive_overwrite(wrappers, sceptre_dir)
+        recursive_overwrite(
+            wrappers, sceptre_dir, args['--dry-run'], args['--diff'])
 
     else:
         if os.path.isdir(sceptre_dir):
@@ -135,6 +213,114 @@ def initialize_project(args):
         recursive_overwrite(wrappers, sceptre_dir)
 
 
+def workspace_projects(args):
+    """
+    Check, and optionally update or refresh, all sceptre projects under a
+    directory in one pass.
+    """
+    root = os.path.abspath(args['--dir'] or os.getcwd())
+    projects = workspace.discover_projects(root)
+    if not projects:
+        print('no sceptre projects found under {}'.format(root))
+        sys.exit(1)
+    if args['--update'] or args['--refresh']:
+        try:
+            results = workspace.sync_workspace(
+                projects, wrappers_dir(),
+                refresh=args['--refresh'],
+                dry_run=args['--dry-run'],
+                jobs=int(args['--jobs']),
+            )
+        except (IOError, OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        for dest, changes in sorted(results.items()):
+            filesync.print_changes(dest, changes, args['--dry-run'], args['--diff'])
+        print()
+    stale = workspace.stale_projects(projects, sceptremods.__version__)
+    workspace.print_report(root, projects, stale, sceptremods.__version__)
+
+
+def schedule_project(args):
+    """
+    Run sceptre over all stacks in an environment in dependency order.
+    """
+    project_dir = os.path.abspath(args['--dir'] or os.getcwd())
+    sceptre_dir = os.path.join(project_dir, 'sceptre')
+    if not os.path.isdir(sceptre_dir):
+        sceptre_dir = project_dir
+    if not os.path.isdir(os.path.join(sceptre_dir, 'config')):
+        print('sceptre project not found at {}'.format(sceptre_dir))
+        sys.exit(1)
+    var_files = [os.path.abspath(f) for f in args['--var-file']]
+    try:
+        stacks = scheduler.build_graph(scheduler.discover_stacks(
+            sceptre_dir, args['--schedule'], var_files))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    if args['--dry-run']:
+        scheduler.print_report(stacks)
+        return
+    command = 'launch' if args['--launch'] else 'render'
+    results = scheduler.run_graph(
+        stacks, command, sceptre_dir, var_files, int(args['--jobs']))
+    print()
+    scheduler.print_report(stacks, results)
+    if [r for r in results.values() if r.status != 'ok']:
+        sys.exit(1)
+
+
+def analyze_flowlogs(args):
+    """
+    Stream flow log files through a FlowLogAnalysis and print its report.
+    """
+    try:
+        fields = flowlogs.parse_fields(args['--fields']) if args['--fields'] else None
+        analysis = flowlogs.FlowLogAnalysis(
+            args['--subnet'], int(args['--max-keys']))
+        for path in args['FILE']:
+            analysis.add_file(path, fields, int(args['--chunk-size']))
+    except (IOError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    analysis.print_report(int(args['--top']))
+
+
+def sync_site(args):
+    """
+    Deploy changed files of a static site to its CFS3Site stack.
+    """
+    site_dir = args['SITE_DIR']
+    if not os.path.isdir(site_dir):
+        print('site directory "{}" not found'.format(site_dir))
+        sys.exit(1)
+    try:
+        if args['--stack']:
+            bucket, distribution = site_sync.stack_site(args['--stack'])
+            if not distribution:
+                print('stack {} has no DistributionId output, skipping '
+                      'invalidation'.format(args['--stack']))
+        else:
+            bucket, distribution = args['--bucket'], args['--distribution']
+        result = site_sync.sync_site(
+            site_dir, bucket, distribution,
+            prefix=args['--prefix'],
+            delete=args['--delete'],
+            dry_run=args['--dry-run'],
+            jobs=int(args['--jobs']),
+            rules=site_sync.parse_cache_control(args['--cache-control']),
+            max_paths=int(args['--max-paths']),
+            fingerprint=args['--fingerprint'],
+            precompress=args['--precompress'],
+        )
+    except (BotoCoreError, ClientError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    site_sync.print_result(result, args['--dry-run'])
+
+
 def get_help(module_name):
     """
     Call the help() method of the sectremods.template class hosted
@@ -153,9 +339,20 @@ def main():
     if args['--list']:
         print('sceptremods modules: \n{}'.format('\n'.join(sceptremods.MODULES)))
 
-    if args['--project'] or args['--update'] or args['--refresh']:
+    if args['workspace']:
+        workspace_projects(args)
+    elif args['--project'] or args['--update'] or args['--refresh']:
         initialize_project(args)
 
+    if args['--schedule']:
+        schedule_project(args)
+
+    if args['flowlogs'] and args['analyze']:
+        analyze_flowlogs(args)
+
+    if args['site'] and args['sync']:
+        sync_site(args)
+
     if args['--module']:
         module_name = args['--module']
         if module_name not in sceptremods.MODULES:
@@ -0,0 +1,172 @@
+"""
+Copy sceptremods wrapper files into sceptre projects, writing only what
+changed.
+
+plan_update() plans a recursive copy of a source tree into a project, as
+for 'sceptremods --update'.  plan_refresh() plans updates to only those
+files already present in a project directory, as for '--refresh'.  Files
+are compared by size and then sha256 digest, so identical files are left
+untouched, mtimes included.  apply_changes() writes each changed file to a
+temporary file in the destination directory and renames it into place, so
+readers never see a partly written file.
+
+sync_projects() plans and applies changes for many projects at once in a
+thread pool, e.g.:
+
+    results = sync_projects(
+        [(wrappers, 'proj1/sceptre'), (wrappers, 'proj2/sceptre')],
+        refresh=False, dry_run=True)
+    for dest, changes in sorted(results.items()):
+        print_changes(dest, changes)
+"""
+
+import difflib
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+# action is one of ACTIONS
+Change = namedtuple('Change', ['action', 'source', 'dest'])
+ACTIONS = ['create', 'update', 'unchanged', 'orphan']
+
+replace = getattr(os, 'replace', os.rename)
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def same_content(source, dest):
+    return (os.path.getsize(source) == os.path.getsize(dest)
+            and file_digest(source) == file_digest(dest))
+
+
+def compare(source, dest):
+    if not os.path.isfile(dest):
+        return Change('create', source, dest)
+    if same_content(source, dest):
+        return Change('unchanged', source, dest)
+    return Change('update', source, dest)
+
+
+def plan_update(src, dest):
+    """
+    Return the Changes copying every file under 'src' to the same path
+    under 'dest'.
+    """
+    if not os.path.isdir(src):
+        return [compare(src, dest)]
+    changes = []
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+        for filename in sorted(filenames):
+            if filename.endswith('.pyc'):
+                continue
+            source = os.path.join(dirpath, filename)
+            changes.append(compare(
+                source, os.path.join(dest, os.path.relpath(source, src))))
+    return changes
+
+
+def plan_refresh(src, dest):
+    """
+    Return the Changes updating each file in directory 'dest' from the
+    file of the same name in 'src'.  Files missing from 'src' are
+    'orphan' changes, which apply_changes() leaves alone.
+    """
+    if not os.path.isdir(src):
+        raise ValueError('Source directory "{}" not found'.format(src))
+    changes = []
+    if os.path.isdir(dest):
+        for filename in sorted(os.listdir(dest)):
+            target = os.path.join(dest, filename)
+            if not os.path.isfile(target):
+                continue
+            source = os.path.join(src, filename)
+            if os.path.isfile(source):
+                changes.append(compare(source, target))
+            else:
+                changes.append(Change('orphan', None, target))
+    return changes
+
+
+def write_atomic(source, dest):
+    """Copy 'source' to 'dest' through a temporary file and a rename."""
+    dest_dir = os.path.dirname(dest) or '.'
+    if not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+    fd, tmp_file = tempfile.mkstemp(
+        dir=dest_dir, prefix='.' + os.path.basename(dest) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f, open(source, 'rb') as s:
+            shutil.copyfileobj(s, f)
+        shutil.copymode(source, tmp_file)
+        replace(tmp_file, dest)
+    except Exception:
+        os.remove(tmp_file)
+        raise
+
+
+def apply_changes(changes):
+    """Write the created and updated files in 'changes'."""
+    for change in changes:
+        if change.action in ('create', 'update'):
+            write_atomic(change.source, change.dest)
+
+
+def change_diff(change):
+    """Return a unified diff of 'change' as a list of lines."""
+    if change.action not in ('create', 'update'):
+        return []
+    def lines(path):
+        if not os.path.isfile(path):
+            return []
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', 'replace').splitlines(True)
+    return list(difflib.unified_diff(
+        lines(change.dest), lines(change.source), change.dest, change.source))
+
+
+def sync_project(src, dest, refresh=False, dry_run=False):
+    """Plan, and unless 'dry_run' apply, the changes for one project."""
+    changes = plan_refresh(src, dest) if refresh else plan_update(src, dest)
+    if not dry_run:
+        apply_changes(changes)
+    return changes
+
+
+def sync_projects(pairs, refresh=False, dry_run=False, jobs=8):
+    """
+    Sync each (src, dest) in 'pairs' in parallel.  Return a dict of dest
+    to its list of Changes.
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = dict(
+            (dest, executor.submit(sync_project, src, dest, refresh, dry_run))
+            for src, dest in pairs
+        )
+    return dict((dest, future.result()) for dest, future in futures.items())
+
+
+def print_changes(dest, changes, dry_run=False, diff=False):
+    counts = dict((action, 0) for action in ACTIONS)
+    verb = 'would ' if dry_run else ''
+    for change in changes:
+        counts[change.action] += 1
+        path = os.path.relpath(change.dest, dest)
+        if change.action in ('create', 'update'):
+            print('{}{} {}'.format(verb, change.action, path))
+            if diff:
+                print(''.join(change_diff(change)).rstrip('\n'))
+        elif change.action == 'orphan':
+            print('File "{}" not found in source dir'.format(path))
+    print('{}: {} created, {} updated, {} unchanged'.format(
+        dest, counts['create'], counts['update'], counts['unchanged']))
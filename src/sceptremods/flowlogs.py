@@ -0,0 +1,355 @@
+"""
+Analyze VPC flow log records delivered by the vpc_flowlogs module.
+
+Records are streamed from local files in chunks of 'chunk_size' records:
+plain text or gzipped text as delivered to S3 (or exported from CloudWatch
+Logs), and Parquet files when pyarrow is installed.  Each chunk is reduced
+to per-key totals before the next one is read, with numpy doing the
+grouping when it is installed.  Memory then depends on the chunk size and
+the number of distinct keys, not on the size of the logs.  Key totals are
+capped at 'max_keys'; when a table outgrows it only the largest half is
+kept, and the report marks those totals as approximate.
+
+The report lists top talkers by bytes, rejected flows by record count and
+bytes sent and received per subnet, e.g. to check that security group or
+network acl changes made with the sg module reject what they should:
+
+    analysis = FlowLogAnalysis(subnets=['app=10.128.1.0/24'])
+    for path in ['flows.log.gz', 'flows.parquet']:
+        analysis.add_file(path)
+    analysis.print_report(top=10)
+"""
+
+import gzip
+import importlib
+import io
+
+from sceptremods.templates.vpc_flowlogs import (
+    DEFAULT_FLOW_LOG_FIELDS,
+    FLOW_LOG_FIELDS,
+)
+from sceptremods.util.sg_rules import format_cidr, host_mask, parse_cidr
+
+
+CHUNK_SIZE = 100000
+MAX_KEYS = 200000
+REQUIRED_FIELDS = ['srcaddr', 'dstaddr', 'bytes', 'action']
+OPTIONAL_FIELDS = ['dstport', 'protocol', 'subnet-id']
+MISSING = '-'
+PROTOCOLS = {'1': 'icmp', '6': 'tcp', '17': 'udp', '58': 'icmpv6'}
+
+# optional modules, imported on first use
+_modules = dict()
+
+
+def optional_module(name):
+    """Return module 'name', or None when it is not installed."""
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            _modules[name] = None
+    return _modules[name]
+
+
+#
+# readers
+#
+def parse_fields(fields):
+    """Return a list of flow log field names from a space or comma separated string."""
+    names = fields.replace(',', ' ').split()
+    unknown = [f for f in names if f not in FLOW_LOG_FIELDS]
+    if unknown:
+        raise ValueError('unknown flow log fields: {}'.format(' '.join(unknown)))
+    return names
+
+
+def check_fields(path, fields):
+    missing = [f for f in REQUIRED_FIELDS if f not in fields]
+    if missing:
+        raise ValueError('{} has no {} field'.format(path, ', '.join(missing)))
+
+
+def read_text(path, fields=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield chunks of records from a text or gzipped text flow log file.
+    Each chunk maps field name to a list of string values.  A header line
+    naming the fields, as written to S3, takes precedence over 'fields'.
+    Lines with the wrong number of fields get '-' for every value.
+    """
+    opener = gzip.open if path.endswith('.gz') else io.open
+    with opener(path, 'rt') as f:
+        positions = None
+        chunk = None
+        for line in f:
+            values = line.split()
+            if not values:
+                continue
+            if positions is None:
+                if not [v for v in values if v not in FLOW_LOG_FIELDS]:
+                    names = values
+                    values = None
+                else:
+                    names = fields or DEFAULT_FLOW_LOG_FIELDS
+                check_fields(path, names)
+                positions = dict(
+                    (name, names.index(name))
+                    for name in REQUIRED_FIELDS + OPTIONAL_FIELDS
+                    if name in names
+                )
+                width = len(names)
+                chunk = dict((name, []) for name in positions)
+                if values is None:
+                    continue
+            if len(values) != width:
+                values = [MISSING] * width
+            for name, position in positions.items():
+                chunk[name].append(values[position])
+            if len(chunk['bytes']) >= chunk_size:
+                yield chunk
+                chunk = dict((name, []) for name in positions)
+        if chunk and chunk['bytes']:
+            yield chunk
+
+
+def read_parquet(path, chunk_size=CHUNK_SIZE):
+    """
+    Yield chunks of records from a Parquet flow log file, reading only the
+    needed columns one record batch at a time.  Parquet columns use '_'
+    where field names use '-'.
+    """
+    pq = optional_module('pyarrow.parquet')
+    if pq is None:
+        raise ValueError('reading {} requires pyarrow'.format(path))
+    pa = optional_module('pyarrow')
+    pc = optional_module('pyarrow.compute')
+    parquet_file = pq.ParquetFile(path)
+    columns = dict(
+        (name.replace('_', '-'), name) for name in parquet_file.schema_arrow.names
+    )
+    check_fields(path, columns)
+    wanted = [n for n in REQUIRED_FIELDS + OPTIONAL_FIELDS if n in columns]
+    for batch in parquet_file.iter_batches(
+            batch_size=chunk_size, columns=[columns[n] for n in wanted]):
+        chunk = dict()
+        for index, name in enumerate(wanted):
+            column = batch.column(index)
+            if name == 'bytes':
+                chunk[name] = column.to_pylist()
+            else:
+                chunk[name] = pc.fill_null(
+                    pc.cast(column, pa.string()), MISSING).to_pylist()
+        yield chunk
+
+
+def read_file(path, fields=None, chunk_size=CHUNK_SIZE):
+    if path.endswith('.parquet'):
+        return read_parquet(path, chunk_size)
+    return read_text(path, fields, chunk_size)
+
+
+#
+# chunk arithmetic, vectorized when numpy is installed
+#
+def is_count(value):
+    """Whether 'value', a string or parquet integer, is a byte count."""
+    return str(value).isdigit()
+
+
+def valid_records(chunk):
+    """
+    Return 'chunk' without records lacking a byte count (NODATA, SKIPDATA
+    or malformed), with bytes as integers.
+    """
+    np = optional_module('numpy')
+    if np is None:
+        keep = [i for i, b in enumerate(chunk['bytes']) if is_count(b)]
+        records = dict((k, [v[i] for i in keep]) for k, v in chunk.items())
+        records['bytes'] = [int(b) for b in records['bytes']]
+        return records
+    nbytes = np.asarray(chunk['bytes'], dtype=object)
+    keep = np.fromiter(
+        (is_count(b) for b in chunk['bytes']), dtype=bool, count=len(nbytes))
+    records = dict(
+        (k, np.asarray(v)[keep]) for k, v in chunk.items() if k != 'bytes')
+    records['bytes'] = nbytes[keep].astype(np.int64)
+    return records
+
+
+def total(values):
+    np = optional_module('numpy')
+    return int(np.sum(values)) if np is not None else sum(values)
+
+
+def select(records, field, value):
+    """Return the records whose 'field' equals 'value'."""
+    np = optional_module('numpy')
+    if np is None:
+        keep = [i for i, v in enumerate(records[field]) if v == value]
+        return dict((k, [v[i] for i in keep]) for k, v in records.items())
+    keep = records[field] == value
+    return dict((k, v[keep]) for k, v in records.items())
+
+
+def group_sum(columns, weights=None):
+    """
+    Return a list of (key tuple, total) for each distinct row of the
+    parallel 'columns', summing 'weights' (or counting rows when None).
+    """
+    np = optional_module('numpy')
+    if np is None:
+        totals = dict()
+        if weights is None:
+            weights = [1] * len(columns[0])
+        for key, weight in zip(zip(*columns), weights):
+            totals[key] = totals.get(key, 0) + weight
+        return list(totals.items())
+    if not len(columns[0]):
+        return []
+    # Fold the columns into one dense group code, renumbering after each
+    # column so codes stay below len(rows)**2.
+    code = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        values, inverse = np.unique(column, return_inverse=True)
+        code = code * len(values) + inverse.reshape(-1)
+        code = np.unique(code, return_inverse=True)[1].reshape(-1)
+    first = np.unique(code, return_index=True)[1]
+    if weights is None:
+        sums = np.bincount(code)
+    else:
+        sums = np.bincount(code, weights=weights).round().astype(np.int64)
+    return [
+        (tuple(str(column[i]) for column in columns), int(count))
+        for i, count in zip(first, sums)
+    ]
+
+
+class Totals(object):
+    """Totals per key, holding at most 'max_keys' keys."""
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self.totals = dict()
+        self.approximate = False
+
+    def update(self, pairs):
+        totals = self.totals
+        for key, value in pairs:
+            totals[key] = totals.get(key, 0) + value
+        if len(totals) > self.max_keys:
+            self.totals = dict(self.top(self.max_keys // 2))
+            self.approximate = True
+
+    def top(self, count):
+        return sorted(
+            self.totals.items(), key=lambda kv: (-kv[1], kv[0]))[:count]
+
+
+def parse_subnet(subnet):
+    """Return (name, network, prefixlen) for a 'name=cidr' or 'cidr' string."""
+    name, _, cidr = subnet.rpartition('=')
+    network, prefixlen = parse_cidr(cidr)
+    return name or format_cidr(network, prefixlen), network, prefixlen
+
+
+def address_subnets(address, subnets):
+    """Return the names of the 'subnets' containing ipv4 'address'."""
+    try:
+        host = parse_cidr(address)[0]
+    except ValueError:
+        return []
+    return [name for name, network, prefixlen in subnets
+            if host & ~host_mask(prefixlen) == network]
+
+
+#
+# the analysis
+#
+class FlowLogAnalysis(object):
+    """
+    Running totals over flow log chunks.  'subnets' is a list of 'name=cidr'
+    or 'cidr' strings.  Without them, bytes are totaled per subnet-id when
+    the records include that field.
+    """
+
+    def __init__(self, subnets=(), max_keys=MAX_KEYS):
+        self.subnets = [parse_subnet(s) for s in subnets]
+        self.records = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.talkers = Totals(max_keys)
+        self.rejected_flows = Totals(max_keys)
+        self.subnet_bytes = dict()
+
+    def add_file(self, path, fields=None, chunk_size=CHUNK_SIZE):
+        for chunk in read_file(path, fields, chunk_size):
+            self.add_chunk(chunk)
+
+    def add_chunk(self, chunk):
+        count = len(chunk['bytes'])
+        records = valid_records(chunk)
+        self.records += count
+        self.skipped += count - len(records['bytes'])
+        self.bytes += total(records['bytes'])
+        self.talkers.update(group_sum(
+            [records['srcaddr'], records['dstaddr']], records['bytes']))
+
+        rejected = select(records, 'action', 'REJECT')
+        self.rejected += len(rejected['bytes'])
+        self.rejected_flows.update(group_sum([
+            rejected['srcaddr'],
+            rejected['dstaddr'],
+            rejected.get('dstport', [MISSING] * len(rejected['bytes'])),
+            rejected.get('protocol', [MISSING] * len(rejected['bytes'])),
+        ]))
+
+        if self.subnets:
+            for direction, field in [('out', 'srcaddr'), ('in', 'dstaddr')]:
+                for (address,), count in group_sum(
+                        [records[field]], records['bytes']):
+                    for name in address_subnets(address, self.subnets):
+                        self.add_subnet_bytes(name, direction, count)
+        elif 'subnet-id' in records:
+            for (subnet_id,), count in group_sum(
+                    [records['subnet-id']], records['bytes']):
+                self.add_subnet_bytes(subnet_id, 'total', count)
+
+    def add_subnet_bytes(self, name, direction, count):
+        counts = self.subnet_bytes.setdefault(name, dict())
+        counts[direction] = counts.get(direction, 0) + count
+
+    def report(self, top=10):
+        """Return the report as a list of lines."""
+        def approximate(totals):
+            return ' (approximate)' if totals.approximate else ''
+
+        lines = [
+            'records: {}  skipped: {}  bytes: {}  rejected: {}'.format(
+                self.records, self.skipped, self.bytes, self.rejected),
+            '',
+            'top talkers by bytes{}:'.format(approximate(self.talkers)),
+        ]
+        for (src, dst), count in self.talkers.top(top):
+            lines.append('  {:<40} {:>16}'.format(
+                '{} -> {}'.format(src, dst), count))
+        lines.append('')
+        lines.append('rejected flows by records{}:'.format(
+            approximate(self.rejected_flows)))
+        for (src, dst, port, protocol), count in self.rejected_flows.top(top):
+            lines.append('  {:<40} {:>16}'.format('{} -> {}:{}/{}'.format(
+                src, dst, port, PROTOCOLS.get(protocol, protocol)), count))
+        if self.subnet_bytes:
+            lines.append('')
+            lines.append('bytes per subnet:')
+            for name in sorted(self.subnet_bytes):
+                counts = self.subnet_bytes[name]
+                if 'total' in counts:
+                    lines.append('  {:<24} {:>16}'.format(name, counts['total']))
+                else:
+                    lines.append('  {:<24} in {:>16}  out {:>16}'.format(
+                        name, counts.get('in', 0), counts.get('out', 0)))
+        return lines
+
+    def print_report(self, top=10):
+        print('\n'.join(self.report(top)))
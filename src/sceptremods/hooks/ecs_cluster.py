@@ -5,13 +5,42 @@ from sceptre.hooks import Hook
 class ECSCluster(Hook):
     """
     Check if the specified ecs cluster exists.  If not, create it.
+
+    The argument is the cluster name, optionally followed by a space
+    separated list of capacity providers to attach to the cluster, e.g.:
+
+        !ecs_cluster my-cluster FARGATE FARGATE_SPOT
+
+    Capacity providers already attached to the cluster are kept, as is
+    its default capacity provider strategy.
     """
 
     def __init__(self, *args, **kwargs):
         super(ECSCluster, self).__init__(*args, **kwargs)
 
+    def ensure_capacity_providers(self, cluster, capacity_providers):
+        attached = cluster.get('capacityProviders', [])
+        missing = [cp for cp in capacity_providers if cp not in attached]
+        if not missing:
+            return
+        self.stack.connection_manager.call(
+            service="ecs",
+            command="put_cluster_capacity_providers",
+            kwargs=dict(
+                cluster=cluster['clusterName'],
+                capacityProviders=attached + missing,
+                defaultCapacityProviderStrategy=cluster.get(
+                    'defaultCapacityProviderStrategy', []),
+            )
+        )
+        self.logger.debug("{} - Attached capacity providers {} to ECS Cluster: {}".format(
+            __name__, missing, cluster["clusterArn"])
+        )
+
     def run(self):
-        cluster_name = self.argument
+        arguments = self.argument.split()
+        cluster_name = arguments[0]
+        capacity_providers = arguments[1:]
         response = self.stack.connection_manager.call(
             service="ecs",
             command="describe_clusters",
@@ -22,18 +51,20 @@ class ECSCluster(Hook):
         if (response['clusters'] 
             and response['clusters'][0]["status"] == 'ACTIVE'
         ):
+            cluster = response['clusters'][0]
             self.logger.debug("{} - Found Active ECS Cluster: {}".format(
-                __name__, response['clusters'][0]["clusterArn"])
+                __name__, cluster["clusterArn"])
             )
+            self.ensure_capacity_providers(cluster, capacity_providers)
         else:
+            kwargs = dict(clusterName=cluster_name)
+            if capacity_providers:
+                kwargs['capacityProviders'] = capacity_providers
             response = self.stack.connection_manager.call(
                 service="ecs",
                 command="create_cluster",
-                kwargs=dict(
-                    clusterName=cluster_name
-                )
+                kwargs=kwargs
             )
             self.logger.debug("{} - Created ECS Cluster {}".format(
                 __name__, response["cluster"]["clusterArn"])
             )
-
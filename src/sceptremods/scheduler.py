@@ -0,0 +1,423 @@
+"""
+Dependency scheduling for sceptre projects built from sceptremods modules.
+
+Stacks chain together through stack outputs, e.g. vpc -> sg -> alb ->
+ecs_fargate -> rds.  The scheduler reads every stack config in a sceptre
+environment, maps each '!stack_output' reference in 'sceptre_user_data' or
+'parameters' (plus any explicit 'dependencies') to a graph edge, and checks
+these against the consuming module's VARSPEC and the producing module's
+declared outputs.  It then runs sceptre on each stack as soon as all of the
+stacks it depends on have finished, up to 'jobs' at a time, and reports the
+critical path through the graph.
+
+Example:
+    stacks = discover_stacks('sceptre', 'dev', var_files=['var/dev.yaml'])
+    graph = build_graph(stacks)
+    results = run_graph(graph, command='launch', sceptre_dir='sceptre')
+    print_report(graph, results)
+"""
+
+import os
+import re
+import time
+import warnings
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import yaml
+
+import sceptremods
+from sceptremods.templates import MODULE_KEY, get_template_class, wrapper_module
+
+
+JINJA_EXPRESSION = re.compile(r'{{.*?}}')
+JINJA_STATEMENT = re.compile(r'{%.*?%}')
+JINJA_PLACEHOLDER = '__jinja__'
+
+COMMANDS = {
+    'render': ['generate'],
+    'launch': ['launch', '--yes'],
+}
+
+Tagged = namedtuple('Tagged', ['tag', 'value'])
+Result = namedtuple('Result', ['stack', 'status', 'duration', 'output'])
+
+
+class StackNode(object):
+    """A sceptre stack, its sceptremods module and its dependencies."""
+
+    def __init__(self, name, module=None, user_data=None):
+        self.name = name
+        self.module = module
+        self.user_data = user_data or dict()
+        # input key -> (producer stack name, output name)
+        self.inputs = dict()
+        self.dependencies = set()
+        self.external = set()
+        self.warnings = list()
+
+    def __repr__(self):
+        return 'StackNode({})'.format(self.name)
+
+
+#
+# config parsing
+#
+class ConfigLoader(yaml.SafeLoader):
+    """Yaml loader which keeps sceptre resolver/hook tags as Tagged values."""
+
+
+def construct_tagged(loader, tag_suffix, node):
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    return Tagged(tag_suffix, value)
+
+ConfigLoader.add_multi_constructor('!', construct_tagged)
+
+
+def load_var_files(var_files):
+    variables = dict()
+    for var_file in var_files or list():
+        with open(var_file) as f:
+            variables.update(yaml.safe_load(f) or dict())
+    return variables
+
+
+def render_config(text, variables, path=None):
+    """
+    Render the jinja in a stack config.  Fall back, with a warning, to
+    replacing jinja expressions with a placeholder when jinja2 is not
+    installed or the template cannot be rendered, e.g. because the
+    variables needed are not supplied.
+    """
+    try:
+        import jinja2
+    except ImportError:
+        warnings.warn('jinja2 not installed, stack config jinja is not rendered')
+        return strip_jinja(text)
+    try:
+        return jinja2.Template(text, undefined=jinja2.StrictUndefined).render(
+            var=variables,
+            environment_variable=os.environ,
+        )
+    except jinja2.TemplateError as e:
+        warnings.warn('{}: {}, jinja is not rendered'.format(
+            path or 'stack config', e))
+        return strip_jinja(text)
+
+
+def strip_jinja(text):
+    text = JINJA_STATEMENT.sub('', text)
+    return JINJA_EXPRESSION.sub(JINJA_PLACEHOLDER, text)
+
+
+def load_stack_config(path, variables=None):
+    with open(path) as f:
+        text = render_config(f.read(), variables or dict(), path)
+    return yaml.load(text, Loader=ConfigLoader) or dict()
+
+
+def find_stack_outputs(value):
+    """
+    Yield all '!stack_output' and '!stack_output_external' tags found in
+    'value'.
+    """
+    if isinstance(value, Tagged):
+        if value.tag in ['stack_output', 'stack_output_external']:
+            yield value
+        else:
+            for tagged in find_stack_outputs(value.value):
+                yield tagged
+    elif isinstance(value, dict):
+        for item in value.values():
+            for tagged in find_stack_outputs(item):
+                yield tagged
+    elif isinstance(value, list):
+        for item in value:
+            for tagged in find_stack_outputs(item):
+                yield tagged
+
+
+def stack_name(path):
+    """Normalize a sceptre stack path: 'dev/alb.yaml' -> 'dev/alb'."""
+    path = path.strip().strip('/')
+    if path.endswith('.yaml'):
+        path = path[:-len('.yaml')]
+    return path
+
+
+def template_module(template_path, sceptre_user_data=None):
+    """
+    Return the sceptremods module a template wrapper points to, if any,
+    honouring MODULE_KEY in 'sceptre_user_data' as the generic wrapper does.
+    """
+    module = (sceptre_user_data or dict()).get(MODULE_KEY)
+    if module in sceptremods.MODULES:
+        return module
+    return wrapper_module(template_path)
+
+
+#
+# graph building
+#
+def discover_stacks(sceptre_dir, environment, var_files=None):
+    """
+    Return a dict of StackNodes for every stack config found under
+    'environment' in the config directory of 'sceptre_dir'.
+    """
+    config_dir = os.path.join(sceptre_dir, 'config')
+    env_dir = os.path.join(config_dir, environment)
+    if not os.path.isdir(env_dir):
+        raise ValueError('sceptre environment not found at {}'.format(env_dir))
+    variables = load_var_files(var_files)
+
+    configs = dict()
+    for dirpath, dirnames, filenames in os.walk(env_dir, followlinks=True):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith('.yaml') or filename == 'config.yaml':
+                continue
+            path = os.path.join(dirpath, filename)
+            name = stack_name(os.path.relpath(path, config_dir).replace(os.sep, '/'))
+            configs[name] = load_stack_config(path, variables)
+
+    stacks = dict()
+    for name, config in configs.items():
+        user_data = config.get('sceptre_user_data')
+        stacks[name] = StackNode(name, template_module(
+            config.get('template_path'), user_data), user_data)
+    for name, config in configs.items():
+        node = stacks[name]
+        for key in ['sceptre_user_data', 'parameters']:
+            for input_key, value in (config.get(key) or dict()).items():
+                for tagged in find_stack_outputs(value):
+                    producer_path, output = str(tagged.value).split('::', 1)
+                    if tagged.tag == 'stack_output_external':
+                        node.external.add(producer_path.strip())
+                        continue
+                    producer = resolve_stack(producer_path, name, stacks)
+                    if producer is None:
+                        node.external.add(stack_name(producer_path))
+                        continue
+                    node.inputs[input_key] = (producer, output)
+                    node.dependencies.add(producer)
+        for dependency in config.get('dependencies') or list():
+            producer = resolve_stack(dependency, name, stacks)
+            if producer is None:
+                node.external.add(stack_name(dependency))
+            else:
+                node.dependencies.add(producer)
+    return stacks
+
+
+def resolve_stack(path, consumer, stacks):
+    """
+    Match a stack path from a config to a known stack.  Paths with
+    unrendered jinja match on stack basename, preferring the consumer's
+    own environment.
+    """
+    name = stack_name(path)
+    if name in stacks:
+        return name
+    if JINJA_PLACEHOLDER not in name:
+        return None
+    basename = name.split('/')[-1]
+    candidates = [s for s in stacks if s.split('/')[-1] == basename]
+    environment = consumer.rsplit('/', 1)[0]
+    local = [s for s in candidates if s.rsplit('/', 1)[0] == environment]
+    if len(local) == 1:
+        return local[0]
+    if len(candidates) == 1:
+        return candidates[0]
+    return None
+
+
+def check_declarations(stacks):
+    """
+    Compare stack output references against module declarations: inputs
+    must be VARSPEC keys of the consuming module and outputs must be
+    among the stack_outputs() of the producing module for that stack's
+    user data.
+    """
+    for node in stacks.values():
+        varspec = get_template_class(node.module).VARSPEC if node.module else None
+        for input_key, (producer, output) in sorted(node.inputs.items()):
+            if varspec is not None and input_key not in varspec:
+                node.warnings.append(
+                    "'{}' is not in the VARSPEC of module '{}'".format(
+                        input_key, node.module))
+            producer_module = stacks[producer].module
+            if producer_module:
+                outputs = get_template_class(producer_module).stack_outputs(
+                    stacks[producer].user_data)
+                if outputs and output not in outputs:
+                    node.warnings.append(
+                        "'{}' is not a declared output of module '{}' "
+                        "(stack {})".format(output, producer_module, producer))
+
+
+def topological_order(stacks):
+    """Return stack names in dependency order.  Raise ValueError on cycles."""
+    order = list()
+    state = dict()
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            cycle = path[path.index(name):] + [name]
+            raise ValueError('dependency cycle: {}'.format(' -> '.join(cycle)))
+        state[name] = 'visiting'
+        for dependency in sorted(stacks[name].dependencies):
+            visit(dependency, path + [name])
+        state[name] = 'done'
+        order.append(name)
+    for name in sorted(stacks):
+        visit(name, list())
+    return order
+
+
+def build_graph(stacks):
+    check_declarations(stacks)
+    topological_order(stacks)
+    return stacks
+
+
+def waves(stacks):
+    """Group stacks into waves which can run in parallel."""
+    depth = dict()
+    for name in topological_order(stacks):
+        depth[name] = max([depth[d] + 1 for d in stacks[name].dependencies] or [0])
+    grouped = dict()
+    for name, level in depth.items():
+        grouped.setdefault(level, list()).append(name)
+    return [sorted(grouped[level]) for level in sorted(grouped)]
+
+
+def critical_path(stacks, durations=None):
+    """
+    Return (total, path) for the longest weighted path through the graph.
+    Stacks weigh their duration in seconds, or 1 when not given.
+    """
+    durations = durations or dict()
+    finish = dict()
+    previous = dict()
+    for name in topological_order(stacks):
+        start = 0
+        for dependency in stacks[name].dependencies:
+            if finish[dependency] > start:
+                start = finish[dependency]
+                previous[name] = dependency
+        finish[name] = start + durations.get(name, 1)
+    if not finish:
+        return 0, list()
+    last = max(sorted(finish), key=lambda name: finish[name])
+    path = [last]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    return finish[last], list(reversed(path))
+
+
+#
+# execution
+#
+def sceptre_command(command, name, sceptre_dir, var_files=None):
+    cmd = ['sceptre', '--dir', sceptre_dir]
+    for var_file in var_files or list():
+        cmd += ['--var-file', var_file]
+    return cmd + COMMANDS[command] + [name + '.yaml']
+
+
+def run_stack(cmd):
+    start = time.time()
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+    status = 'ok' if process.returncode == 0 else 'failed'
+    return status, time.time() - start, output.decode('utf-8', 'replace')
+
+
+def run_graph(stacks, command, sceptre_dir, var_files=None, jobs=4,
+        runner=run_stack):
+    """
+    Run sceptre 'command' on every stack, each as soon as its dependencies
+    have succeeded.  Dependents of a failed stack are skipped.  Returns a
+    dict of Results.
+    """
+    remaining = dict((name, set(node.dependencies)) for name, node in stacks.items())
+    dependents = dict((name, set()) for name in stacks)
+    for name, node in stacks.items():
+        for dependency in node.dependencies:
+            dependents[dependency].add(name)
+
+    results = dict()
+    running = dict()
+    def skip(name):
+        for dependent in dependents[name]:
+            if dependent not in results:
+                results[dependent] = Result(dependent, 'skipped', 0, str())
+                remaining.pop(dependent, None)
+                skip(dependent)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while remaining or running:
+            for name in sorted(n for n, deps in remaining.items() if not deps):
+                del remaining[name]
+                cmd = sceptre_command(command, name, sceptre_dir, var_files)
+                running[executor.submit(runner, cmd)] = name
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    status, duration, output = future.result()
+                except Exception as e:
+                    status, duration, output = 'failed', 0, str(e)
+                results[name] = Result(name, status, duration, output)
+                print('[{}] {} {} ({:.1f}s)'.format(command, name, status, duration))
+                if status == 'ok':
+                    for dependent in dependents[name]:
+                        if dependent in remaining:
+                            remaining[dependent].discard(name)
+                else:
+                    print(output.rstrip())
+                    skip(name)
+    return results
+
+
+def print_report(stacks, results=None):
+    """Print the dependency graph, warnings, and critical path."""
+    for name in topological_order(stacks):
+        node = stacks[name]
+        print('{} ({})'.format(name, node.module or 'custom template'))
+        for input_key, (producer, output) in sorted(node.inputs.items()):
+            print('    {} <- {}::{}'.format(input_key, producer, output))
+        for dependency in sorted(node.dependencies - set(
+                producer for producer, output in node.inputs.values())):
+            print('    depends on {}'.format(dependency))
+        for external in sorted(node.external):
+            print('    external: {}'.format(external))
+        for warning in node.warnings:
+            print('    WARNING: {}'.format(warning))
+
+    print('\nParallel waves:')
+    for level, wave in enumerate(waves(stacks), 1):
+        print('  {}: {}'.format(level, ', '.join(wave)))
+
+    if results:
+        durations = dict((name, r.duration) for name, r in results.items())
+        total, path = critical_path(stacks, durations)
+        print('\nCritical path ({:.1f}s): {}'.format(total, ' -> '.join(path)))
+        elapsed = sum(durations.values())
+        print('Sum of stack durations: {:.1f}s'.format(elapsed))
+        failed = [r.stack for r in results.values() if r.status != 'ok']
+        if failed:
+            print('Not completed: {}'.format(', '.join(sorted(failed))))
+    else:
+        total, path = critical_path(stacks)
+        print('\nCritical path ({} stacks): {}'.format(total, ' -> '.join(path)))
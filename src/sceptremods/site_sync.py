@@ -0,0 +1,606 @@
+"""
+Incremental deploys of static websites to CFS3Site origin buckets.
+
+Each sync hashes the local site, compares the hashes with a manifest of
+the last deployed state and uploads only objects whose content or headers
+changed.  The manifest is a json object kept in the origin bucket itself
+(MANIFEST_KEY under the site prefix), so the bucket is never listed.  It is
+also cached locally with its ETag (SITE_CACHE_DIR), and a conditional get
+leaves it at a single round trip that usually transfers nothing.
+
+With 'fingerprint', static assets (FINGERPRINT_PATTERNS) are also
+uploaded under names carrying their content hash, e.g. css/site.3f2a9c01d4e5.css,
+with a year long immutable Cache-Control.  References to them from html
+and css files (src and href attributes, css url()) are rewritten to the
+fingerprinted names.  A changed asset then gets a new name and is never
+invalidated; only the html entry points need short TTLs.  The original
+names are still uploaded for references the rewriting cannot see, such as
+those built in javascript.
+
+With 'precompress', text objects (PRECOMPRESSED_EXTENSIONS) also get
+brotli and gzip compressed variants, e.g. css/site.css.br and
+css/site.css.gz, with Content-Encoding set and the Content-Type and
+Cache-Control of the original.  A CFS3Site stack with Precompressed set
+serves them to viewers accepting the encoding.  Compression runs in a pool
+of worker processes, and only for objects whose content changed since the
+variants recorded in the manifest.  Brotli needs the brotli package.  Once
+variants are deployed, a sync without 'precompress' is refused, as it would
+leave them stale or, with 'delete', remove them.
+
+Uploads run in parallel with Content-Type and Cache-Control set per object.
+Paths changed or deleted are then invalidated in the CloudFront
+distribution with a single invalidation, collapsed into wildcards so it
+never exceeds 'max_paths' paths.
+
+Example:
+    bucket, distribution = stack_site('sceptre-myweb-prod-site')
+    result = sync_site('build/html', bucket, distribution, delete=True)
+    print_result(result)
+"""
+
+import fnmatch
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import time
+import zlib
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+try:
+    from urllib.parse import quote
+except ImportError:
+    from urllib import quote
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from sceptremods.templates.cloudfront_s3_website import (
+    PRECOMPRESSED_ENCODINGS,
+    PRECOMPRESSED_EXTENSIONS,
+)
+
+
+MANIFEST_KEY = '.sceptremods/site-manifest.json'
+SITE_CACHE_DIR = os.path.expanduser(os.environ.get(
+    'SCEPTREMODS_SITE_CACHE', '~/.sceptremods/site-manifests'))
+HASH_BLOCK_SIZE = 1024 * 1024
+MAX_INVALIDATION_PATHS = 10
+DELETE_BATCH_SIZE = 1000
+
+# (pattern, Cache-Control) pairs, first match wins
+DEFAULT_CACHE_CONTROL = [
+    ('*.html', 'public, max-age=0, must-revalidate'),
+    ('*', 'public, max-age=3600'),
+]
+TEXT_TYPES = ['application/javascript', 'application/json', 'image/svg+xml']
+
+FINGERPRINT_PATTERNS = [
+    '*.css', '*.js', '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.webp',
+    '*.woff', '*.woff2', '*.ttf', '*.eot',
+]
+FINGERPRINT_LENGTH = 12
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+HTML_PATTERNS = ['*.html', '*.htm']
+HTML_REFERENCE = re.compile(
+    br'''(\b(?:src|href)\s*=\s*)(["']?)([^"'\s>]+)\2''', re.IGNORECASE)
+CSS_REFERENCE = re.compile(br'''(url\(\s*)(["']?)([^"')\s]+)\2''')
+
+SiteObject = namedtuple('SiteObject', [
+    'key', 'path', 'body', 'sha256', 'content_type', 'cache_control',
+    'content_encoding', 'source_sha256'])
+SyncResult = namedtuple('SyncResult', [
+    'uploaded', 'deleted', 'unchanged', 'invalidation', 'paths', 'duration'])
+
+
+#
+# local site
+#
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def local_files(site_dir):
+    """Return a dict of site relative key to file path for 'site_dir'."""
+    files = dict()
+    for dirpath, dirnames, filenames in os.walk(site_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            path = os.path.join(dirpath, filename)
+            key = os.path.relpath(path, site_dir).replace(os.sep, '/')
+            files[key] = path
+    return files
+
+
+def content_type(key):
+    mime_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+    if mime_type.startswith('text/') or mime_type in TEXT_TYPES:
+        mime_type += '; charset=utf-8'
+    return mime_type
+
+
+def parse_cache_control(rules):
+    """
+    Return (pattern, Cache-Control) pairs from 'PATTERN=VALUE' strings,
+    followed by the defaults.
+    """
+    parsed = []
+    for rule in rules:
+        pattern, sep, value = rule.partition('=')
+        if not sep or not pattern or not value:
+            raise ValueError(
+                "cache control rule '{}' is not PATTERN=VALUE".format(rule))
+        parsed.append((pattern, value))
+    return parsed + DEFAULT_CACHE_CONTROL
+
+
+def cache_control(key, rules=DEFAULT_CACHE_CONTROL):
+    for pattern, value in rules:
+        if fnmatch.fnmatch(key, pattern):
+            return value
+    return None
+
+
+def site_objects(site_dir, rules=DEFAULT_CACHE_CONTROL, jobs=8,
+        fingerprint=False):
+    """
+    Return a dict of key to SiteObject for every file in 'site_dir',
+    hashing files in parallel.  With 'fingerprint', add fingerprinted
+    copies of static assets and rewrite references to them.
+    """
+    files = local_files(site_dir)
+    keys = sorted(files)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes = list(executor.map(file_hash, [files[k] for k in keys]))
+    objects = dict(
+        (key, SiteObject(
+            key=key,
+            path=files[key],
+            body=None,
+            sha256=sha256,
+            content_type=content_type(key),
+            cache_control=cache_control(key, rules),
+            content_encoding=None,
+            source_sha256=None,
+        ))
+        for key, sha256 in zip(keys, hashes)
+    )
+    if fingerprint:
+        objects = fingerprint_site(objects)
+    return objects
+
+
+#
+# fingerprinting
+#
+def matches(key, patterns):
+    return any(fnmatch.fnmatch(key, p) for p in patterns)
+
+
+def fingerprint_key(key, sha256):
+    root, ext = posixpath.splitext(key)
+    return '{}.{}{}'.format(root, sha256[:FINGERPRINT_LENGTH], ext)
+
+
+def reference_key(reference, document_key):
+    """
+    Return (site key, query and fragment) that 'reference' in the object
+    at 'document_key' points to, or (None, None) for external references.
+    """
+    if b':' in reference.split(b'/')[0] or reference.startswith(b'//'):
+        return None, None
+    split = re.search(b'[?#]', reference)
+    position = split.start() if split else len(reference)
+    path, tail = reference[:position], reference[position:]
+    if not path:
+        return None, None
+    path = path.decode('utf-8', 'replace')
+    if path.startswith('/'):
+        key = posixpath.normpath(path.lstrip('/'))
+    else:
+        key = posixpath.normpath(
+            posixpath.join(posixpath.dirname(document_key), path))
+    return key, tail
+
+
+def rewrite_references(body, document_key, renames):
+    """
+    Return 'body' with src/href attributes and css url() references to
+    keys in 'renames' pointing to the renamed keys instead.
+    """
+    def replace(match):
+        prefix, quote_char, reference = match.groups()
+        key, tail = reference_key(reference, document_key)
+        if key not in renames:
+            return match.group(0)
+        path = reference[:len(reference) - len(tail)]
+        new_path = path[:path.rfind(b'/') + 1] + posixpath.basename(
+            renames[key]).encode('utf-8')
+        return prefix + quote_char + new_path + tail + quote_char
+
+    body = CSS_REFERENCE.sub(replace, body)
+    if matches(document_key, HTML_PATTERNS):
+        body = HTML_REFERENCE.sub(replace, body)
+    return body
+
+
+def rewritten(site_object, renames):
+    """Return 'site_object' with references rewritten, if any changed."""
+    if site_object.body is not None:
+        body = site_object.body
+    else:
+        with open(site_object.path, 'rb') as f:
+            body = f.read()
+    new_body = rewrite_references(body, site_object.key, renames)
+    if new_body == body:
+        return site_object
+    return site_object._replace(
+        body=new_body, sha256=hashlib.sha256(new_body).hexdigest())
+
+
+def fingerprint_site(objects, patterns=FINGERPRINT_PATTERNS):
+    """
+    Return 'objects' plus an immutable, fingerprinted copy of each static
+    asset, with references in html and css rewritten to the copies.
+    Css is rewritten before it is fingerprinted, so its hash covers the
+    fingerprints of the assets it references.
+    """
+    objects = dict(objects)
+    assets = sorted(k for k in objects if matches(k, patterns))
+    renames = dict(
+        (key, fingerprint_key(key, objects[key].sha256))
+        for key in assets if not key.endswith('.css')
+    )
+    for key in [k for k in assets if k.endswith('.css')]:
+        objects[key] = rewritten(objects[key], renames)
+        renames[key] = fingerprint_key(key, objects[key].sha256)
+    for key in [k for k in objects if matches(k, HTML_PATTERNS)]:
+        objects[key] = rewritten(objects[key], renames)
+    for key, new_key in renames.items():
+        objects[new_key] = objects[key]._replace(
+            key=new_key, cache_control=IMMUTABLE_CACHE_CONTROL)
+    return objects
+
+
+#
+# precompression
+#
+def compress(data, encoding):
+    """
+    Return 'data' compressed with 'encoding'.  Output depends only on the
+    input (gzip headers carry no timestamp), so unchanged files keep their
+    hashes.
+    """
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    raise ValueError('unknown encoding {}'.format(encoding))
+
+
+def compress_object(path, body, encodings):
+    """Return a list of compressed bodies, one per encoding."""
+    if body is None:
+        with open(path, 'rb') as f:
+            body = f.read()
+    return [compress(body, encoding) for encoding in encodings]
+
+
+def precompress_site(objects, manifest=None, jobs=8,
+        encodings=PRECOMPRESSED_ENCODINGS):
+    """
+    Return 'objects' plus compressed variants of text objects.  Variants
+    in 'manifest' made from the current content are reused rather than
+    compressed again.
+    """
+    if 'br' in dict(encodings) and brotli is None:
+        raise ValueError('precompressing with brotli requires the brotli package')
+    manifest = manifest or dict()
+    patterns = ['*.' + ext for ext in PRECOMPRESSED_EXTENSIONS]
+    variants = dict()
+    pending = []
+    for key in sorted(objects):
+        site_object = objects[key]
+        if not matches(key, patterns):
+            continue
+        for encoding, suffix in encodings:
+            variant = site_object._replace(
+                key=key + suffix,
+                path=None,
+                body=None,
+                content_encoding=encoding,
+                source_sha256=site_object.sha256,
+            )
+            entry = manifest.get(variant.key, dict())
+            if manifest_entry(variant._replace(sha256=entry.get('sha256'))) == entry:
+                variants[variant.key] = variant._replace(sha256=entry['sha256'])
+            else:
+                pending.append((site_object, variant))
+
+    # fingerprinted copies share their original's content
+    sources = list(dict((o.sha256, o) for o, v in pending).values())
+    names = [e for e, suffix in encodings]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        compressed = dict(zip(
+            [s.sha256 for s in sources],
+            executor.map(
+                compress_object,
+                [s.path for s in sources],
+                [s.body for s in sources],
+                [names] * len(sources),
+            ),
+        ))
+    for site_object, variant in pending:
+        body = compressed[site_object.sha256][names.index(variant.content_encoding)]
+        variants[variant.key] = variant._replace(
+            body=body, sha256=hashlib.sha256(body).hexdigest())
+
+    objects = dict(objects)
+    objects.update(variants)
+    return objects
+
+
+def manifest_entry(site_object):
+    entry = dict(
+        sha256=site_object.sha256,
+        content_type=site_object.content_type,
+        cache_control=site_object.cache_control,
+    )
+    if site_object.content_encoding:
+        entry['content_encoding'] = site_object.content_encoding
+        entry['source_sha256'] = site_object.source_sha256
+    return entry
+
+
+def plan_sync(objects, manifest, delete=False):
+    """
+    Return (keys to upload, keys to delete) bringing the deployed state
+    described by 'manifest' to 'objects'.
+    """
+    upload = sorted(
+        key for key, obj in objects.items()
+        if manifest.get(key) != manifest_entry(obj)
+    )
+    remove = sorted(set(manifest) - set(objects)) if delete else []
+    return upload, remove
+
+
+#
+# invalidation
+#
+def path_parent(path):
+    """Return the directory prefix of an invalidation path, e.g. '/a/' of '/a/b/*'."""
+    stripped = path[:-1] if path.endswith('/*') else path
+    return stripped[:stripped.rstrip('/').rfind('/') + 1] or '/'
+
+
+def invalidation_paths(keys, root_object=None, max_paths=MAX_INVALIDATION_PATHS):
+    """
+    Return at most 'max_paths' CloudFront invalidation paths covering the
+    site relative 'keys'.  Directories holding the most paths are replaced
+    by a wildcard first, deepest directories on ties.
+    """
+    paths = set('/' + quote(key, safe='/') for key in keys)
+    if root_object and root_object in keys:
+        paths.add('/')
+    while len(paths) > max(max_paths, 1):
+        counts = Counter(path_parent(p) for p in paths if p != '/*')
+        directory = max(counts, key=lambda d: (counts[d] > 1, counts[d], len(d)))
+        wildcard = directory + '*'
+        paths = set(
+            p for p in paths if not (p.startswith(directory) and p != wildcard)
+        )
+        paths.add(wildcard)
+        if wildcard == '/*':
+            return ['/*']
+    return sorted(paths)
+
+
+#
+# remote state
+#
+def manifest_cache_file(bucket, prefix):
+    name = '{}-{}.json'.format(bucket, prefix.strip('/').replace('/', '-') or 'root')
+    return os.path.join(SITE_CACHE_DIR, name)
+
+
+def manifest_key(prefix):
+    return '/'.join(p for p in [prefix.strip('/'), MANIFEST_KEY] if p)
+
+
+def object_key(prefix, key):
+    return '/'.join(p for p in [prefix.strip('/'), key] if p)
+
+
+def load_manifest(s3, bucket, prefix=''):
+    """
+    Return the deployed manifest of the site at 'prefix' in 'bucket',
+    from the local cache when its ETag is still current.
+    """
+    cache_file = manifest_cache_file(bucket, prefix)
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (IOError, OSError, ValueError):
+        cached = dict()
+    kwargs = dict(Bucket=bucket, Key=manifest_key(prefix))
+    if cached.get('etag'):
+        kwargs['IfNoneMatch'] = cached['etag']
+    try:
+        response = s3.get_object(**kwargs)
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        if code in ('304', 'NotModified'):
+            return cached['manifest']
+        if code in ('NoSuchKey', '404'):
+            return dict()
+        raise
+    manifest = json.loads(response['Body'].read().decode('utf-8'))
+    save_manifest_cache(bucket, prefix, response['ETag'], manifest)
+    return manifest
+
+
+def save_manifest(s3, bucket, prefix, manifest):
+    response = s3.put_object(
+        Bucket=bucket,
+        Key=manifest_key(prefix),
+        Body=json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'),
+        ContentType='application/json',
+        CacheControl='no-store',
+    )
+    save_manifest_cache(bucket, prefix, response['ETag'], manifest)
+
+
+def save_manifest_cache(bucket, prefix, etag, manifest):
+    cache_file = manifest_cache_file(bucket, prefix)
+    try:
+        if not os.path.isdir(SITE_CACHE_DIR):
+            os.makedirs(SITE_CACHE_DIR)
+        tmp_file = '{}.{}'.format(cache_file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(dict(etag=etag, manifest=manifest), f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError):
+        pass
+
+
+def upload_object(s3, bucket, prefix, site_object):
+    extra_args = dict(
+        ContentType=site_object.content_type,
+        Metadata=dict(sha256=site_object.sha256),
+    )
+    if site_object.cache_control:
+        extra_args['CacheControl'] = site_object.cache_control
+    if site_object.content_encoding:
+        extra_args['ContentEncoding'] = site_object.content_encoding
+    key = object_key(prefix, site_object.key)
+    if site_object.body is not None:
+        s3.put_object(Bucket=bucket, Key=key, Body=site_object.body, **extra_args)
+    else:
+        s3.upload_file(site_object.path, bucket, key, ExtraArgs=extra_args)
+    return site_object.key
+
+
+def delete_objects(s3, bucket, prefix, keys):
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        s3.delete_objects(Bucket=bucket, Delete=dict(
+            Objects=[dict(Key=object_key(prefix, k))
+                     for k in keys[start:start + DELETE_BATCH_SIZE]],
+            Quiet=True,
+        ))
+
+
+def stack_site(stack_name, cfn=None):
+    """
+    Return (OriginBucket, DistributionId) outputs of a CFS3Site stack.
+    DistributionId is None for stacks built before it was an output.
+    """
+    cfn = cfn or boto3.client('cloudformation')
+    stack = cfn.describe_stacks(StackName=stack_name)['Stacks'][0]
+    outputs = dict(
+        (o['OutputKey'], o['OutputValue']) for o in stack.get('Outputs', []))
+    if 'OriginBucket' not in outputs:
+        raise ValueError('stack {} has no OriginBucket output'.format(stack_name))
+    return outputs['OriginBucket'], outputs.get('DistributionId')
+
+
+def default_root_object(cloudfront, distribution):
+    config = cloudfront.get_distribution_config(Id=distribution)
+    return config['DistributionConfig'].get('DefaultRootObject') or None
+
+
+#
+# sync
+#
+def sync_site(site_dir, bucket, distribution=None, prefix='', delete=False,
+        dry_run=False, jobs=8, rules=DEFAULT_CACHE_CONTROL,
+        max_paths=MAX_INVALIDATION_PATHS, fingerprint=False,
+        precompress=False, s3=None, cloudfront=None):
+    """
+    Deploy 'site_dir' to 'bucket' under 'prefix', uploading changed objects
+    'jobs' at a time, and invalidate what changed in 'distribution'.
+    With 'dry_run' only report what would be done.  Return a SyncResult.
+    """
+    start = time.time()
+    s3 = s3 or boto3.client('s3')
+    objects = site_objects(site_dir, rules, jobs, fingerprint)
+    manifest = load_manifest(s3, bucket, prefix)
+    if precompress:
+        objects = precompress_site(objects, manifest, jobs)
+    elif [e for e in manifest.values() if e.get('content_encoding')]:
+        raise ValueError(
+            'bucket {} holds precompressed variants, which a sync without '
+            'precompress would leave stale or delete'.format(bucket))
+    upload, remove = plan_sync(objects, manifest, delete)
+    changed = [k for k in upload if k in manifest] + remove
+
+    root_object = None
+    if distribution and changed:
+        cloudfront = cloudfront or boto3.client('cloudfront')
+        root_object = default_root_object(cloudfront, distribution)
+    paths = invalidation_paths(changed, root_object, max_paths) if changed else []
+
+    invalidation = None
+    if not dry_run:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(
+                lambda key: upload_object(s3, bucket, prefix, objects[key]),
+                upload))
+        delete_objects(s3, bucket, prefix, remove)
+        if upload or remove:
+            entries = dict(
+                (key, manifest_entry(obj)) for key, obj in objects.items())
+            if not delete:
+                # objects left in the bucket stay listed, so that a later
+                # sync with 'delete' still removes them
+                for key in set(manifest) - set(objects):
+                    entries[key] = manifest[key]
+            save_manifest(s3, bucket, prefix, entries)
+        if distribution and paths:
+            response = cloudfront.create_invalidation(
+                DistributionId=distribution,
+                InvalidationBatch=dict(
+                    Paths=dict(Quantity=len(paths), Items=paths),
+                    CallerReference='sceptremods-{}'.format(time.time()),
+                ),
+            )
+            invalidation = response['Invalidation']['Id']
+
+    return SyncResult(
+        uploaded=upload,
+        deleted=remove,
+        unchanged=len(objects) - len(upload),
+        invalidation=invalidation,
+        paths=paths,
+        duration=time.time() - start,
+    )
+
+
+def print_result(result, dry_run=False):
+    verb = 'would ' if dry_run else ''
+    for key in result.uploaded:
+        print('{}upload {}'.format(verb, key))
+    for key in result.deleted:
+        print('{}delete {}'.format(verb, key))
+    print('{} uploaded, {} deleted, {} unchanged in {:.1f}s'.format(
+        len(result.uploaded), len(result.deleted), result.unchanged,
+        result.duration))
+    if result.paths:
+        print('{}invalidate {}{}'.format(
+            verb,
+            ' '.join(result.paths),
+            ' ({})'.format(result.invalidation) if result.invalidation else ''))
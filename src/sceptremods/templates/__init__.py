@@ -4,16 +4,17 @@ sceptremods.templates.VarSpec
 sceptremods.templates.BaseTemplate
 """
 
-import os
 import os
 import sys
 import types
 import abc
-from inspect import getmodule, getmodulename, getdoc
+import importlib
+from inspect import getmodule, getmodulename, getdoc, getmembers, isclass
 import textwrap
 
 from troposphere import Template
 import sceptremods
+from sceptremods.util import lookups
 
 
 class VarSpec(object):
@@ -70,7 +71,8 @@ class VarSpec(object):
                     "Value of '{}' is undefined and no default is "
                     "specified".format(self.name, self.type)
                 )
-            if not isinstance(self.default, self.type):
+            if not isinstance(self.default, tuple(self.type)
+                    if isinstance(self.type, list) else self.type):
                 raise RuntimeError(
                     "Invalid VARSPEC entry '{}'. Value of 'default' "
                     "must be of type {}".format(self.name, self.type)
@@ -79,15 +81,34 @@ class VarSpec(object):
 
 
 
+def is_plain(value):
+    """
+    True if 'value' holds only plain yaml data, i.e. no unresolved sceptre
+    resolver values.
+    """
+    if isinstance(value, dict):
+        return all(is_plain(k) and is_plain(v) for k, v in value.items())
+    if isinstance(value, list):
+        return all(is_plain(item) for item in value)
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+
 class BaseTemplate(object):
     """Base class for building sceptremods troposphere templates"""
 
     __metaclass__ = abc.ABCMeta
     VARSPEC = {}
+    # names of stack outputs which other stacks may consume
+    OUTPUTS = []
+    # external facts needed at render time.  Maps fact name to a function
+    # taking the validated user_data.  See sceptremods.util.lookups.
+    LOOKUPS = {}
 
     def __init__(self, user_data=dict()):
         self.template = Template()
         self.user_data = user_data
+        self.facts = None
         self.var_spec = [VarSpec(var_name, **attributes)
                 for var_name, attributes in self.VARSPEC.items()]
         self.template.add_version('2010-09-09')
@@ -101,6 +122,23 @@ class BaseTemplate(object):
             spec.validate(self.user_data)
         return self.user_data
 
+    def prefetch(self):
+        """
+        Resolve all LOOKUPS concurrently and store them in self.facts, so
+        that create_template() makes no AWS calls of its own.
+        """
+        self.facts = lookups.resolve(self.LOOKUPS, self.validate_user_data())
+        return self.facts
+
+    @classmethod
+    def stack_outputs(cls, user_data):
+        """
+        Return the names of the outputs of a stack built from 'user_data',
+        or None if they cannot be known before rendering.  Modules whose
+        outputs depend on user data override this.
+        """
+        return cls.OUTPUTS
+
     def version(self):
         return sceptremods.__version__
 
@@ -119,3 +157,73 @@ class BaseTemplate(object):
         for spec in self.var_spec:
             spec.describe()
 
+
+# sceptre_user_data key naming the module a generic wrapper renders
+MODULE_KEY = 'SceptremodsModule'
+
+# per process caches of template classes and sceptre_handler functions,
+# keyed by module name
+_template_classes = {}
+_handlers = {}
+
+
+def get_template_class(module_name):
+    """
+    Return the BaseTemplate subclass defined in sceptremods template
+    module 'module_name'.
+    """
+    if module_name in _template_classes:
+        return _template_classes[module_name]
+    module = importlib.import_module('sceptremods.templates.' + module_name)
+    template_classes = [cls for name, cls in getmembers(module, isclass)
+            if issubclass(cls, BaseTemplate) and cls is not BaseTemplate
+            and cls.__module__ == module.__name__]
+    if len(template_classes) != 1:
+        raise RuntimeError(
+            "Module '{}' must define one and only one subclass of "
+            "BaseTemplate".format(module_name)
+        )
+    _template_classes[module_name] = template_classes[0]
+    return template_classes[0]
+
+
+def get_handler(module_name):
+    """
+    Return the sceptre_handler function of sceptremods template module
+    'module_name', which must be listed in sceptremods.MODULES.
+    """
+    if module_name not in _handlers:
+        if module_name not in sceptremods.MODULES:
+            raise ValueError(
+                "'{}' is not a sceptremods template module".format(module_name))
+        module = sys.modules[get_template_class(module_name).__module__]
+        _handlers[module_name] = module.sceptre_handler
+    return _handlers[module_name]
+
+
+def wrapper_module(template_path):
+    """
+    Return the module named by a wrapper file name, e.g. 'vpc' for
+    'templates/vpc_wrapper.py', or None.
+    """
+    name, ext = os.path.splitext(os.path.basename(template_path or str()))
+    if ext in ('.py', '.pyc') and name.endswith('_wrapper'):
+        module = name[:-len('_wrapper')]
+        if module in sceptremods.MODULES:
+            return module
+    return None
+
+
+def dispatch(sceptre_user_data, template_path=None):
+    """
+    Render the template of the module named by sceptre_user_data key
+    MODULE_KEY, or failing that by the file name of 'template_path'.
+    The key is removed from the user data the module sees.
+    """
+    user_data = dict(sceptre_user_data or dict())
+    module_name = user_data.pop(MODULE_KEY, None) or wrapper_module(template_path)
+    if not module_name:
+        raise ValueError(
+            "sceptre_user_data must set '{}' to one of {}".format(
+                MODULE_KEY, ', '.join(sceptremods.MODULES)))
+    return get_handler(module_name)(user_data)
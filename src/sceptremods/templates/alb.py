@@ -1,4 +1,8 @@
-
+"""
+Generates an internet facing application load balancer, with optional
+access log bucket.  With a log bucket, the LogLocationTemplate output is
+as described for the alb_log_bucket module.
+"""
 import sys
 import itertools
 
@@ -21,6 +25,38 @@ from troposphere import (
 import troposphere.elasticloadbalancingv2 as elb
 
 from sceptremods.templates import BaseTemplate
+from sceptremods.util.elb import (
+    elb_account_id_mapping,
+    log_lifecycle_configuration,
+    log_location_template,
+    log_policy_resource,
+    validate_log_prefix,
+    validate_log_retention,
+    validate_log_transitions,
+)
+
+
+LOAD_BALANCING_ALGORITHMS = ["round_robin", "least_outstanding_requests"]
+
+
+#
+# Validators
+#
+def range_validator(name, minimum, maximum):
+    def validate(value):
+        if not minimum <= value <= maximum:
+            raise ValueError("'{}' must be between {} and {}".format(
+                name, minimum, maximum))
+    return validate
+
+def validate_slow_start(value):
+    if value != 0 and not 30 <= value <= 900:
+        raise ValueError("'SlowStart' must be 0 or between 30 and 900")
+
+def validate_load_balancing_algorithm(value):
+    if value not in LOAD_BALANCING_ALGORITHMS:
+        raise ValueError("'LoadBalancingAlgorithm' must be one of {}".format(
+            LOAD_BALANCING_ALGORITHMS))
 
 
 #
@@ -28,6 +64,15 @@ from sceptremods.templates import BaseTemplate
 #
 class ALB(BaseTemplate):
 
+    OUTPUTS = [
+        "LoadBalancerArn",
+        "LoadBalancerUrl",
+        "DefaultListener",
+        "HttpsListener",
+        "LogBucket",
+        "LogLocationTemplate",
+    ]
+
     VARSPEC = {
         "VpcId": {
             "type": str,
@@ -59,16 +104,96 @@ class ALB(BaseTemplate):
             "type": str,
             "default": str(),
             "description": "A prefix for the all log object keys",
+            "validator": validate_log_prefix,
+        },
+        "LogRetentionDays": {
+            "type": int,
+            "default": 0,
+            "description": "Number of days after which access log objects expire.  0 keeps them forever.",
+            "validator": validate_log_retention,
+        },
+        "LogTransitions": {
+            "type": list,
+            "default": list(),
+            "description": "A list of dicts with keys Days and StorageClass to move access log objects to cheaper storage classes, e.g. [{Days: 30, StorageClass: STANDARD_IA}, {Days: 90, StorageClass: GLACIER}]",
+            "validator": validate_log_transitions,
+        },
+
+        # listeners
+        "Certificates": {
+            "type": list,
+            "default": list(),
+            "description": "A list of ACM certificate ARNs.  When given, an HTTPS listener on port 443 is created.  The first certificate is the default.",
+        },
+        "SslPolicy": {
+            "type": str,
+            "default": "ELBSecurityPolicy-TLS-1-2-2017-01",
+            "description": "The security policy of the HTTPS listener.",
+        },
+        "RedirectHttp": {
+            "type": bool,
+            "default": False,
+            "description": "Whether the port 80 listener redirects to HTTPS instead of forwarding to the default target group.  Requires Certificates.  Attach service listener rules to the HttpsListener output instead of DefaultListener.",
+        },
+        "Http2": {
+            "type": bool,
+            "default": True,
+            "description": "Whether HTTP/2 is enabled on the load balancer.",
+        },
+        "IdleTimeout": {
+            "type": int,
+            "default": 60,
+            "description": "Seconds a client or target connection may be idle before the load balancer closes it.",
+            "validator": range_validator("IdleTimeout", 1, 4000),
         },
-    }
 
-    ELB_ACCOUNT_ID = {
-        "us-east-1": {"ELBAccountId": "127311923021"},
-        "us-east-2": {"ELBAccountId": "033677994240"},
-        "us-west-1": {"ELBAccountId": "027434742980"},
-        "us-west-2": {"ELBAccountId": "797873946194"},
+        # default target group
+        "DeregistrationDelay": {
+            "type": int,
+            "default": 300,
+            "description": "Seconds to wait for in flight requests before deregistering a target.",
+            "validator": range_validator("DeregistrationDelay", 0, 3600),
+        },
+        "SlowStart": {
+            "type": int,
+            "default": 0,
+            "description": "Seconds over which a new target ramps up to its full share of requests.  0 disables slow start.",
+            "validator": validate_slow_start,
+        },
+        "Stickiness": {
+            "type": bool,
+            "default": False,
+            "description": "Whether load balancer generated cookie stickiness is enabled.",
+        },
+        "StickinessDuration": {
+            "type": int,
+            "default": 86400,
+            "description": "Seconds for which requests of a client stick to the same target.",
+            "validator": range_validator("StickinessDuration", 1, 604800),
+        },
+        "LoadBalancingAlgorithm": {
+            "type": str,
+            "default": "round_robin",
+            "description": "How requests are routed to targets.  One of {}.".format(
+                LOAD_BALANCING_ALGORITHMS),
+            "validator": validate_load_balancing_algorithm,
+        },
     }
 
+    ELB_ACCOUNT_ID = elb_account_id_mapping()
+
+
+    @classmethod
+    def stack_outputs(cls, user_data):
+        """HttpsListener needs Certificates, and the log outputs LogBucket."""
+        user_data = user_data or dict()
+        skipped = list()
+        if not user_data.get("Certificates"):
+            skipped.append("HttpsListener")
+        if not user_data.get("LogBucket"):
+            skipped.extend(["LogBucket", "LogLocationTemplate"])
+        return [o for o in cls.OUTPUTS if o not in skipped]
+
 
     def create_log_bucket(self):
         """Create S3 bucket with bucket policy for ALB logs"""
@@ -78,6 +203,11 @@ class ALB(BaseTemplate):
             "LogBucket",
             DeletionPolicy="Retain",
             BucketName=self.vars["LogBucket"],
+            LifecycleConfiguration=log_lifecycle_configuration(
+                self.vars["LogPrefix"],
+                self.vars["LogRetentionDays"],
+                self.vars["LogTransitions"],
+            ),
         ))
         t.add_resource(s3.BucketPolicy(
             "LogBucketPolicy",
@@ -92,13 +222,8 @@ class ALB(BaseTemplate):
                             "ELBAccountId",
                         )]
                     },
-                    "Resource": Join("/", [
-                        Join("", ["arn:aws:s3:::", Ref(log_bucket)]),
-                        self.vars["LogPrefix"],
-                        "AWSLogs",
-                        AccountId,
-                        "*"
-                    ]),
+                    "Resource": log_policy_resource(
+                        log_bucket, self.vars["LogPrefix"]),
                     "Effect": "Allow",
                 }]
             }
@@ -108,29 +233,74 @@ class ALB(BaseTemplate):
             Description="Cloudfront S3 website log bucket",
             Value=Ref(log_bucket),
         ))
+        t.add_output(Output(
+            "LogLocationTemplate",
+            Description="Access log S3 location template for Athena partition projection",
+            Value=log_location_template(log_bucket, self.vars["LogPrefix"]),
+        ))
         return log_bucket
 
 
+    def load_balancer_attributes(self):
+        attributes = dict([
+            ("routing.http2.enabled", self.vars["Http2"]),
+            ("idle_timeout.timeout_seconds", self.vars["IdleTimeout"]),
+        ])
+        if self.vars["LogBucket"]:
+            attributes.update([
+                ("access_logs.s3.enabled", True),
+                ("access_logs.s3.bucket", self.vars["LogBucket"]),
+                ("access_logs.s3.prefix", self.vars["LogPrefix"]),
+            ])
+        return attributes
+
+
+    def target_group_attributes(self):
+        attributes = dict([
+            ("deregistration_delay.timeout_seconds", self.vars["DeregistrationDelay"]),
+            ("slow_start.duration_seconds", self.vars["SlowStart"]),
+            ("load_balancing.algorithm.type", self.vars["LoadBalancingAlgorithm"]),
+            ("stickiness.enabled", self.vars["Stickiness"]),
+        ])
+        if self.vars["Stickiness"]:
+            attributes.update([
+                ("stickiness.type", "lb_cookie"),
+                ("stickiness.lb_cookie.duration_seconds",
+                    self.vars["StickinessDuration"]),
+            ])
+        return attributes
+
+
+    def attribute_list(self, attribute_class, attributes):
+        """Render a dict of attributes as a list of troposphere Key/Values"""
+        def as_text(value):
+            if isinstance(value, bool):
+                return str(value).lower()
+            return str(value)
+        return [attribute_class(Key=key, Value=as_text(value))
+                for key, value in sorted(attributes.items())]
+
+
+    def check_vars(self):
+        if self.vars["RedirectHttp"] and not self.vars["Certificates"]:
+            raise ValueError("'RedirectHttp' requires 'Certificates'")
+        if (self.vars["SlowStart"] and self.vars["LoadBalancingAlgorithm"]
+                == "least_outstanding_requests"):
+            raise ValueError(
+                "'SlowStart' is not supported with the "
+                "least_outstanding_requests algorithm"
+            )
+
+
     def create_template(self):
         self.vars = self.validate_user_data()
+        self.check_vars()
         t = self.template
 
         if self.vars["LogBucket"]:
             self.log_bucket = self.create_log_bucket()
-            lb_attrubutes = [
-                elb.LoadBalancerAttributes(
-                    Key="access_logs.s3.enabled", Value="true"
-                ),
-                elb.LoadBalancerAttributes(
-                    Key="access_logs.s3.bucket", Value=self.vars["LogBucket"]
-                ),
-                elb.LoadBalancerAttributes(
-                    Key="access_logs.s3.prefix", Value=self.vars["LogPrefix"]
-                ),
-            ]
         else:
             self.log_bucket = NoValue
-            lb_attrubutes = NoValue
 
         alb = t.add_resource(elb.LoadBalancer(
             "ApplicationLoadBalancer",
@@ -139,7 +309,10 @@ class ALB(BaseTemplate):
             Scheme="internet-facing",
             SecurityGroups=[self.vars["PublicSecurityGroup"]],
             Subnets=[subnet.strip() for subnet in self.vars["PublicSubnets"].split(",")],
-            LoadBalancerAttributes=lb_attrubutes,
+            LoadBalancerAttributes=self.attribute_list(
+                elb.LoadBalancerAttributes,
+                self.load_balancer_attributes(),
+            ),
         ))
     
         default_target_group = t.add_resource(elb.TargetGroup(
@@ -147,19 +320,60 @@ class ALB(BaseTemplate):
             Port="80",
             Protocol="HTTP",
             VpcId=self.vars["VpcId"],
+            TargetGroupAttributes=self.attribute_list(
+                elb.TargetGroupAttribute,
+                self.target_group_attributes(),
+            ),
         ))
-    
+        forward = elb.Action(
+            Type="forward",
+            TargetGroupArn=Ref(default_target_group)
+        )
+
+        if self.vars["RedirectHttp"]:
+            http_action = elb.Action(
+                Type="redirect",
+                RedirectConfig=elb.RedirectConfig(
+                    Protocol="HTTPS",
+                    Port="443",
+                    StatusCode="HTTP_301",
+                ),
+            )
+        else:
+            http_action = forward
         default_listener = t.add_resource(elb.Listener(
             "DefaultListener",
             Port="80",
             Protocol="HTTP",
             LoadBalancerArn=Ref(alb),
-            DefaultActions=[elb.Action(
-                Type="forward",
-                TargetGroupArn=Ref(default_target_group)
-            )],
+            DefaultActions=[http_action],
         ))
 
+        if self.vars["Certificates"]:
+            https_listener = t.add_resource(elb.Listener(
+                "HttpsListener",
+                Port="443",
+                Protocol="HTTPS",
+                SslPolicy=self.vars["SslPolicy"],
+                LoadBalancerArn=Ref(alb),
+                Certificates=[elb.Certificate(
+                    CertificateArn=self.vars["Certificates"][0],
+                )],
+                DefaultActions=[forward],
+            ))
+            if len(self.vars["Certificates"]) > 1:
+                t.add_resource(elb.ListenerCertificate(
+                    "HttpsListenerCertificates",
+                    ListenerArn=Ref(https_listener),
+                    Certificates=[elb.Certificate(CertificateArn=arn)
+                            for arn in self.vars["Certificates"][1:]],
+                ))
+            t.add_output(Output(
+                "HttpsListener",
+                Description="A reference to a port 443 listener",
+                Value=Ref(https_listener),
+            ))
+
         t.add_output(Output(
             "LoadBalancerArn",
             Description="A reference to the Application Load Balancer",
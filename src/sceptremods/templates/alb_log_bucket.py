@@ -1,3 +1,14 @@
+"""
+Generates an S3 bucket for application load balancer access logs.
+
+ELB writes access logs to keys of the form
+  <prefix>/AWSLogs/<account>/elasticloadbalancing/<region>/yyyy/mm/dd/<file>
+which are already partitioned by date.  The LogLocationTemplate output
+gives this location with '${day}' for the date, for use as Athena
+'storage.location.template' with a date typed 'day' projection of format
+yyyy/MM/dd.  Queries filtering on day then scan only matching prefixes.
+"""
+
 import sys
 from troposphere import (
     s3,
@@ -9,6 +20,15 @@ from troposphere import (
     Ref,
 )
 from sceptremods.templates import BaseTemplate
+from sceptremods.util.elb import (
+    elb_account_id_mapping,
+    log_lifecycle_configuration,
+    log_location_template,
+    log_policy_resource,
+    validate_log_prefix,
+    validate_log_retention,
+    validate_log_transitions,
+)
 
 
 #
@@ -16,6 +36,8 @@ from sceptremods.templates import BaseTemplate
 #
 class ALB_LOG_BUCKET(BaseTemplate):
 
+    OUTPUTS = ["LogBucket", "LogLocationTemplate"]
+
     VARSPEC = {
         "BucketName": {
             "type": str,
@@ -28,23 +50,28 @@ class ALB_LOG_BUCKET(BaseTemplate):
             #"default": str(),
             "default": "testing123",
             "description": "Prefix to use for ALB logging to bucket.",
+            "validator": validate_log_prefix,
+        },
+        "LogRetentionDays": {
+            "type": int,
+            "default": 0,
+            "description": "Number of days after which access log objects expire.  0 keeps them forever.",
+            "validator": validate_log_retention,
+        },
+        "LogTransitions": {
+            "type": list,
+            "default": list(),
+            "description": "A list of dicts with keys Days and StorageClass to move access log objects to cheaper storage classes, e.g. [{Days: 30, StorageClass: STANDARD_IA}, {Days: 90, StorageClass: GLACIER}]",
+            "validator": validate_log_transitions,
         },
     }
 
-    ELB_ACCOUNT_ID = {
-        "us-east-1": {"ELBAccountId": "127311923021"},
-        "us-east-2": {"ELBAccountId": "033677994240"},
-        "us-west-1": {"ELBAccountId": "027434742980"},
-        "us-west-2": {"ELBAccountId": "797873946194"},
-    }
+    ELB_ACCOUNT_ID = elb_account_id_mapping()
 
 
     def munge_policy_resourse(self):
         """Assemble a bucket policy statement resource arn per ELB requirements"""
-        bucket_arn = Join("", ["arn:aws:s3:::", Ref(self.log_bucket)])
-        return Join("/", [
-            bucket_arn, self.vars['BucketPrefix'], "AWSLogs", AccountId, "*"
-        ]) 
+        return log_policy_resource(self.log_bucket, self.vars['BucketPrefix'])
 
 
     def create_template(self):
@@ -57,6 +84,11 @@ class ALB_LOG_BUCKET(BaseTemplate):
             "LogBucket",
             DeletionPolicy="Retain",
             BucketName=self.vars["BucketName"],
+            LifecycleConfiguration=log_lifecycle_configuration(
+                self.vars["BucketPrefix"],
+                self.vars["LogRetentionDays"],
+                self.vars["LogTransitions"],
+            ),
         ))
 
         t.add_resource(s3.BucketPolicy(
@@ -83,6 +115,11 @@ class ALB_LOG_BUCKET(BaseTemplate):
             Description="Cloudfront S3 website log bucket",
             Value=Ref(self.log_bucket),
         ))
+        t.add_output(Output(
+            "LogLocationTemplate",
+            Description="Access log S3 location template for Athena partition projection",
+            Value=log_location_template(self.log_bucket, self.vars["BucketPrefix"]),
+        ))
 
 
 #
@@ -0,0 +1,424 @@
+"""Generates a cloudformation template to build an Aurora DB cluster within
+an existing Virtual Private Cloud (VPC).
+
+The cluster has one writer instance and 'Readers' reader instances spread
+across AvailabilityZones.  Clients reach the writer at ClusterEndPoint and
+the load balanced readers at ReaderEndPoint.
+
+ServerlessV2Scaling runs the instances as Aurora Serverless v2 (instance
+class db.serverless) scaling between MinCapacity and MaxCapacity ACUs.
+
+ReplicaAutoScaling adds and removes Aurora replicas beyond 'Readers' with
+Application Auto Scaling, tracking reader cpu and/or connections:
+
+ReplicaAutoScaling:
+  MinCapacity: 1
+  MaxCapacity: 8
+  CpuTarget: 60               # percent average reader cpu utilization
+  ConnectionsTarget: 500      # average connections per reader
+  ScaleInCooldown: 300        # seconds
+  ScaleOutCooldown: 60
+"""
+
+import sys
+
+from troposphere import (
+    AccountId,
+    GetAtt,
+    Join,
+    NoValue,
+    Output,
+    Ref,
+    applicationautoscaling,
+    rds,
+)
+
+from sceptremods.templates import BaseTemplate
+from sceptremods.util.rds import (
+    DBCluster,
+    ServerlessV2ScalingConfiguration,
+    add_db_proxy,
+    add_monitoring_role,
+    parameter_group_family,
+    validate_monitoring_interval,
+    validate_performance_insights_retention,
+)
+
+
+#
+# Globals
+#
+AURORA_ENGINES = ['aurora-postgresql', 'aurora-mysql']
+SERVERLESS_INSTANCE_CLASS = 'db.serverless'
+REPLICA_AUTOSCALING_KEYS = [
+    'MinCapacity',
+    'MaxCapacity',
+    'CpuTarget',
+    'ConnectionsTarget',
+    'ScaleInCooldown',
+    'ScaleOutCooldown',
+]
+# target tracking settings and the predefined metric they track
+REPLICA_METRICS = [
+    ('CpuTarget', 'Cpu', 'RDSReaderAverageCPUUtilization'),
+    ('ConnectionsTarget', 'Connections', 'RDSReaderAverageDatabaseConnections'),
+]
+
+
+#
+# sceptre_user_data validation functions
+#
+def validate_engine(value):
+    if value not in AURORA_ENGINES:
+        raise ValueError("'Engine' must be one of {}".format(AURORA_ENGINES))
+
+def validate_readers(value):
+    if not 0 <= value <= 15:
+        raise ValueError("'Readers' must be between 0 and 15")
+
+def validate_serverless_v2_scaling(scaling):
+    if not scaling:
+        return
+    if sorted(scaling) != ['MaxCapacity', 'MinCapacity']:
+        raise ValueError(
+            "'ServerlessV2Scaling' requires keys 'MinCapacity' and 'MaxCapacity'")
+    for key in ['MinCapacity', 'MaxCapacity']:
+        value = scaling[key]
+        if (isinstance(value, bool) or not isinstance(value, (int, float))
+                or not 0.5 <= value <= 128 or value * 2 != int(value * 2)):
+            raise ValueError(
+                "ServerlessV2Scaling '{}' must be between 0.5 and 128 in "
+                "steps of 0.5".format(key)
+            )
+    if scaling['MinCapacity'] > scaling['MaxCapacity']:
+        raise ValueError("ServerlessV2Scaling 'MinCapacity' exceeds 'MaxCapacity'")
+
+def validate_replica_autoscaling(autoscaling):
+    if not autoscaling:
+        return
+    for key in autoscaling:
+        if key not in REPLICA_AUTOSCALING_KEYS:
+            raise ValueError(
+                "Invalid ReplicaAutoScaling key '{}'.  Must be one of {}".format(
+                    key, REPLICA_AUTOSCALING_KEYS)
+            )
+    for key in ['MinCapacity', 'MaxCapacity']:
+        if not isinstance(autoscaling.get(key), int) or not 0 <= autoscaling[key] <= 15:
+            raise ValueError(
+                "ReplicaAutoScaling requires '{}' between 0 and 15".format(key))
+    if autoscaling['MinCapacity'] > autoscaling['MaxCapacity']:
+        raise ValueError("ReplicaAutoScaling 'MinCapacity' exceeds 'MaxCapacity'")
+    targets = [key for key, _, _ in REPLICA_METRICS if key in autoscaling]
+    if not targets:
+        raise ValueError(
+            "ReplicaAutoScaling requires 'CpuTarget' and/or 'ConnectionsTarget'")
+    for key in targets + ['ScaleInCooldown', 'ScaleOutCooldown']:
+        value = autoscaling.get(key, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(
+                "ReplicaAutoScaling '{}' must be a positive number".format(key))
+
+
+#
+# The template class
+#
+class Aurora(BaseTemplate):
+    """Aurora cluster sceptremods template class."""
+
+    OUTPUTS = ['ClusterEndPoint', 'ReaderEndPoint', 'DBPort', 'ProxyEndPoint']
+
+    VARSPEC = {
+        # default values are just placeholders when testing troposphere syntax.
+        "Subnets": {
+            'type': str,
+            'default': 'TESTSUBNET1,TESTSUBNET2',
+            'description': 'A comma sepatrated list of VPC private subnet IDs to use for this Aurora cluster',
+        },
+        "SecurityGroups": {
+            'type': list,
+            'default': ['TESTDBSG1', 'TESTDBSG2'],
+            'description': 'A list of EC2 SecurityGroups in which to place this Aurora cluster',
+        },
+        "DBName": {
+            'type': str,
+            'default': 'MyDatabase',
+            'description': 'The database name',
+        },
+        "DBUser": {
+            'type': str,
+            'default': 'postgres',
+            'description': 'The database admin account username',
+        },
+        "DBPassword": {
+            'type': str,
+            'default': 'gobbledigook',
+            'description': 'The database admin account password',
+        },
+        "Engine": {
+            'type': str,
+            'default': 'aurora-postgresql',
+            'description': 'The database engine: aurora-postgresql or aurora-mysql',
+            'validator': validate_engine,
+        },
+        "EngineVersion": {
+            'type': str,
+            'default': '13.4',
+            'description': 'The version number of the database engine',
+        },
+        "DBClass": {
+            'type': str,
+            'default': 'db.r5.large',
+            'description': 'Instance class of the writer and readers.  Ignored with ServerlessV2Scaling',
+        },
+        "Readers": {
+            'type': int,
+            'default': 1,
+            'description': 'Number of reader instances besides the writer',
+            'validator': validate_readers,
+        },
+        "AvailabilityZones": {
+            'type': list,
+            'default': list(),
+            'description': 'Availability zones to spread the writer and readers across.  The writer goes in the first',
+        },
+        "PubliclyAccessible": {
+            'type': bool,
+            'default': False,
+            'description': 'Whether to assign the DB instances publicly accessible IP addresses',
+        },
+        "ServerlessV2Scaling": {
+            'type': dict,
+            'default': dict(),
+            'description': 'Dict with keys MinCapacity and MaxCapacity in Aurora capacity units (0.5 to 128).  When given, instances run as Aurora Serverless v2',
+            'validator': validate_serverless_v2_scaling,
+        },
+        "ReplicaAutoScaling": {
+            'type': dict,
+            'default': dict(),
+            'description': 'Application Auto Scaling of Aurora replicas.  See module doc string for syntax',
+            'validator': validate_replica_autoscaling,
+        },
+        "DBParameters": {
+            'type': dict,
+            'default': dict(),
+            'description': 'Database engine parameters for a custom DB cluster parameter group',
+        },
+        "DBParameterGroupFamily": {
+            'type': str,
+            'default': str(),
+            'description': 'The DB cluster parameter group family.  Derived from Engine and EngineVersion when empty',
+        },
+        "PerformanceInsights": {
+            'type': bool,
+            'default': False,
+            'description': 'Whether to enable Performance Insights on the DB instances',
+        },
+        "PerformanceInsightsRetention": {
+            'type': int,
+            'default': 7,
+            'description': 'Days to retain Performance Insights data: 7, 731 or a multiple of 31',
+            'validator': validate_performance_insights_retention,
+        },
+        "MonitoringInterval": {
+            'type': int,
+            'default': 0,
+            'description': 'Seconds between enhanced monitoring metric collections.  0 disables enhanced monitoring',
+            'validator': validate_monitoring_interval,
+        },
+        "Proxy": {
+            'type': bool,
+            'default': False,
+            'description': 'Whether to create an RDS Proxy endpoint pooling connections to the cluster',
+        },
+        "ProxySecretArn": {
+            'type': str,
+            'default': str(),
+            'description': 'ARN of a Secrets Manager secret with the database username and password.  Required by Proxy',
+        },
+    }
+
+    def check_vars(self):
+        if self.vars['Proxy'] and not self.vars['ProxySecretArn']:
+            raise ValueError("'Proxy' requires 'ProxySecretArn'")
+
+    def availability_zone(self, index):
+        zones = self.vars['AvailabilityZones']
+        if not zones:
+            return NoValue
+        return zones[index % len(zones)]
+
+    def create_cluster(self):
+        t = self.template
+        if self.vars['DBParameters']:
+            parameter_group = t.add_resource(rds.DBClusterParameterGroup(
+                "DBClusterParameterGroup",
+                Description="Parameters for the Aurora DB cluster",
+                Family=(self.vars['DBParameterGroupFamily'] or parameter_group_family(
+                    self.vars['Engine'], self.vars['EngineVersion'])),
+                Parameters=self.vars['DBParameters'],
+            ))
+            parameter_group_name = Ref(parameter_group)
+        else:
+            parameter_group_name = NoValue
+        if self.vars['ServerlessV2Scaling']:
+            serverless_v2_scaling = ServerlessV2ScalingConfiguration(
+                **self.vars['ServerlessV2Scaling'])
+        else:
+            serverless_v2_scaling = NoValue
+        return t.add_resource(DBCluster(
+            "DBCluster",
+            DatabaseName=self.vars['DBName'],
+            Engine=self.vars['Engine'],
+            EngineVersion=self.vars['EngineVersion'],
+            MasterUsername=self.vars['DBUser'],
+            MasterUserPassword=self.vars['DBPassword'],
+            DBSubnetGroupName=Ref(self.db_subnet_group),
+            DBClusterParameterGroupName=parameter_group_name,
+            VpcSecurityGroupIds=self.vars['SecurityGroups'],
+            ServerlessV2ScalingConfiguration=serverless_v2_scaling,
+        ))
+
+    def create_instance(self, title, index):
+        """Create a DB instance of the cluster.  Index 0 is the writer."""
+        attributes = dict(
+            DBClusterIdentifier=Ref(self.cluster),
+            Engine=self.vars['Engine'],
+            DBSubnetGroupName=Ref(self.db_subnet_group),
+            PubliclyAccessible=self.vars['PubliclyAccessible'],
+            AvailabilityZone=self.availability_zone(index),
+            PromotionTier=min(index, 1),
+        )
+        if self.vars['ServerlessV2Scaling']:
+            attributes['DBInstanceClass'] = SERVERLESS_INSTANCE_CLASS
+        else:
+            attributes['DBInstanceClass'] = self.vars['DBClass']
+        if self.vars['PerformanceInsights']:
+            attributes['EnablePerformanceInsights'] = True
+            attributes['PerformanceInsightsRetentionPeriod'] = \
+                    self.vars['PerformanceInsightsRetention']
+        if self.vars['MonitoringInterval']:
+            attributes['MonitoringInterval'] = self.vars['MonitoringInterval']
+            attributes['MonitoringRoleArn'] = GetAtt(self.monitoring_role, 'Arn')
+        return self.template.add_resource(rds.DBInstance(title, **attributes))
+
+    def create_replica_autoscaling(self):
+        """
+        Scale the number of Aurora replicas with target tracking policies on
+        reader cpu and/or connections.
+        """
+        t = self.template
+        autoscaling = self.vars['ReplicaAutoScaling']
+        scalable_target = t.add_resource(applicationautoscaling.ScalableTarget(
+            "ReplicaScalableTarget",
+            DependsOn=self.readers[-1].title if self.readers else self.writer.title,
+            MinCapacity=autoscaling['MinCapacity'],
+            MaxCapacity=autoscaling['MaxCapacity'],
+            ResourceId=Join(':', ['cluster', Ref(self.cluster)]),
+            RoleARN=Join('', [
+                'arn:aws:iam::',
+                AccountId,
+                ':role/aws-service-role/rds.application-autoscaling.amazonaws.com/'
+                'AWSServiceRoleForApplicationAutoScaling_RDSCluster',
+            ]),
+            ScalableDimension='rds:cluster:ReadReplicaCount',
+            ServiceNamespace='rds',
+        ))
+        for key, title, metric_type in REPLICA_METRICS:
+            if key not in autoscaling:
+                continue
+            t.add_resource(applicationautoscaling.ScalingPolicy(
+                "Replica%sScalingPolicy" % title,
+                PolicyName=Join('-', ['Replica' + title, Ref(self.cluster)]),
+                PolicyType='TargetTrackingScaling',
+                ScalingTargetId=Ref(scalable_target),
+                TargetTrackingScalingPolicyConfiguration=(
+                    applicationautoscaling.TargetTrackingScalingPolicyConfiguration(
+                        TargetValue=float(autoscaling[key]),
+                        ScaleInCooldown=autoscaling.get('ScaleInCooldown', NoValue),
+                        ScaleOutCooldown=autoscaling.get('ScaleOutCooldown', NoValue),
+                        PredefinedMetricSpecification=(
+                            applicationautoscaling.PredefinedMetricSpecification(
+                                PredefinedMetricType=metric_type,
+                            )
+                        ),
+                    )
+                ),
+            ))
+
+    def create_template(self):
+        self.vars = self.validate_user_data()
+        self.check_vars()
+        t = self.template
+        t.add_description(
+            "Sceptre stack - create an Aurora DBCluster in an existing VPC."
+        )
+        subnets = [s.strip() for s in self.vars['Subnets'].split(',')]
+
+        self.db_subnet_group = t.add_resource(rds.DBSubnetGroup(
+            "DBSubnetGroup",
+            DBSubnetGroupDescription="Subnets available for the Aurora DB cluster",
+            SubnetIds=subnets,
+        ))
+        if self.vars['MonitoringInterval']:
+            self.monitoring_role = add_monitoring_role(t)
+
+        self.cluster = self.create_cluster()
+        self.writer = self.create_instance("DBWriter", 0)
+        self.readers = [self.create_instance("DBReader%s" % index, index)
+                for index in range(1, self.vars['Readers'] + 1)]
+
+        if self.vars['ReplicaAutoScaling']:
+            self.create_replica_autoscaling()
+
+        t.add_output(Output(
+            "ClusterEndPoint",
+            Description="Aurora cluster writer endpoint",
+            Value=GetAtt(self.cluster, "Endpoint.Address"),
+        ))
+        t.add_output(Output(
+            "ReaderEndPoint",
+            Description="Aurora cluster load balanced reader endpoint",
+            Value=GetAtt(self.cluster, "ReadEndpoint.Address"),
+        ))
+        t.add_output(Output(
+            "DBPort",
+            Description="Network port of the Aurora cluster",
+            Value=GetAtt(self.cluster, "Endpoint.Port"),
+        ))
+
+        if self.vars['Proxy']:
+            proxy = add_db_proxy(
+                t,
+                self.vars['Engine'],
+                self.vars['ProxySecretArn'],
+                subnets,
+                self.vars['SecurityGroups'],
+                cluster_ids=[Ref(self.cluster)],
+            )
+            t.add_output(Output(
+                "ProxyEndPoint",
+                Description="RDS Proxy endpoint",
+                Value=GetAtt(proxy, "Endpoint"),
+            ))
+
+
+#
+# The sceptre handler
+#
+def sceptre_handler(sceptre_user_data):
+    aurora = Aurora(sceptre_user_data)
+    aurora.create_template()
+    return aurora.template.to_json()
+
+def main():
+    """
+    When called as a script, print out the generated template.
+    If any arg is supplied, call the template class help method.
+    """
+    if len(sys.argv) > 1:
+        Aurora().help()
+    else:
+        print(sceptre_handler(dict()))
+
+if __name__ == '__main__':
+    main()
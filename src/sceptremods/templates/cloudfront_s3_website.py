@@ -1,12 +1,46 @@
 """
 A troposphere module for building static SSL enabled websites as S3 backed
 Cloudfront distributions.
+
+By default the distribution forwards query strings to the origin with
+legacy ForwardedValues, which splits the cache per query string.  Set
+CachePolicy to use a cache policy instead: the name of a managed policy
+(e.g. CachingOptimized), a cache policy id, or 'Custom' for a policy built
+from CachePolicySettings.  CacheBehaviors adds per path behaviors, each
+with its own policies or TTLs, e.g.:
+
+  CachePolicy: CachingOptimized
+  OriginRequestPolicy: CORS-S3Origin
+  OriginShieldRegion: us-west-2
+  Compress: true
+  HttpVersion: http2and3
+  PriceClass: PriceClass_200
+  CacheBehaviors:
+    - PathPattern: '*.html'
+      DefaultTTL: 300
+      MaxTTL: 3600
+    - PathPattern: 'api/*'
+      CachePolicy: CachingDisabled
+      OriginRequestPolicy: AllViewer
+
+A behavior given TTLs, QueryStrings, Headers or Cookies without a
+CachePolicy gets its own custom cache policy.  Custom policies cache
+gzip and brotli variants separately, so set Compress as well.
+
+With Precompressed, a CloudFront Function on each cache behavior serves
+brotli or gzip variants uploaded by 'sceptremods site sync --precompress'
+(e.g. site.css.br next to site.css) to viewers accepting them, instead of
+compressing at the edge.  Only files with PRECOMPRESSED_EXTENSIONS are
+rewritten, matching what site sync compresses.
 """
 
 import sys
 
 from troposphere import (
+    AWSObject,
+    AWSProperty,
     NoValue,
+    StackName,
     AccountId,
     GetAtt,
     Join,
@@ -17,8 +51,130 @@ from troposphere import (
 )
 import troposphere.cloudfront as cf
 from troposphere.constants import CLOUDFRONT_HOSTEDZONEID
+from troposphere.validators import boolean, priceclass_type
 
 from sceptremods.templates import BaseTemplate
+from sceptremods.util.props import with_props
+
+
+#
+# Globals
+#
+MANAGED_CACHE_POLICIES = {
+    "CachingOptimized": "658327ea-f89d-4fab-a63d-7e88639e58f6",
+    "CachingOptimizedForUncompressedObjects": "b2884449-e4de-46a7-ac36-70bc7f1ddd6d",
+    "CachingDisabled": "4135ea2d-6df8-44a3-9df3-4b5a84be39ad",
+    "Elemental-MediaPackage": "08627262-05a9-4f76-9ded-b50ca2e3a84f",
+    "Amplify": "2e54312d-136d-493c-8eb9-b001f22f67d2",
+}
+MANAGED_ORIGIN_REQUEST_POLICIES = {
+    "AllViewer": "216adef6-5c7f-47e4-b989-5492eafa07d3",
+    "AllViewerExceptHostHeader": "b689b0a8-53d0-40ab-baf2-68738e2966ac",
+    "CORS-CustomOrigin": "59781a5b-3903-41f3-afcb-af62929ccde1",
+    "CORS-S3Origin": "88a5eaf4-2fd4-4709-b370-b4c650ea3fcf",
+    "UserAgentRefererHeaders": "acba4595-bd28-49b8-b9fe-13317c0390fa",
+}
+HTTP_VERSIONS = ["http1.1", "http2", "http3", "http2and3"]
+VIEWER_PROTOCOL_POLICIES = ["allow-all", "https-only", "redirect-to-https"]
+CACHE_POLICY_SETTINGS = {
+    "MinTTL": 0,
+    "DefaultTTL": 86400,
+    "MaxTTL": 31536000,
+    "QueryStrings": [],
+    "Headers": [],
+    "Cookies": [],
+}
+CACHE_BEHAVIOR_KEYS = [
+    "PathPattern", "CachePolicy", "OriginRequestPolicy", "Compress",
+    "ViewerProtocolPolicy", "Precompressed",
+] + list(CACHE_POLICY_SETTINGS)
+ORIGIN_ID = "myS3Origin"
+# Content-Encoding and key suffix of precompressed variants, preferred first
+PRECOMPRESSED_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+PRECOMPRESSED_EXTENSIONS = ["html", "css", "js", "mjs", "json", "svg", "txt", "xml"]
+PRECOMPRESSED_FUNCTION_CODE = """\
+var EXTENSIONS = /\\.(%(extensions)s)$/;
+var ENCODINGS = %(encodings)s;
+
+function accepts(header, encoding) {
+    var codings = header.split(',');
+    for (var i = 0; i < codings.length; i++) {
+        var params = codings[i].split(';');
+        if (params[0].trim().toLowerCase() !== encoding) {
+            continue;
+        }
+        for (var j = 1; j < params.length; j++) {
+            var param = params[j].split('=');
+            if (param[0].trim() === 'q' && parseFloat(param[1]) === 0) {
+                return false;
+            }
+        }
+        return true;
+    }
+    return false;
+}
+
+function handler(event) {
+    var request = event.request;
+    var header = request.headers['accept-encoding'];
+    var uri = request.uri === '/' ? '/%(root_object)s' : request.uri;
+    if (!header || !EXTENSIONS.test(uri)) {
+        return request;
+    }
+    for (var i = 0; i < ENCODINGS.length; i++) {
+        if (accepts(header.value, ENCODINGS[i][0])) {
+            request.uri = uri + ENCODINGS[i][1];
+            break;
+        }
+    }
+    return request;
+}
+"""
+
+
+#
+# Resources and properties missing from older troposphere releases
+#
+class FunctionConfig(AWSProperty):
+    props = {
+        "Comment": (str, True),
+        "Runtime": (str, True),
+    }
+
+
+class Function(AWSObject):
+    resource_type = "AWS::CloudFront::Function"
+    props = {
+        "AutoPublish": (boolean, False),
+        "FunctionCode": (str, True),
+        "FunctionConfig": (FunctionConfig, True),
+        "Name": (str, True),
+    }
+
+
+class FunctionAssociation(AWSProperty):
+    props = {
+        "EventType": (str, False),
+        "FunctionARN": (str, False),
+    }
+
+
+CacheBehavior = with_props(
+    cf.CacheBehavior,
+    FunctionAssociations=([FunctionAssociation], False),
+)
+DefaultCacheBehavior = with_props(
+    cf.DefaultCacheBehavior,
+    FunctionAssociations=([FunctionAssociation], False),
+)
+
+
+def precompressed_function_code(root_object):
+    return PRECOMPRESSED_FUNCTION_CODE % dict(
+        extensions="|".join(PRECOMPRESSED_EXTENSIONS),
+        encodings=str([list(e) for e in PRECOMPRESSED_ENCODINGS]).replace("'", '"'),
+        root_object=root_object,
+    )
 
 
 #
@@ -32,6 +188,67 @@ def validate_run_environment(env):
         )
     return True
 
+def validate_http_version(version):
+    if version and version not in HTTP_VERSIONS:
+        raise ValueError(
+            "'HttpVersion' must be one of {}.".format(HTTP_VERSIONS)
+        )
+    return version
+
+def validate_cache_policy_settings(settings):
+    unknown = set(settings) - set(CACHE_POLICY_SETTINGS)
+    if unknown:
+        raise ValueError(
+            "Unknown cache policy settings {}. Valid keys: {}".format(
+                sorted(unknown), list(CACHE_POLICY_SETTINGS))
+        )
+    ttls = dict((k, settings.get(k, CACHE_POLICY_SETTINGS[k]))
+                for k in ["MinTTL", "DefaultTTL", "MaxTTL"])
+    if not ttls["MinTTL"] <= ttls["DefaultTTL"] <= ttls["MaxTTL"]:
+        raise ValueError(
+            "Cache policy TTLs must satisfy MinTTL <= DefaultTTL <= MaxTTL, "
+            "got {}".format(ttls)
+        )
+    for key in ["QueryStrings", "Headers", "Cookies"]:
+        if not isinstance(settings.get(key, []), list):
+            raise ValueError("Cache policy setting {} must be a list".format(key))
+        if settings.get(key) and ttls["MaxTTL"] == 0:
+            raise ValueError(
+                "Cache policy setting {} requires a MaxTTL above 0, as "
+                "CloudFront allows no cache key settings when caching is "
+                "disabled".format(key)
+            )
+    return settings
+
+def validate_cache_behaviors(behaviors):
+    patterns = set()
+    for behavior in behaviors:
+        if not isinstance(behavior, dict) or "PathPattern" not in behavior:
+            raise ValueError(
+                "Each of CacheBehaviors must be a dict with a PathPattern key"
+            )
+        unknown = set(behavior) - set(CACHE_BEHAVIOR_KEYS)
+        if unknown:
+            raise ValueError(
+                "Unknown keys {} in cache behavior {}. Valid keys: {}".format(
+                    sorted(unknown), behavior["PathPattern"], CACHE_BEHAVIOR_KEYS)
+            )
+        if behavior["PathPattern"] in patterns:
+            raise ValueError(
+                "Cache behavior {} listed more than once".format(
+                    behavior["PathPattern"])
+            )
+        patterns.add(behavior["PathPattern"])
+        validate_cache_policy_settings(dict(
+            (k, v) for k, v in behavior.items() if k in CACHE_POLICY_SETTINGS))
+        policy = behavior.get("ViewerProtocolPolicy")
+        if policy and policy not in VIEWER_PROTOCOL_POLICIES:
+            raise ValueError(
+                "ViewerProtocolPolicy must be one of {}".format(
+                    VIEWER_PROTOCOL_POLICIES)
+            )
+    return behaviors
+
 
 #
 # The template class
@@ -47,6 +264,11 @@ class CFS3Site(BaseTemplate):
     The resulting template defines an SSL enabled website.
     """
 
+    OUTPUTS = [
+        "OriginBucket", "CloudFrontDistribution", "DistributionId",
+        "WebsiteURL", "LocalDNS",
+    ]
+
     VARSPEC = {
         "ApplicationName": {
             "type": str,
@@ -87,7 +309,7 @@ class CFS3Site(BaseTemplate):
         "DefaultTTL": {
             "type": int,
             "default": 0,
-            "description": "The default time in seconds that objects stay in CloudFront caches before CloudFront forwards another request to your custom origin to determine whether the object has been updated.",
+            "description": "The default time in seconds that objects stay in CloudFront caches before CloudFront forwards another request to your custom origin to determine whether the object has been updated.  Only used without a CachePolicy.",
         },
         "AcmCertificateARN": {
             "type": str,
@@ -109,6 +331,55 @@ class CFS3Site(BaseTemplate):
             "default": 'DUMMY-S3-CANONICAL-USER-ID',
             "description": "The CloudFront origin access identity S3 canonical user Id.",
         },
+        "CachePolicy": {
+            "type": str,
+            "default": str(),
+            "description": "Cache policy of the default cache behavior: a managed policy name ({}), a cache policy id, or 'Custom' for a policy built from CachePolicySettings.  Empty uses legacy ForwardedValues with DefaultTTL.".format(', '.join(sorted(MANAGED_CACHE_POLICIES))),
+        },
+        "CachePolicySettings": {
+            "type": dict,
+            "default": dict(),
+            "description": "Settings of the custom cache policy: MinTTL, DefaultTTL, MaxTTL, and lists of QueryStrings, Headers and Cookies to include in the cache key.  Implies CachePolicy 'Custom'.",
+            "validator": validate_cache_policy_settings,
+        },
+        "OriginRequestPolicy": {
+            "type": str,
+            "default": str(),
+            "description": "Origin request policy of the default cache behavior: a managed policy name ({}) or an origin request policy id.".format(', '.join(sorted(MANAGED_ORIGIN_REQUEST_POLICIES))),
+        },
+        "CacheBehaviors": {
+            "type": list,
+            "default": list(),
+            "description": "List of per path cache behaviors.  Dicts with keys PathPattern and optional CachePolicy, OriginRequestPolicy, Compress, ViewerProtocolPolicy, and custom cache policy settings.",
+            "validator": validate_cache_behaviors,
+        },
+        "OriginShieldRegion": {
+            "type": str,
+            "default": str(),
+            "description": "If set, enable Origin Shield in this AWS region, ideally the origin bucket's region.",
+        },
+        "Compress": {
+            "type": bool,
+            "default": False,
+            "description": "Compress objects served through cache behaviors not setting Compress themselves.",
+        },
+        "HttpVersion": {
+            "type": str,
+            "default": str(),
+            "description": "Highest HTTP version viewers may use.  One of {}.  Empty leaves the CloudFront default.".format(HTTP_VERSIONS),
+            "validator": validate_http_version,
+        },
+        "PriceClass": {
+            "type": str,
+            "default": "PriceClass_100",
+            "description": "Distribution price class: PriceClass_100, PriceClass_200 or PriceClass_All.",
+            "validator": priceclass_type,
+        },
+        "Precompressed": {
+            "type": bool,
+            "default": False,
+            "description": "Serve brotli/gzip variants uploaded by 'sceptremods site sync --precompress' to viewers accepting them, through a CloudFront Function on cache behaviors not setting Precompressed themselves.  Requests are rewritten whether or not a variant exists, so every sync must use --precompress.",
+        },
         "WebACLId": {
             "type": str,
             "default": str(),
@@ -159,6 +430,138 @@ class CFS3Site(BaseTemplate):
         ))
 
 
+    def cache_policy(self, name, settings):
+        """
+        Add a custom cache policy from 'settings'.  Return its id.  With a
+        MaxTTL of 0 caching is disabled, and CloudFront then requires the
+        Accept-Encoding settings be off too.
+        """
+        settings = dict(CACHE_POLICY_SETTINGS, **settings)
+        caching = settings["MaxTTL"] > 0
+
+        def behavior(items):
+            return "whitelist" if items else "none"
+
+        policy = self.template.add_resource(cf.CachePolicy(
+            name + "CachePolicy",
+            CachePolicyConfig=cf.CachePolicyConfig(
+                Name=Join("-", [StackName, name]),
+                MinTTL=settings["MinTTL"],
+                DefaultTTL=settings["DefaultTTL"],
+                MaxTTL=settings["MaxTTL"],
+                ParametersInCacheKeyAndForwardedToOrigin=cf.ParametersInCacheKeyAndForwardedToOrigin(
+                    EnableAcceptEncodingGzip=caching,
+                    EnableAcceptEncodingBrotli=caching,
+                    QueryStringsConfig=cf.CacheQueryStringsConfig(
+                        QueryStringBehavior=behavior(settings["QueryStrings"]),
+                        QueryStrings=settings["QueryStrings"] or NoValue,
+                    ),
+                    HeadersConfig=cf.CacheHeadersConfig(
+                        HeaderBehavior=behavior(settings["Headers"]),
+                        Headers=settings["Headers"] or NoValue,
+                    ),
+                    CookiesConfig=cf.CacheCookiesConfig(
+                        CookieBehavior=behavior(settings["Cookies"]),
+                        Cookies=settings["Cookies"] or NoValue,
+                    ),
+                ),
+            ),
+        ))
+        return Ref(policy)
+
+
+    def default_cache_policy(self):
+        """
+        Return the id of the custom cache policy from CachePolicySettings,
+        adding it on first use.
+        """
+        if self.DefaultCachePolicy is None:
+            self.DefaultCachePolicy = self.cache_policy(
+                "Default", self.vars["CachePolicySettings"])
+        return self.DefaultCachePolicy
+
+
+    def precompressed_function(self):
+        """
+        Return the CloudFront Function selecting precompressed variants,
+        adding it on first use.
+        """
+        if self.PrecompressedFunction is None:
+            self.PrecompressedFunction = self.template.add_resource(Function(
+                "PrecompressedFunction",
+                Name=Join("-", [StackName, "precompressed"]),
+                AutoPublish=True,
+                FunctionConfig=FunctionConfig(
+                    Comment="Serve precompressed brotli/gzip variants",
+                    Runtime="cloudfront-js-1.0",
+                ),
+                FunctionCode=precompressed_function_code(
+                    self.vars["DefaultRootObject"]),
+            ))
+        return self.PrecompressedFunction
+
+
+    def cache_behavior_properties(self, name, behavior):
+        """
+        Return the cache behavior properties for 'behavior', a dict of
+        CacheBehaviors keys, adding a custom cache policy if needed.
+        """
+        settings = dict(
+            (k, v) for k, v in behavior.items() if k in CACHE_POLICY_SETTINGS)
+        default_policy = self.vars["CachePolicy"] or (
+            "Custom" if self.vars["CachePolicySettings"] else str())
+        cache_policy = behavior.get("CachePolicy") or (
+            "Custom" if settings else default_policy)
+        origin_request_policy = behavior.get(
+            "OriginRequestPolicy", self.vars["OriginRequestPolicy"])
+        properties = dict(
+            ViewerProtocolPolicy=behavior.get(
+                "ViewerProtocolPolicy", "redirect-to-https"),
+            TargetOriginId=ORIGIN_ID,
+        )
+        compress = behavior.get("Compress", self.vars["Compress"])
+        if compress:
+            properties["Compress"] = True
+        if behavior.get("Precompressed", self.vars["Precompressed"]):
+            properties["FunctionAssociations"] = [FunctionAssociation(
+                EventType="viewer-request",
+                FunctionARN=GetAtt(
+                    self.precompressed_function(), "FunctionMetadata.FunctionARN"),
+            )]
+        if origin_request_policy:
+            properties["OriginRequestPolicyId"] = MANAGED_ORIGIN_REQUEST_POLICIES.get(
+                origin_request_policy, origin_request_policy)
+
+        if cache_policy == "Custom" and settings and name != "Default":
+            properties["CachePolicyId"] = self.cache_policy(name, settings)
+        elif cache_policy == "Custom":
+            properties["CachePolicyId"] = self.default_cache_policy()
+        elif cache_policy:
+            properties["CachePolicyId"] = MANAGED_CACHE_POLICIES.get(
+                cache_policy, cache_policy)
+        else:
+            properties["ForwardedValues"] = cf.ForwardedValues(
+                Cookies=cf.Cookies(Forward="none"),
+                QueryString="true"
+            )
+            properties["DefaultTTL"] = self.vars["DefaultTTL"]
+        return properties
+
+
+    def cache_behaviors(self):
+        """
+        Return the list of per path CacheBehaviors.
+        """
+        behaviors = []
+        for index, behavior in enumerate(self.vars["CacheBehaviors"]):
+            behaviors.append(CacheBehavior(
+                PathPattern=behavior["PathPattern"],
+                **self.cache_behavior_properties(
+                    "Behavior{}".format(index + 1), behavior)
+            ))
+        return behaviors
+
+
     def cloudfront_distribution(self):
         if self.vars["AcmCertificateARN"]:
             viewer_certificate = cf.ViewerCertificate(
@@ -170,6 +573,17 @@ class CFS3Site(BaseTemplate):
         else:
             viewer_certificate = NoValue
             url_prefix = 'http://'
+        origin_options = dict()
+        if self.vars["OriginShieldRegion"]:
+            origin_options["OriginShield"] = cf.OriginShield(
+                Enabled=True,
+                OriginShieldRegion=self.vars["OriginShieldRegion"],
+            )
+        distribution_options = dict()
+        if self.vars["HttpVersion"]:
+            distribution_options["HttpVersion"] = self.vars["HttpVersion"]
+        if self.vars["CacheBehaviors"]:
+            distribution_options["CacheBehaviors"] = self.cache_behaviors()
 
         t = self.template
         self.SiteCFDistribution = t.add_resource(cf.Distribution(
@@ -183,30 +597,27 @@ class CFS3Site(BaseTemplate):
                 ),
                 WebACLId=self.vars["WebACLId"],
                 Origins=[cf.Origin(
-                    S3OriginConfig=cf.S3Origin(
+                    S3OriginConfig=cf.S3OriginConfig(
                         OriginAccessIdentity=(
                             "origin-access-identity/cloudfront/"
                             + self.vars["OriginAccessIdentity"]
                         ),
                     ),
-                    Id="myS3Origin",
+                    Id=ORIGIN_ID,
                     DomainName=GetAtt(self.SiteBucket, "DomainName"),
                     OriginPath=self.vars["OriginPath"],
+                    **origin_options
                 )],
                 DefaultRootObject=self.vars["DefaultRootObject"],
-                PriceClass="PriceClass_100",
+                PriceClass=self.vars["PriceClass"],
                 Enabled="true",
-                DefaultCacheBehavior=cf.DefaultCacheBehavior(
-                    ViewerProtocolPolicy="redirect-to-https",
-                    ForwardedValues=cf.ForwardedValues(
-                        Cookies=cf.Cookies(Forward="none"),
-                        QueryString="true"
-                    ),
-                    TargetOriginId="myS3Origin",
-                    DefaultTTL=self.vars["DefaultTTL"],
+                DefaultCacheBehavior=DefaultCacheBehavior(
+                    **self.cache_behavior_properties("Default", dict(
+                        self.vars["CachePolicySettings"]))
                 ),
                 Aliases=[self.vars["FQDNPublic"]],
                 ViewerCertificate=viewer_certificate,
+                **distribution_options
             ),
         ))
 
@@ -215,6 +626,11 @@ class CFS3Site(BaseTemplate):
             Description="Cloudfront distribution domainname in AWS",
             Value=GetAtt(self.SiteCFDistribution, "DomainName"),
         ))
+        t.add_output(Output(
+            "DistributionId",
+            Description="Cloudfront distribution id, e.g. for invalidations",
+            Value=Ref(self.SiteCFDistribution),
+        ))
         WebsiteURL = t.add_output(Output(
             "WebsiteURL",
             Description="Public URL of cloudfront hosted website",
@@ -246,6 +662,8 @@ class CFS3Site(BaseTemplate):
 
     def create_template(self):
         self.vars = self.validate_user_data()
+        self.PrecompressedFunction = None
+        self.DefaultCachePolicy = None
         if not self.vars["FQDNInternal"]:
             self.vars["FQDNInternal"] = ".".join([
                 self.vars["ApplicationName"],
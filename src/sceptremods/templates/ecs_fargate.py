@@ -2,11 +2,64 @@
 Assumptions:
     using fargate
     using ALB 
-    only one publicly available port
-    one service, one task, one container
+    only one publicly available port per service
     no task volumes
+
+By default the template runs one service, one task, one container
+described by the top level vars.  When 'Services' is given, each item
+describes a service sharing the cluster, ALB listener and log group.  Top
+level vars act as defaults for every service and container, except
+ServiceFqdn: each distinct ServiceFqdn gets one route53 alias to the ALB.
+Each service gets its own target group, task definition and listener rule,
+and a ServiceUrl output including the path of its first PathPattern.
+
+Listener rules match on host-header and/or path-pattern conditions.
+Priorities are allocated from a stable hash of the conditions, banded so
+that more specific rules are evaluated first.  Set ListenerRuleSnapshot to
+also avoid priorities of rules already on the listener.
+
+Services:
+  - Name: api                 # alphanumeric, prefixes resource titles
+    PathPatterns: ['/api/*']  # default: /<name>/*
+    ContainerImage: example/api
+  - Name: admin
+    HostHeaders: [admin.example.com]
+    Priority: 10              # optional, default: allocated
+    ContainerImage: example/admin
+  - Name: web
+    DesiredCount: 2
+    LoadBalancedContainer: nginx
+    Containers:
+      - ContainerName: nginx
+        ContainerImage: nginx
+      - ContainerName: app
+        ContainerImage: example/app
+        ContainerPort: 8080
+
+AutoScaling registers each service with Application Auto Scaling.  Target
+tracking policies are created for each target given.  At least one target
+or scheduled action is required.  A scaled service leaves its task count to
+Application Auto Scaling, so 'DesiredCount' is ignored and a stack update no
+longer resets the count.
+
+AutoScaling:
+  MinCapacity: 2
+  MaxCapacity: 20
+  CpuTarget: 60               # percent average cpu utilization
+  MemoryTarget: 70            # percent average memory utilization
+  RequestCountTarget: 1000    # ALB requests per task
+  ScaleInCooldown: 300        # seconds
+  ScaleOutCooldown: 60
+  ScheduledActions:
+    - Name: business-hours
+      Schedule: cron(0 7 ? * MON-FRI *)
+      MinCapacity: 4
+    - Name: after-hours
+      Schedule: cron(0 19 ? * MON-FRI *)
+      MinCapacity: 2
 """
 
+import re
 import sys
 
 from troposphere import (
@@ -19,14 +72,256 @@ from troposphere import (
     Ref,
 )
 from troposphere import (
+    applicationautoscaling,
     ecs,
     logs,
     route53,
 )
 import troposphere.elasticloadbalancingv2 as elb
 
-from sceptremods.util.acm import get_elb_hosted_zone_id
-from sceptremods.templates import BaseTemplate
+from sceptremods.util.lookups import elb_hosted_zone_id, listener_rules
+from sceptremods.util.elb import MAX_RULE_PRIORITY, allocate_priorities
+from sceptremods.util.props import convert_properties
+from sceptremods.templates import BaseTemplate, is_plain
+
+
+CONTAINER_KEYS = [
+    'ContainerName',
+    'ContainerPort',
+    'ContainerProtocol',
+    'ContainerImage',
+    'ContainerImageVersion',
+    'UseECR',
+    'AdditionalContainerAttributes',
+]
+# service settings which default to the top level var of the same name
+SERVICE_DEFAULTS = [
+    'DesiredCount',
+    'Cpu',
+    'Memory',
+    'TaskRoleArn',
+    'HealthCheckAttributes',
+    'HostHeaders',
+    'AutoScaling',
+    'CapacityProviderStrategy',
+] + CONTAINER_KEYS
+SERVICE_KEYS = [
+    'Name',
+    'Family',
+    'Containers',
+    'LoadBalancedContainer',
+    'PathPatterns',
+    'Priority',
+    'ServiceFqdn',
+] + SERVICE_DEFAULTS
+
+
+CAPACITY_PROVIDERS = ['FARGATE', 'FARGATE_SPOT']
+CAPACITY_PROVIDER_KEYS = ['CapacityProvider', 'Base', 'Weight']
+AUTOSCALING_KEYS = [
+    'MinCapacity',
+    'MaxCapacity',
+    'CpuTarget',
+    'MemoryTarget',
+    'RequestCountTarget',
+    'ScaleInCooldown',
+    'ScaleOutCooldown',
+    'ScheduledActions',
+]
+SCHEDULED_ACTION_KEYS = [
+    'Name',
+    'Schedule',
+    'MinCapacity',
+    'MaxCapacity',
+    'StartTime',
+    'EndTime',
+]
+# target tracking settings and the predefined metric they track
+TARGET_TRACKING_METRICS = [
+    ('CpuTarget', 'Cpu', 'ECSServiceAverageCPUUtilization'),
+    ('MemoryTarget', 'Memory', 'ECSServiceAverageMemoryUtilization'),
+    ('RequestCountTarget', 'RequestCount', 'ALBRequestCountPerTarget'),
+]
+
+
+#
+# Validators
+#
+def validate_priority(priority):
+    if not isinstance(priority, int) or not 0 <= priority <= MAX_RULE_PRIORITY:
+        raise ValueError(
+            "Listener rule priority must be an integer from 1 to {}, or 0 "
+            "to allocate automatically".format(MAX_RULE_PRIORITY)
+        )
+
+def validate_services(services):
+    names = []
+    fqdns = []
+    for service in services:
+        if not isinstance(service, dict):
+            raise ValueError("Items in 'Services' must be dictionaries")
+        for key in service:
+            if key not in SERVICE_KEYS:
+                raise ValueError(
+                    "Invalid service key '{}'.  Must be one of {}".format(
+                        key, SERVICE_KEYS)
+                )
+        name = service.get('Name')
+        if not isinstance(name, str) or not re.match(r'^[A-Za-z0-9]+$', name):
+            raise ValueError(
+                "Each service requires an alphanumeric 'Name'. Got '{}'".format(name)
+            )
+        if name in names:
+            raise ValueError("Duplicate service name '{}'".format(name))
+        names.append(name)
+        fqdn = service.get('ServiceFqdn')
+        if fqdn:
+            if fqdn in fqdns:
+                raise ValueError(
+                    "Duplicate ServiceFqdn '{}' in service '{}'".format(fqdn, name))
+            fqdns.append(fqdn)
+        container_names = []
+        for container in service.get('Containers', list()):
+            if not isinstance(container, dict) or 'ContainerName' not in container:
+                raise ValueError(
+                    "Containers of service '{}' must be dictionaries with a "
+                    "'ContainerName'".format(name)
+                )
+            for key in container:
+                if key not in CONTAINER_KEYS:
+                    raise ValueError(
+                        "Invalid container key '{}' in service '{}'".format(key, name)
+                    )
+            container_names.append(container['ContainerName'])
+        validate_priority(service.get('Priority', 0))
+        validate_autoscaling(service.get('AutoScaling'))
+        validate_capacity_provider_strategy(
+            service.get('CapacityProviderStrategy', list()))
+        if (service.get('LoadBalancedContainer') and container_names
+                and service['LoadBalancedContainer'] not in container_names):
+            raise ValueError(
+                "LoadBalancedContainer '{}' of service '{}' is not one of its "
+                "containers".format(service['LoadBalancedContainer'], name)
+            )
+
+
+def validate_capacity_provider_strategy(strategy):
+    if not isinstance(strategy, list):
+        raise ValueError("'CapacityProviderStrategy' must be a list")
+    providers = []
+    for item in strategy:
+        if not isinstance(item, dict):
+            raise ValueError(
+                "Items in 'CapacityProviderStrategy' must be dictionaries")
+        for key in item:
+            if key not in CAPACITY_PROVIDER_KEYS:
+                raise ValueError(
+                    "Invalid CapacityProviderStrategy key '{}'.  Must be one "
+                    "of {}".format(key, CAPACITY_PROVIDER_KEYS)
+                )
+        if item.get('CapacityProvider') not in CAPACITY_PROVIDERS:
+            raise ValueError(
+                "'CapacityProvider' must be one of {}".format(CAPACITY_PROVIDERS))
+        if item['CapacityProvider'] in providers:
+            raise ValueError("Duplicate capacity provider '{}'".format(
+                item['CapacityProvider']))
+        providers.append(item['CapacityProvider'])
+        for key in ['Base', 'Weight']:
+            if key in item and (not isinstance(item[key], int) or item[key] < 0):
+                raise ValueError(
+                    "CapacityProviderStrategy '{}' must be a non-negative "
+                    "integer".format(key)
+                )
+    if len([item for item in strategy if item.get('Base')]) > 1:
+        raise ValueError(
+            "Only one capacity provider in a strategy may define a 'Base'")
+    if strategy and not [item for item in strategy if item.get('Weight')]:
+        raise ValueError(
+            "At least one capacity provider requires a 'Weight' above 0")
+
+
+def validate_autoscaling(autoscaling):
+    if not autoscaling:
+        return
+    if not isinstance(autoscaling, dict):
+        raise ValueError("'AutoScaling' must be a dictionary")
+    for key in autoscaling:
+        if key not in AUTOSCALING_KEYS:
+            raise ValueError(
+                "Invalid AutoScaling key '{}'.  Must be one of {}".format(
+                    key, AUTOSCALING_KEYS)
+            )
+    for key in ['MinCapacity', 'MaxCapacity']:
+        if not isinstance(autoscaling.get(key), int) or autoscaling[key] < 0:
+            raise ValueError(
+                "AutoScaling requires '{}' as a non-negative integer".format(key))
+    if autoscaling['MinCapacity'] > autoscaling['MaxCapacity']:
+        raise ValueError("AutoScaling 'MinCapacity' exceeds 'MaxCapacity'")
+    for key, _, _ in TARGET_TRACKING_METRICS:
+        if key in autoscaling and (isinstance(autoscaling[key], bool)
+                or not isinstance(autoscaling[key], (int, float))
+                or autoscaling[key] <= 0):
+            raise ValueError("AutoScaling '{}' must be a positive number".format(key))
+    for key in ['ScaleInCooldown', 'ScaleOutCooldown']:
+        if key in autoscaling and (not isinstance(autoscaling[key], int)
+                or autoscaling[key] < 0):
+            raise ValueError(
+                "AutoScaling '{}' must be a non-negative integer".format(key))
+    actions = autoscaling.get('ScheduledActions', list())
+    if not [key for key, _, _ in TARGET_TRACKING_METRICS if key in autoscaling] \
+            and not actions:
+        raise ValueError(
+            "AutoScaling requires at least one target or scheduled action")
+    names = []
+    for action in actions:
+        if not isinstance(action, dict):
+            raise ValueError("Items in 'ScheduledActions' must be dictionaries")
+        for key in action:
+            if key not in SCHEDULED_ACTION_KEYS:
+                raise ValueError(
+                    "Invalid scheduled action key '{}'.  Must be one of {}".format(
+                        key, SCHEDULED_ACTION_KEYS)
+                )
+        if not action.get('Name') or action['Name'] in names:
+            raise ValueError("Scheduled actions require a unique 'Name'")
+        names.append(action['Name'])
+        if not re.match(r'^(at|cron|rate)\(.+\)$', str(action.get('Schedule'))):
+            raise ValueError(
+                "Scheduled action '{}' requires a 'Schedule' of the form "
+                "at(...), cron(...) or rate(...)".format(action['Name'])
+            )
+        if 'MinCapacity' not in action and 'MaxCapacity' not in action:
+            raise ValueError(
+                "Scheduled action '{}' requires 'MinCapacity' and/or "
+                "'MaxCapacity'".format(action['Name'])
+            )
+
+
+def url_path(path_patterns):
+    """
+    Return the path of a service url from its first path pattern, e.g.
+    '/api/' for '/api/*'.
+    """
+    if not path_patterns:
+        return str()
+    path = re.split(r'[*?]', path_patterns[0])[0]
+    return str() if path == '/' else path
+
+
+#
+# Render time lookups
+#
+def lookup_elb_hosted_zone_id(variables):
+    fqdns = [variables['ServiceFqdn']] + [
+        service.get('ServiceFqdn') for service in variables['Services']]
+    if any(fqdns):
+        return elb_hosted_zone_id(variables['LoadBalancerArn'])
+    return None
+
+def lookup_listener_rules(variables):
+    if variables['ListenerRuleSnapshot'] and variables['ListenerPort'] == 80:
+        return listener_rules(variables['DefaultListener'])
+    return list()
 
 
 #
@@ -34,6 +329,13 @@ from sceptremods.templates import BaseTemplate
 #
 class ECSFargate(BaseTemplate):
 
+    OUTPUTS = ['ServiceUrl']
+
+    LOOKUPS = {
+        'ElbHostedZoneId': lookup_elb_hosted_zone_id,
+        'ListenerRules': lookup_listener_rules,
+    }
+
     VARSPEC = {
 
         # ECS service vars
@@ -61,7 +363,7 @@ class ECSFargate(BaseTemplate):
         'DesiredCount': {
             'type': int,
             'default': 1,
-            'description': 'The number of task instances to run on the cluster.',
+            'description': 'The number of task instances to run on the cluster.  Ignored with AutoScaling.',
         },
 
         # ECS task vars
@@ -173,71 +475,146 @@ class ECSFargate(BaseTemplate):
         'ServiceFqdn': {
             'type': str,
             'default': str(),
-            'description': 'The fully qualified DNS name to use for the service.  This becomes a CNAME to the ALB in route53.  Leave blank if you do not require a DNS name for this service.',
+            'description': 'The fully qualified DNS name to use for the service.  This becomes a CNAME to the ALB in route53.  Leave blank if you do not require a DNS name for this service.  With Services it is the host of the URLs of services without a ServiceFqdn of their own, which must each be distinct.',
+        },
+        'ListenerRulePriority': {
+            'type': int,
+            'default': 0,
+            'description': 'Priority of the ALB listener rule for the service.  When 0, a priority is allocated from a stable hash of the rule conditions.  With Services use the per service Priority key instead.',
+            'validator': validate_priority,
+        },
+        'ListenerRuleSnapshot': {
+            'type': bool,
+            'default': False,
+            'description': 'Whether to fetch the rules already on the default listener so that allocated priorities avoid them.  Fetched rules are cached for five minutes.  Rules with identical conditions keep their priority.',
+        },
+        'HostHeaders': {
+            'type': list,
+            'default': list(),
+            'description': 'A list of host names for the host-header condition of the ALB listener rule.',
+        },
+        'PathPatterns': {
+            'type': list,
+            'default': list(),
+            'description': 'A list of path patterns for the path-pattern condition of the ALB listener rule.  Defaults to "/", or "/<name>/*" per service.  No default when HostHeaders are given.',
+        },
+
+        # autoscaling vars
+        'AutoScaling': {
+            'type': dict,
+            'default': dict(),
+            'description': 'Application Auto Scaling settings for the ECS service.  See module doc string for syntax.  Per service in Services.',
+            'validator': validate_autoscaling,
+        },
+
+        # capacity provider vars
+        'CapacityProviderStrategy': {
+            'type': list,
+            'default': list(),
+            'description': 'A list of FARGATE/FARGATE_SPOT capacity providers with optional Base and Weight, e.g. [{CapacityProvider: FARGATE, Base: 1, Weight: 1}, {CapacityProvider: FARGATE_SPOT, Weight: 3}].  The cluster must have these providers attached (see the ecs_cluster hook).  When empty, the service uses launch type FARGATE.',
+            'validator': validate_capacity_provider_strategy,
+        },
+
+        # multi-service vars
+        'Services': {
+            'type': list,
+            'default': list(),
+            'description': 'A list of services sharing the cluster, listener and log group.  See module doc string for syntax.  Requires Family, which names the log group.',
+            'validator': validate_services,
         },
     }
 
 
-    def munge_container_attributes(self):
+    @classmethod
+    def stack_outputs(cls, user_data):
+        """With Services, each service has its own <Name>ServiceUrl output."""
+        services = (user_data or dict()).get('Services')
+        if not services:
+            return cls.OUTPUTS
+        if not is_plain(services):
+            return None
+        return [service.get('Name', '') + 'ServiceUrl'
+                for service in services if isinstance(service, dict)]
+
+
+    def munge_services(self):
+        """
+        Return a list of fully populated service dicts.  Without 'Services'
+        this is the single service described by the top level vars, whose
+        resources keep their unprefixed titles.
+        """
+        if self.vars['Services']:
+            service_list = self.vars['Services']
+        else:
+            service_list = [dict(
+                Name=str(),
+                Family=self.vars['Family'] or self.vars['ContainerName'],
+                PathPatterns=self.vars['PathPatterns'],
+                Priority=self.vars['ListenerRulePriority'],
+                ServiceFqdn=self.vars['ServiceFqdn'],
+            )]
+        services = []
+        for settings in service_list:
+            service = dict(Family=str(), LoadBalancedContainer=str(),
+                    PathPatterns=list(), Priority=0, ServiceFqdn=str())
+            service.update((key, self.vars[key]) for key in SERVICE_DEFAULTS)
+            service.update(settings)
+            if not service['Family']:
+                service['Family'] = service['Name']
+            if not service['PathPatterns'] and not service['HostHeaders']:
+                if service['Name']:
+                    service['PathPatterns'] = ['/{}/*'.format(service['Name'].lower())]
+                else:
+                    service['PathPatterns'] = ['/']
+            containers = []
+            for container_settings in settings.get('Containers',
+                    [dict((key, service[key]) for key in CONTAINER_KEYS)]):
+                container = dict((key, service[key]) for key in CONTAINER_KEYS)
+                container.update(container_settings)
+                containers.append(container)
+            service['Containers'] = containers
+            if not service['LoadBalancedContainer']:
+                service['LoadBalancedContainer'] = containers[0]['ContainerName']
+            service['Container'] = [c for c in containers
+                    if c['ContainerName'] == service['LoadBalancedContainer']][0]
+            services.append(service)
+        return services
+
+
+    def munge_container_attributes(self, container, service):
         image =':'.join([
-            self.vars['ContainerImage'], 
-            str(self.vars['ContainerImageVersion']),
+            container['ContainerImage'], 
+            str(container['ContainerImageVersion']),
         ])
         # munge ECR image path
-        if self.vars['UseECR']:
+        if container['UseECR']:
             image = Join('.', [AccountId, 'dkr.ecr', Region, 'amazonaws.com/' + image])
         # set required attributes
         required = dict(
-            Name=self.vars['ContainerName'],
+            Name=container['ContainerName'],
             Image=image,
             PortMappings=[ecs.PortMapping(
-                ContainerPort=self.vars['ContainerPort'],
-                Protocol=self.vars['ContainerProtocol'],
+                ContainerPort=container['ContainerPort'],
+                Protocol=container['ContainerProtocol'],
             )],
             LogConfiguration=ecs.LogConfiguration(
                 LogDriver='awslogs',
                 Options={
                     'awslogs-group': Ref(self.log_group),
                     'awslogs-region': Region,
-                    'awslogs-stream-prefix': self.vars['ContainerName'],
+                    'awslogs-stream-prefix': container['ContainerName'],
                 },
             ),
         )
-        # deal with additional attributes
-        if self.vars['AdditionalContainerAttributes']:
-            added = self.vars['AdditionalContainerAttributes']
-            # deal with troposphere AWSProperty objects
-            if 'Environment' in added:
-                added['Environment'] = [
-                    ecs.Environment(**m) for m in added['Environment']
-                ]
-            if 'ExtraHosts' in added:
-                added['ExtraHosts'] = [
-                    ecs.HostEntry(**m) for m in added['ExtraHosts']
-                ]
-            if 'LinuxParameters' in added:
-                added['LinuxParameters'] = [
-                    ecs.LinuxParameters(**m) for m in added['LinuxParameters']
-                ]
-            if 'MountPoints' in added:
-                added['MountPoints'] = [
-                    ecs.MountPoint(**m) for m in added['MountPoints']
-                ]
-            if 'Ulimit' in added:
-                added['Ulimit'] = [
-                    ecs.Ulimit(**m) for m in added['Ulimit']
-                ]
-            if 'VolumesFrom' in added:
-                added['VolumesFrom'] = [
-                    ecs.VolumesFrom(**m) for m in added['VolumesFrom']
-                ]
-            # munge memory
-            if not 'Memory' in added and not 'MemoryReservation' in added:
-                added['MemoryReservation'] = self.vars['Memory']
-
-            attributes  = added.copy()
-        else:
-            attributes = dict()
+        # convert additional attributes into troposphere AWSProperty objects
+        attributes = convert_properties(
+            ecs.ContainerDefinition,
+            container['AdditionalContainerAttributes'],
+        )
+        # munge memory
+        if attributes and not 'Memory' in attributes \
+                and not 'MemoryReservation' in attributes:
+            attributes['MemoryReservation'] = service['Memory']
 
         # merge in required attributes.
         attributes.update(required)
@@ -254,45 +631,56 @@ class ECSFargate(BaseTemplate):
         return log_group
 
 
-    def create_target_group(self):
+    def create_target_group(self, service):
         t = self.template
         required_attributes = dict(
-            Port=self.vars['ContainerPort'],
+            Port=service['Container']['ContainerPort'],
             Protocol=self.vars['TargetGroupProtocol'],
             TargetType='ip',
             VpcId=self.vars['VpcId'],
         )
-        if self.vars['HealthCheckAttributes']:
-            if 'Matcher' in self.vars['HealthCheckAttributes']:
-                self.vars['HealthCheckAttributes']['Matcher'] = elb.Matcher(
-                    **self.vars['HealthCheckAttributes']['Matcher']
-                )
-            tg_attributes = self.vars['HealthCheckAttributes'].copy()
-        else:
-            tg_attributes = dict()
+        tg_attributes = convert_properties(
+            elb.TargetGroup,
+            service['HealthCheckAttributes'],
+        )
         tg_attributes.update(required_attributes)
-        return t.add_resource(elb.TargetGroup("TargetGroup", **tg_attributes))
+        return t.add_resource(elb.TargetGroup(
+            service['Name'] + "TargetGroup",
+            **tg_attributes
+        ))
 
 
-    def create_listener_rule(self):
+    def rule_conditions(self, service):
+        conditions = []
+        if service['HostHeaders']:
+            conditions.append(elb.Condition(
+                Field="host-header",
+                Values=service['HostHeaders'],
+            ))
+        if service['PathPatterns']:
+            conditions.append(elb.Condition(
+                Field="path-pattern",
+                Values=service['PathPatterns'],
+            ))
+        return conditions
+
+
+    def create_listener_rule(self, service, listener_arn, priority):
         t = self.template
         listener_rule = t.add_resource(elb.ListenerRule(
-            "ListenerRule",
-            ListenerArn=self.vars['DefaultListener'],
-            Priority=1,
+            service['Name'] + "ListenerRule",
+            ListenerArn=listener_arn,
+            Priority=priority,
             Actions=[elb.Action(
                 Type="forward",
-                TargetGroupArn=Ref(self.target_group)
-            )],
-            Conditions=[elb.Condition(
-                Field="path-pattern",
-                Values=['/'],
+                TargetGroupArn=Ref(service['TargetGroup'])
             )],
+            Conditions=self.rule_conditions(service),
         ))
         return listener_rule
 
             
-    def create_listener(self):
+    def create_listener(self, service):
         t = self.template
         listener = t.add_resource(elb.Listener(
             "Listener",
@@ -301,7 +689,7 @@ class ECSFargate(BaseTemplate):
             LoadBalancerArn=self.vars['LoadBalancerArn'],
             DefaultActions=[elb.Action(
                 Type="forward",
-                TargetGroupArn=Ref(self.target_group)
+                TargetGroupArn=Ref(service['TargetGroup'])
             )],
             Certificates=[
                 elb.Certificate(CertificateArn=cert_arn)
@@ -311,39 +699,81 @@ class ECSFargate(BaseTemplate):
         return listener
 
 
-    def create_ecs_task(self):
+    def create_listeners(self, services):
+        """
+        Route ALB traffic to each service.  On port 80 every service gets
+        a rule on the ALB default listener.  Otherwise a new listener
+        forwards to the first service and the others get rules on it.
+        Rule priorities not given explicitly are allocated by
+        sceptremods.util.elb.allocate_priorities.
+        """
+        if self.vars['ListenerPort'] == 80:
+            listener_arn = self.vars['DefaultListener']
+            ruled = services
+        else:
+            listener = self.create_listener(services[0])
+            services[0]['Listener'] = listener
+            listener_arn = Ref(listener)
+            ruled = services[1:]
+        priorities = allocate_priorities(
+            [(s['HostHeaders'], s['PathPatterns'], s['Priority']) for s in ruled],
+            self.facts['ListenerRules'],
+        )
+        for service, priority in zip(ruled, priorities):
+            service['Listener'] = self.create_listener_rule(
+                service, listener_arn, priority)
+
+
+    def create_ecs_task(self, service):
         t = self.template
-        if not self.vars['TaskRoleArn']:
-            self.vars['TaskRoleArn'] = NoValue
+        if service['TaskRoleArn']:
+            task_role_arn = service['TaskRoleArn']
+        else:
+            task_role_arn = NoValue
         task_definition = t.add_resource(ecs.TaskDefinition(
-            'TaskDefinition',
+            service['Name'] + 'TaskDefinition',
             RequiresCompatibilities=['FARGATE'],
-            Family=self.vars['Family'],
-            Cpu=str(self.vars['Cpu']),
-            Memory=str(self.vars['Memory']),
+            Family=service['Family'],
+            Cpu=str(service['Cpu']),
+            Memory=str(service['Memory']),
             NetworkMode='awsvpc',
             ExecutionRoleArn=Join('', [
                 'arn:aws:iam::', 
                 AccountId, 
                 ':role/ecsTaskExecutionRole'
             ]),
-            TaskRoleArn=self.vars['TaskRoleArn'],
+            TaskRoleArn=task_role_arn,
             ContainerDefinitions=[
-                ecs.ContainerDefinition(**self.munge_container_attributes())
+                ecs.ContainerDefinition(
+                    **self.munge_container_attributes(container, service)
+                )
+                for container in service['Containers']
             ],
         ))
         return task_definition
 
 
-    def create_ecs_service(self):
+    def launch_attributes(self, service):
+        """
+        A capacity provider strategy and a launch type are mutually
+        exclusive.  Use the launch type when no strategy is given.
+        """
+        if service['CapacityProviderStrategy']:
+            return dict(CapacityProviderStrategy=[
+                ecs.CapacityProviderStrategyItem(**item)
+                for item in service['CapacityProviderStrategy']
+            ])
+        return dict(LaunchType='FARGATE')
+
+
+    def create_ecs_service(self, service):
         t = self.template
-        t.add_resource(ecs.Service(
-            'FargateService',
-            DependsOn=self.listener.title,
+        return t.add_resource(ecs.Service(
+            service['Name'] + 'FargateService',
+            DependsOn=service['Listener'].title,
             Cluster=self.vars['ClusterName'],
-            DesiredCount=self.vars['DesiredCount'],
-            TaskDefinition=Ref(self.task_definition),
-            LaunchType='FARGATE',
+            DesiredCount=NoValue if service['AutoScaling'] else service['DesiredCount'],
+            TaskDefinition=Ref(service['TaskDefinition']),
             NetworkConfiguration=ecs.NetworkConfiguration(
                 AwsvpcConfiguration=ecs.AwsvpcConfiguration(
                     Subnets=[s.strip() for s in self.vars['Subnets'].split(',')],
@@ -352,28 +782,111 @@ class ECSFargate(BaseTemplate):
             ),
             LoadBalancers=[
                 ecs.LoadBalancer(
-                    ContainerName=self.vars['ContainerName'],
-                    ContainerPort=self.vars['ContainerPort'],
-                    TargetGroupArn=Ref(self.target_group),
+                    ContainerName=service['Container']['ContainerName'],
+                    ContainerPort=service['Container']['ContainerPort'],
+                    TargetGroupArn=Ref(service['TargetGroup']),
                 ),
             ],
+            **self.launch_attributes(service)
+        ))
+
+
+    def create_autoscaling(self, service, ecs_service):
+        """
+        Register the ECS service as a scalable target, with target tracking
+        policies for each configured metric and any scheduled actions.
+        """
+        t = self.template
+        autoscaling = service['AutoScaling']
+        resource_id = Join('/', [
+            'service',
+            self.vars['ClusterName'],
+            GetAtt(ecs_service, 'Name'),
+        ])
+        scalable_target = t.add_resource(applicationautoscaling.ScalableTarget(
+            service['Name'] + 'ScalableTarget',
+            MinCapacity=autoscaling['MinCapacity'],
+            MaxCapacity=autoscaling['MaxCapacity'],
+            ResourceId=resource_id,
+            RoleARN=Join('', [
+                'arn:aws:iam::',
+                AccountId,
+                ':role/aws-service-role/ecs.application-autoscaling.amazonaws.com/'
+                'AWSServiceRoleForApplicationAutoScaling_ECSService',
+            ]),
+            ScalableDimension='ecs:service:DesiredCount',
+            ServiceNamespace='ecs',
+            ScheduledActions=[
+                applicationautoscaling.ScheduledAction(
+                    ScheduledActionName=action['Name'],
+                    Schedule=action['Schedule'],
+                    ScalableTargetAction=applicationautoscaling.ScalableTargetAction(
+                        MinCapacity=action.get('MinCapacity', NoValue),
+                        MaxCapacity=action.get('MaxCapacity', NoValue),
+                    ),
+                    StartTime=action.get('StartTime', NoValue),
+                    EndTime=action.get('EndTime', NoValue),
+                )
+                for action in autoscaling.get('ScheduledActions', list())
+            ] or NoValue,
         ))
+        for key, title, metric_type in TARGET_TRACKING_METRICS:
+            if key not in autoscaling:
+                continue
+            if metric_type == 'ALBRequestCountPerTarget':
+                resource_label = Join('/', [
+                    self.vars['LoadBalancerArn'].split(':loadbalancer/')[-1],
+                    GetAtt(service['TargetGroup'], 'TargetGroupFullName'),
+                ])
+            else:
+                resource_label = NoValue
+            t.add_resource(applicationautoscaling.ScalingPolicy(
+                service['Name'] + title + 'ScalingPolicy',
+                PolicyName=Join('-', [title, GetAtt(ecs_service, 'Name')]),
+                PolicyType='TargetTrackingScaling',
+                ScalingTargetId=Ref(scalable_target),
+                TargetTrackingScalingPolicyConfiguration=(
+                    applicationautoscaling.TargetTrackingScalingPolicyConfiguration(
+                        TargetValue=float(autoscaling[key]),
+                        ScaleInCooldown=autoscaling.get('ScaleInCooldown', NoValue),
+                        ScaleOutCooldown=autoscaling.get('ScaleOutCooldown', NoValue),
+                        PredefinedMetricSpecification=(
+                            applicationautoscaling.PredefinedMetricSpecification(
+                                PredefinedMetricType=metric_type,
+                                ResourceLabel=resource_label,
+                            )
+                        ),
+                    )
+                ),
+            ))
         return
 
 
-    def route53_record_set(self):
+    def service_fqdns(self, services):
+        """
+        Return the distinct DNS names to alias to the ALB: the top level
+        ServiceFqdn and that of each service.
+        """
+        fqdns = []
+        for fqdn in [self.vars['ServiceFqdn']] + [s['ServiceFqdn'] for s in services]:
+            if fqdn and fqdn not in fqdns:
+                fqdns.append(fqdn)
+        return fqdns
+
+
+    def route53_record_set(self, fqdns):
         t = self.template
         t.add_resource(route53.RecordSetGroup(
             "RecordSetGroup",
             HostedZoneName=self.vars["HostedZone"] + ".",
             RecordSets=[route53.RecordSet(
-                Name=self.vars['ServiceFqdn'] + ".",
+                Name=fqdn + ".",
                 Type="A",
                 AliasTarget=route53.AliasTarget(
-                    HostedZoneId=get_elb_hosted_zone_id(self.vars['LoadBalancerArn']),
+                    HostedZoneId=self.facts['ElbHostedZoneId'],
                     DNSName=self.vars['LoadBalancerUrl'],
                 ),
-            )],
+            ) for fqdn in fqdns],
         ))
         return
 
@@ -382,44 +895,68 @@ class ECSFargate(BaseTemplate):
 
         # Munge user_data
         self.vars = self.validate_user_data()
+        if self.facts is None:
+            self.prefetch()
+        if self.vars['Services'] and not self.vars['Family']:
+            raise ValueError(
+                "'Family' is required when 'Services' is specified. "
+                "It names the shared log group."
+            )
         if not self.vars['Family']:
             self.vars['Family'] = self.vars['ContainerName']
         if self.vars['Certificates']:
             self.protocol = 'HTTPS'
         else:
             self.protocol = 'HTTP'
-        #print(self.vars)
+        services = self.munge_services()
+        if self.vars['Services'] and self.vars['ServiceFqdn'] in [
+                s['ServiceFqdn'] for s in services]:
+            raise ValueError(
+                "ServiceFqdn '{}' of a service duplicates the top level "
+                "ServiceFqdn".format(self.vars['ServiceFqdn'])
+            )
+        for service in services:
+            if (service['AutoScaling'].get('RequestCountTarget')
+                    and ':loadbalancer/' not in self.vars['LoadBalancerArn']):
+                raise ValueError(
+                    "AutoScaling 'RequestCountTarget' requires a literal "
+                    "'LoadBalancerArn'"
+                )
 
         # CloudWatch
         self.log_group = self.create_log_group()
 
         # ELB
-        self.target_group = self.create_target_group()
-        if self.vars['ListenerPort'] == 80:
-            self.listener = self.create_listener_rule()
-        else:
-            self.listener = self.create_listener()
+        for service in services:
+            service['TargetGroup'] = self.create_target_group(service)
+        self.create_listeners(services)
 
         # ECS
-        self.task_definition = self.create_ecs_task()
-        self.create_ecs_service()
+        for service in services:
+            service['TaskDefinition'] = self.create_ecs_task(service)
+            ecs_service = self.create_ecs_service(service)
+            if service['AutoScaling']:
+                self.create_autoscaling(service, ecs_service)
 
         # Route53
-        if self.vars['ServiceFqdn']:
-            self.route53_record_set()
-            self.service_dns = self.vars['ServiceFqdn']
-        else:
-            self.service_dns = self.vars['LoadBalancerUrl']
+        fqdns = self.service_fqdns(services)
+        if fqdns:
+            self.route53_record_set(fqdns)
 
         # Outputs
-        self.template.add_output(Output(
-            "ServiceUrl",
-            Description="The fully qualified URL of the service",
-            Value='://'.join([
-                self.protocol.lower(),
-                self.service_dns,
-            ])
-        ))
+        for service in services:
+            hosts = ([service['ServiceFqdn']]
+                    + [h for h in service['HostHeaders'] if '*' not in h]
+                    + [self.vars['ServiceFqdn'], self.vars['LoadBalancerUrl']])
+            service_dns = [host for host in hosts if host][0]
+            self.template.add_output(Output(
+                service['Name'] + "ServiceUrl",
+                Description="The fully qualified URL of the service",
+                Value='://'.join([
+                    self.protocol.lower(),
+                    service_dns + url_path(service['PathPatterns']),
+                ])
+            ))
 
 
 #
@@ -427,6 +964,7 @@ class ECSFargate(BaseTemplate):
 #
 def sceptre_handler(sceptre_user_data):
     esc_service = ECSFargate(sceptre_user_data)
+    esc_service.prefetch()
     esc_service.create_template()
     return esc_service.template.to_json()
 
@@ -1,11 +1,18 @@
 """Generates a cloudformation template to build an RDS instance within an
-existing Virtual Private Cloud (VPC)."""
+existing Virtual Private Cloud (VPC).
+
+Optionally adds read replicas spread across AvailabilityZones, a custom
+DB parameter group, Performance Insights, enhanced monitoring, provisioned
+IOPS or gp3 throughput, and an RDS Proxy endpoint for connection pooling.
+The proxy authenticates with a Secrets Manager secret holding the database
+credentials (ProxySecretArn)."""
 
 import sys
 
 from troposphere import (
     GetAtt,
     Join,
+    NoValue,
     Output,
     Ref,
     rds,
@@ -13,6 +20,23 @@ from troposphere import (
 )
 
 from sceptremods.templates import BaseTemplate
+from sceptremods.util.rds import (
+    DBInstance,
+    add_db_proxy,
+    add_monitoring_role,
+    parameter_group_family,
+    validate_monitoring_interval,
+    validate_performance_insights_retention,
+    validate_storage_type,
+)
+
+
+#
+# sceptre_user_data validation functions
+#
+def validate_read_replicas(value):
+    if not 0 <= value <= 15:
+        raise ValueError("'ReadReplicas' must be between 0 and 15")
 
 
 #
@@ -21,6 +45,8 @@ from sceptremods.templates import BaseTemplate
 class RDS(BaseTemplate):
     """RDS sceptremods template class."""
 
+    OUTPUTS = ['DBEndPoint', 'DBPort', 'ReplicaEndPoints', 'ProxyEndPoint']
+
     VARSPEC = {
         # default values are just placeholders when testing troposphere syntax.
         'VpcId': {
@@ -78,10 +104,163 @@ class RDS(BaseTemplate):
             'default': False,
             'description': 'Whether to assign the RDS instance a publicly accessible IP address',
         },
+
+        # read replicas
+        "ReadReplicas": {
+            'type': int,
+            'default': 0,
+            'description': 'Number of read replicas of the DB instance',
+            'validator': validate_read_replicas,
+        },
+        "ReplicaClass": {
+            'type': str,
+            'default': str(),
+            'description': 'Instance class of read replicas.  Defaults to DBClass',
+        },
+        "AvailabilityZones": {
+            'type': list,
+            'default': list(),
+            'description': 'Availability zones to spread the DB instance and its read replicas across.  The DB instance goes in the first',
+        },
+
+        # parameters
+        "DBParameters": {
+            'type': dict,
+            'default': dict(),
+            'description': 'Database engine parameters for a custom DB parameter group applied to the DB instance and replicas',
+        },
+        "DBParameterGroupFamily": {
+            'type': str,
+            'default': str(),
+            'description': 'The DB parameter group family.  Derived from Engine and EngineVersion when empty',
+        },
+
+        # monitoring
+        "PerformanceInsights": {
+            'type': bool,
+            'default': False,
+            'description': 'Whether to enable Performance Insights',
+        },
+        "PerformanceInsightsRetention": {
+            'type': int,
+            'default': 7,
+            'description': 'Days to retain Performance Insights data: 7, 731 or a multiple of 31',
+            'validator': validate_performance_insights_retention,
+        },
+        "MonitoringInterval": {
+            'type': int,
+            'default': 0,
+            'description': 'Seconds between enhanced monitoring metric collections.  0 disables enhanced monitoring',
+            'validator': validate_monitoring_interval,
+        },
+
+        # storage
+        "StorageType": {
+            'type': str,
+            'default': str(),
+            'description': 'Storage type: standard, gp2, gp3, io1 or io2.  Empty uses the RDS default',
+            'validator': validate_storage_type,
+        },
+        "Iops": {
+            'type': int,
+            'default': 0,
+            'description': 'Provisioned IOPS.  Requires StorageType io1, io2 or gp3',
+        },
+        "StorageThroughput": {
+            'type': int,
+            'default': 0,
+            'description': 'Storage throughput in MiBps.  Requires StorageType gp3',
+        },
+
+        # RDS Proxy
+        "Proxy": {
+            'type': bool,
+            'default': False,
+            'description': 'Whether to create an RDS Proxy endpoint pooling connections to the DB instance',
+        },
+        "ProxySecretArn": {
+            'type': str,
+            'default': str(),
+            'description': 'ARN of a Secrets Manager secret with the database username and password.  Required by Proxy',
+        },
     }
 
+    def check_vars(self):
+        if self.vars['Iops'] and self.vars['StorageType'] not in ['io1', 'io2', 'gp3']:
+            raise ValueError("'Iops' requires StorageType io1, io2 or gp3")
+        if self.vars['StorageThroughput'] and self.vars['StorageType'] != 'gp3':
+            raise ValueError("'StorageThroughput' requires StorageType gp3")
+        if self.vars['Proxy'] and not self.vars['ProxySecretArn']:
+            raise ValueError("'Proxy' requires 'ProxySecretArn'")
+
+    def availability_zone(self, index):
+        zones = self.vars['AvailabilityZones']
+        if not zones:
+            return NoValue
+        return zones[index % len(zones)]
+
+    def instance_attributes(self):
+        """Attributes shared by the DB instance and its read replicas."""
+        attributes = dict(
+            VPCSecurityGroups=self.vars['SecurityGroups'],
+            PubliclyAccessible=self.vars['PubliclyAccessible'],
+        )
+        if self.vars['DBParameters']:
+            attributes['DBParameterGroupName'] = Ref(self.parameter_group)
+        if self.vars['PerformanceInsights']:
+            attributes['EnablePerformanceInsights'] = True
+            attributes['PerformanceInsightsRetentionPeriod'] = \
+                    self.vars['PerformanceInsightsRetention']
+        if self.vars['MonitoringInterval']:
+            attributes['MonitoringInterval'] = self.vars['MonitoringInterval']
+            attributes['MonitoringRoleArn'] = GetAtt(self.monitoring_role, 'Arn')
+        return attributes
+
+    def storage_attributes(self):
+        """
+        Storage settings of the DB instance, repeated on read replicas so
+        they keep its size, provisioned iops and throughput.
+        """
+        attributes = dict(AllocatedStorage=self.vars['DBAllocatedStorage'])
+        for key in ['StorageType', 'Iops', 'StorageThroughput']:
+            if self.vars[key]:
+                attributes[key] = self.vars[key]
+        return attributes
+
+    def create_parameter_group(self):
+        return self.template.add_resource(rds.DBParameterGroup(
+            "DBParameterGroup",
+            Description="Parameters for the RDS DB Instance",
+            Family=(self.vars['DBParameterGroupFamily'] or parameter_group_family(
+                self.vars['Engine'], self.vars['EngineVersion'])),
+            Parameters=self.vars['DBParameters'],
+        ))
+
+    def create_read_replicas(self):
+        t = self.template
+        replicas = []
+        replica_attributes = self.instance_attributes()
+        replica_attributes.update(self.storage_attributes())
+        for index in range(1, self.vars['ReadReplicas'] + 1):
+            replicas.append(t.add_resource(DBInstance(
+                "DBReplica%s" % index,
+                SourceDBInstanceIdentifier=Ref(self.db_instance),
+                Engine=self.vars['Engine'],
+                DBInstanceClass=self.vars['ReplicaClass'] or self.vars['DBClass'],
+                AvailabilityZone=self.availability_zone(index),
+                **replica_attributes
+            )))
+        t.add_output(Output(
+            "ReplicaEndPoints",
+            Description="Comma separated list of RDS read replica endpoints",
+            Value=Join(',', [GetAtt(replica, "Endpoint.Address")
+                    for replica in replicas]),
+        ))
+        return replicas
+
     def create_template(self):
         self.vars = self.validate_user_data()
+        self.check_vars()
         t = self.template
         t.add_description(
             "Sceptre stack - create an RDS DBInstance in an existing VPC."
@@ -93,20 +272,45 @@ class RDS(BaseTemplate):
             SubnetIds=[s.strip() for s in self.vars['Subnets'].split(',')],
         ))
 
-        self.db_instance = t.add_resource(rds.DBInstance(
+        if self.vars['DBParameters']:
+            self.parameter_group = self.create_parameter_group()
+        if self.vars['MonitoringInterval']:
+            self.monitoring_role = add_monitoring_role(t)
+
+        instance_attributes = self.instance_attributes()
+        instance_attributes.update(self.storage_attributes())
+        if self.vars['AvailabilityZones']:
+            instance_attributes['AvailabilityZone'] = self.availability_zone(0)
+        self.db_instance = t.add_resource(DBInstance(
             "DBInstance",
             DBName=self.vars['DBName'],
-            AllocatedStorage=self.vars['DBAllocatedStorage'],
             DBInstanceClass=self.vars['DBClass'],
             Engine=self.vars['Engine'],
             EngineVersion=self.vars['EngineVersion'],
             MasterUsername=self.vars['DBUser'],
             MasterUserPassword=self.vars['DBPassword'],
             DBSubnetGroupName=Ref(self.db_subnet_group),
-            VPCSecurityGroups=self.vars['SecurityGroups'],
-            PubliclyAccessible=self.vars['PubliclyAccessible'],
+            **instance_attributes
         ))
 
+        if self.vars['ReadReplicas']:
+            self.replicas = self.create_read_replicas()
+
+        if self.vars['Proxy']:
+            proxy = add_db_proxy(
+                t,
+                self.vars['Engine'],
+                self.vars['ProxySecretArn'],
+                [s.strip() for s in self.vars['Subnets'].split(',')],
+                self.vars['SecurityGroups'],
+                instance_ids=[Ref(self.db_instance)],
+            )
+            t.add_output(Output(
+                "ProxyEndPoint",
+                Description="RDS Proxy endpoint",
+                Value=GetAtt(proxy, "Endpoint"),
+            ))
+
         t.add_output(Output(
             "DBEndPoint",
             Description="RDS DB instance endpoint",
@@ -25,7 +25,7 @@ in a vpc.yaml file.  Example:
         ingress_rules:
           - port: 80
             proto: tcp
-            source_ip
+            source_ip: 0.0.0.0/0
           - port: 443
             proto: tcp
             source_ip: 128.48.0.0/16
@@ -34,10 +34,44 @@ in a vpc.yaml file.  Example:
         ingress_rules:
           - source_sg: PublicSecurityGroup
 
+Large cidr allowlists can be read from files instead of inlined as
+'ingress_rules'.  Give a file path, or list of paths, relative to the
+sceptre project directory in 'ingress_rules_file'.  Entries lacking a port
+or protocol take them from 'ingress_defaults'.  Supported formats are csv
+(source_ip,port,proto), json or jsonl (cidrs or rule dictionaries), or plain
+text with one cidr per line.  Example:
+
+      - name: PartnerSG
+        description: allow partner networks on https
+        ingress_rules_file: allowlists/partners.txt
+        ingress_defaults:
+          port: 443
+          proto: tcp
+
+Set 'StandaloneIngressRules' to emit each ingress rule as its own
+SecurityGroupIngress resource named ${group}Ingress${hash}.  The hash covers
+the rule only, so adding or removing a rule leaves the others untouched on
+stack update.
+
+Ingress rules are compacted before rendering: duplicates are removed,
+overlapping or adjacent port ranges from the same source are merged, and
+cidr blocks sharing protocol and ports are aggregated into supernets.  A
+group still holding more than 'MaxRulesPerGroup' rules is split into chained
+groups (e.g. PublicSG, PublicSG2) and rules sourced from it reference every
+group in the chain.  A 'source_sg' naming no group in the stack is a Ref,
+unless it is a security group ID (sg-...) used as is.  The '${name}' output only holds the first group of a
+chain, so stacks consuming it see only that group's rules once the group is
+split; consume the comma separated '${name}Groups' output instead.  A chain
+which feeds its own growth, as a group sourcing itself with
+'MaxRulesPerGroup' 1, is rejected.
+
 """
 
 
+import os
 import sys
+import json
+import hashlib
 
 from troposphere import (
     AccountId,
@@ -50,7 +84,57 @@ from troposphere import (
     ec2,
 )
 
-from sceptremods.templates import BaseTemplate
+from sceptremods.templates import BaseTemplate, is_plain
+from sceptremods.util.sg_rules import (
+    MAX_RULES_PER_GROUP,
+    SECURITY_GROUP,
+    RuleArray,
+    compact_rules,
+    normalize_rule,
+    read_rule_file,
+    rule_attributes,
+    split_rules,
+)
+
+# CloudFormation resources per template
+MAX_RESOURCES = 500
+
+
+def rule_files(sg_params):
+    paths = sg_params.get('ingress_rules_file', list())
+    if not isinstance(paths, list):
+        paths = [paths]
+    return paths
+
+
+#
+# sceptre_user_data validation functions
+#
+def validate_security_groups(security_groups):
+    names = list()
+    for sg_params in security_groups:
+        for key in ['name', 'description']:
+            if not key in sg_params:
+                raise ValueError("Security groups must have '{}' field".format(key))
+        names.append(sg_params['name'])
+        for rule in sg_params.get('ingress_rules', list()):
+            normalize_rule(rule)
+        for path in rule_files(sg_params):
+            if not os.path.isfile(path):
+                raise ValueError("Ingress rules file '{}' not found".format(path))
+        for key in sg_params.get('ingress_defaults', dict()):
+            if key not in ['port', 'proto']:
+                raise ValueError("Keys of 'ingress_defaults' must be one of "
+                                 "['port', 'proto']")
+    if len(set(names)) != len(names):
+        raise ValueError("Security group names must be unique")
+    return True
+
+
+def validate_max_rules(count):
+    if count < 1:
+        raise ValueError("Value of 'MaxRulesPerGroup' must be a positive integer")
+    return True
 
 
 #
@@ -58,6 +142,8 @@ from sceptremods.templates import BaseTemplate
 #
 class SG(BaseTemplate):
 
+    OUTPUTS = ['PublicSG', 'PrivateSG']
+
     VARSPEC = {
         'VpcId': {
             'type': str,
@@ -84,54 +170,186 @@ class SG(BaseTemplate):
                     ],
                 ),
             ],
+            'validator': validate_security_groups,
+        },
+        'CompactRules': {
+            'type': bool,
+            'default': True,
+            'description': 'Whether or not to deduplicate ingress rules, merge adjacent port ranges and aggregate cidr blocks into supernets.',
+        },
+        'MaxRulesPerGroup': {
+            'type': int,
+            'default': MAX_RULES_PER_GROUP,
+            'description': 'Maximum number of ingress rules per security group.  Groups with more rules get split into chained groups named ${name}2, ${name}3, etc.  The ${name} output then holds only the first group; consume ${name}Groups instead.',
+            'validator': validate_max_rules,
+        },
+        'StandaloneIngressRules': {
+            'type': bool,
+            'default': False,
+            'description': 'Whether or not to define ingress rules as separate SecurityGroupIngress resources instead of inline in the security group.  Logical IDs derive from the group name and a hash of each rule, so a stack update only touches rules which changed, or moved between chained groups.',
         },
     }
 
+
+    @classmethod
+    def stack_outputs(cls, user_data):
+        """
+        Outputs are named after the security groups in user data, plus any
+        chained groups and their '<name>Groups' lists.
+        """
+        user_data = user_data or dict()
+        variables = dict((name, user_data.get(name, spec['default']))
+                for name, spec in cls.VARSPEC.items() if name != 'VpcId')
+        if not is_plain(variables):
+            return None
+        sg = cls()
+        sg.vars = variables
+        try:
+            group_names = sg.chain_group_names(sg.munge_ingress_rules())
+        except (KeyError, ValueError, IOError, OSError):
+            return None
+        outputs = list()
+        for name, titles in group_names.items():
+            outputs.extend(titles)
+            if len(titles) > 1:
+                outputs.append('%sGroups' % name)
+        return sorted(outputs)
+
+
+    def munge_ingress_rules(self):
+        """Normalize and compact ingress rules of each security group."""
+        ingress_rules = dict()
+        for sg_params in self.vars['SecurityGroups']:
+            rules = [normalize_rule(rule)
+                    for rule in sg_params.get('ingress_rules', list())]
+            rule_array = RuleArray()
+            for path in rule_files(sg_params):
+                read_rule_file(path, sg_params.get('ingress_defaults'), rule_array)
+            if self.vars['CompactRules']:
+                rules = compact_rules(rules, rule_array)
+            else:
+                # only drop duplicates, which would share a standalone
+                # ingress rule's logical ID
+                rules.extend(rule_array)
+                seen = set()
+                rules = [r for r in rules if not (r in seen or seen.add(r))]
+            ingress_rules[sg_params['name']] = rules
+        return ingress_rules
+
+
+    def chain_group_names(self, ingress_rules):
+        """
+        Determine the chained group names for each security group.  A rule
+        sourced from a chained group expands into one rule per group in the
+        chain, so iterate until the chain lengths settle.  Raise ValueError
+        once the chains outgrow a template, as they do when they never
+        settle, e.g. a group sourcing itself with MaxRulesPerGroup 1.
+        """
+        limit = self.vars['MaxRulesPerGroup']
+        chain_length = dict((name, 1) for name in ingress_rules)
+        changed = True
+        while changed:
+            changed = False
+            for name, rules in ingress_rules.items():
+                count = sum(chain_length.get(r.source, 1)
+                        if r.source_type == SECURITY_GROUP else 1 for r in rules)
+                length = max(1, -(-count // limit))
+                if length != chain_length[name]:
+                    chain_length[name] = length
+                    changed = True
+            if sum(chain_length.values()) > MAX_RESOURCES:
+                raise ValueError(
+                    "Chained security groups exceed {} resources.  Check "
+                    "for groups sourcing their own chain, or raise "
+                    "'MaxRulesPerGroup'".format(MAX_RESOURCES))
+        return dict(
+            (name, [name] + ['%s%d' % (name, i) for i in range(2, length + 1)])
+            for name, length in chain_length.items()
+        )
+
+
+    def expand_rule(self, rule):
+        """Return troposphere ingress rule keyword args for 'rule'."""
+        if rule.source_type != SECURITY_GROUP:
+            return [rule_attributes(rule)]
+        if rule.source in self.group_names:
+            sources = [Ref(name) for name in self.group_names[rule.source]]
+        elif str(rule.source).startswith('sg-'):
+            sources = [rule.source]
+        else:
+            sources = [Ref(rule.source)]
+        expanded = list()
+        for source in sources:
+            r_attr = rule_attributes(rule)
+            r_attr['SourceSecurityGroupId'] = source
+            expanded.append(r_attr)
+        return expanded
+
+
+    def ingress_rule_title(self, name, r_attr):
+        """
+        Stable logical ID for a standalone ingress rule of security group
+        'name'.  IDs derive from the base group name, not the chained group
+        holding the rule, so rules keep their ID when they move between
+        chained groups.  CloudFormation still replaces such a rule, as its
+        GroupId changes.
+        """
+        rule = json.dumps(
+            ec2.SecurityGroupRule(**r_attr).to_dict(), sort_keys=True)
+        digest = hashlib.sha1(rule.encode('utf-8')).hexdigest()[:12]
+        return '%sIngress%s' % (name, digest)
+
+
+    def create_security_group(self, name, title, description, rules):
+        t = self.template
+        sg_attributes = dict(
+            VpcId=self.vars['VpcId'],
+            GroupDescription=description,
+        )
+        if not self.vars['StandaloneIngressRules']:
+            sg_attributes['SecurityGroupIngress'] = [
+                ec2.SecurityGroupRule(**r_attr) for r_attr in rules
+            ]
+        security_group = t.add_resource(ec2.SecurityGroup(title, **sg_attributes))
+        if self.vars['StandaloneIngressRules']:
+            for r_attr in rules:
+                t.add_resource(ec2.SecurityGroupIngress(
+                    self.ingress_rule_title(name, r_attr),
+                    GroupId=GetAtt(security_group, 'GroupId'),
+                    **r_attr
+                ))
+        t.add_output(Output(
+            title,
+            Description=description,
+            Value=Ref(security_group)
+        ))
+        return security_group
+
+
     def create_template(self):
         self.vars = self.validate_user_data()
         t = self.template
 
+        ingress_rules = self.munge_ingress_rules()
+        self.group_names = self.chain_group_names(ingress_rules)
+
         self.security_groups = dict()
         for sg_params in self.vars['SecurityGroups']:
-            if 'ingress_rules' in sg_params:
-                ingress_rules = list()
-
-                # munge ingress rule attributes
-                r_attr = dict()
-                for rule in sg_params['ingress_rules']:
-
-                    if 'source_sg' in rule and rule['source_sg']:
-                        r_attr['SourceSecurityGroupId'] = Ref(rule['source_sg'])
-
-                    if 'source_ip' in rule and rule['source_ip']:
-                        r_attr['CidrIp'] = rule['source_ip']
-
-                    if 'port' in rule and rule['port']:
-                        if str(rule['port']).rfind('-') != -1:
-                            r_attr['ToPort'], r_attr['FromPort'] = str(rule['port']).split('-')
-                        else:
-                            r_attr['ToPort'] = str(rule['port'])
-                            r_attr['FromPort'] = str(rule['port'])
-
-                    if not 'proto' in rule:
-                        r_attr['IpProtocol'] = '-1'
-                    else:
-                        r_attr['IpProtocol'] = rule['proto']
-
-                    ingress_rules.append(ec2.SecurityGroupRule(**r_attr))
-
-            self.security_groups[sg_params['name']] = t.add_resource(ec2.SecurityGroup(
-                sg_params['name'],
-                VpcId=self.vars['VpcId'],
-                GroupDescription=sg_params['description'],
-                SecurityGroupIngress=ingress_rules,
-            ))
-
-            t.add_output(Output(
-                sg_params['name'],
-                Description=sg_params['description'],
-                Value=Ref(self.security_groups[sg_params['name']])
-            ))
+            name = sg_params['name']
+            rules = list()
+            for rule in ingress_rules[name]:
+                rules.extend(self.expand_rule(rule))
+            chunks = split_rules(rules, self.vars['MaxRulesPerGroup'])
+            for title, chunk in zip(self.group_names[name], chunks):
+                self.security_groups[title] = self.create_security_group(
+                    name, title, sg_params['description'], chunk)
+            if len(chunks) > 1:
+                t.add_output(Output(
+                    '%sGroups' % name,
+                    Description='Comma separated list of chained security groups',
+                    Value=Join(',', [Ref(self.security_groups[title])
+                            for title in self.group_names[name]]),
+                ))
 
 
 #
@@ -8,6 +8,10 @@ AWS resources created:
     NatGatways in Public subnets
     RouteTables and default routes for all subnets.
 
+Set 'ShareRouteTables' to merge route tables having identical routes.  With
+the custom subnets below, App and DB subnets in the same AZ share one route
+table through the Web NatGateway in that AZ.
+
 By default we build a Public and a Private subnet in each of 2
 AvailabilityZones.  To add custom subnets or span additional AZs, specify
 alternative sceptre_user_data values in a vpc.yaml file.  Example:
@@ -36,6 +40,7 @@ alternative sceptre_user_data values in a vpc.yaml file.  Example:
 
 import sys
 import os
+import json
 from troposphere import (
     Template,
     Ref,
@@ -48,7 +53,7 @@ from troposphere import (
     ec2
 )
 
-from sceptremods.templates import BaseTemplate
+from sceptremods.templates import BaseTemplate, is_plain
 
 
 #
@@ -124,6 +129,8 @@ def validate_custom_subnets(custom_subnets):
 #
 class VPC(BaseTemplate):
 
+    OUTPUTS = ['AvailabilityZones', 'VpcId', 'CIDR', 'PublicSubnets', 'PrivateSubnets']
+
     VARSPEC = {
         'VpcCIDR': {
             'type': str,
@@ -159,6 +166,11 @@ class VPC(BaseTemplate):
                            Required for subnets of net_type 'private'."""),
             'validator': validate_custom_subnets,
         },
+        'ShareRouteTables': {
+            'type': bool,
+            'default': False,
+            'description': "Whether or not to merge route tables having identical routes into a single shared route table.  For example, private subnets routing through the same NatGateway in an AZ share one route table.",
+        },
         'Tags': {
             'type': dict,
             'default': dict(),
@@ -166,6 +178,20 @@ class VPC(BaseTemplate):
         },
     }
 
+    @classmethod
+    def stack_outputs(cls, user_data):
+        """Subnet list outputs are named after the subnets in user data."""
+        user_data = user_data or dict()
+        subnets = dict()
+        if user_data.get('UseDefaultSubnets', True):
+            subnets.update(DEFAULT_SUBNETS)
+        custom_subnets = user_data.get('CustomSubnets', dict())
+        if not isinstance(custom_subnets, dict) or not is_plain(list(custom_subnets)):
+            return None
+        subnets.update(custom_subnets)
+        return ['AvailabilityZones', 'VpcId', 'CIDR'] + sorted(
+            '%sSubnets' % name for name in subnets)
+
     def munge_subnets(self):
         # compose subnet definitions dictionary
         subnets = dict()
@@ -338,6 +364,55 @@ class VPC(BaseTemplate):
                             NatGatewayId=Ref(nat_gateway)))
 
 
+    def share_route_tables(self):
+        # Post process the generated resources.  Route tables with identical
+        # route sets collapse into the first such table (by name).  Routes
+        # of the dropped tables get removed and subnet associations point to
+        # the surviving table.
+        t = self.template
+        route_sets = dict()
+        for name, resource in t.resources.items():
+            if isinstance(resource, ec2.RouteTable):
+                route_sets.setdefault(name, list())
+        for name, resource in t.resources.items():
+            if isinstance(resource, ec2.Route):
+                properties = resource.to_dict()['Properties']
+                route_table = properties.pop('RouteTableId')['Ref']
+                route_sets[route_table].append(
+                        json.dumps(properties, sort_keys=True))
+
+        survivors = dict()
+        replaced = dict()
+        for route_table in sorted(route_sets):
+            signature = tuple(sorted(route_sets[route_table]))
+            if signature in survivors:
+                replaced[route_table] = survivors[signature]
+            else:
+                survivors[signature] = route_table
+        if not replaced:
+            return
+
+        for name, resource in list(t.resources.items()):
+            if isinstance(resource, ec2.RouteTable) and name in replaced:
+                del t.resources[name]
+            elif isinstance(resource, ec2.Route):
+                if resource.RouteTableId.data['Ref'] in replaced:
+                    del t.resources[name]
+            elif isinstance(resource, ec2.SubnetRouteTableAssociation):
+                route_table = resource.RouteTableId.data['Ref']
+                if route_table in replaced:
+                    resource.RouteTableId = Ref(replaced[route_table])
+
+        for name in self.subnets.keys():
+            route_table = self.subnets[name]['route_table']
+            if isinstance(route_table, list):
+                self.subnets[name]['route_table'] = [
+                        replaced.get(rt, rt) for rt in route_table]
+            else:
+                self.subnets[name]['route_table'] = replaced.get(
+                        route_table, route_table)
+
+
     def create_template(self):
         self.variables = self.validate_user_data()
         self.subnets = self.munge_subnets()
@@ -351,6 +426,8 @@ class VPC(BaseTemplate):
         self.create_route_table_associations()
         self.create_default_routes_for_public_subnets()
         self.create_default_routes_for_private_subnets()
+        if self.variables['ShareRouteTables']:
+            self.share_route_tables()
         ## debugging
         #print('variables: %s' % self.variables)
         #print('zones: %s' % self.zones)
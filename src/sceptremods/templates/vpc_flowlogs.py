@@ -1,5 +1,37 @@
 """A troposphere module for generating an AWS cloudformation template defining
 a VPC Flow Logs configuration.
+
+Flow logs deliver to CloudWatch Logs by default.  With Destination 's3'
+they are written to an S3 bucket instead, without the log group and IAM
+role.  Parquet files with Hive compatible, per hour partitions keep Athena
+scans (and their cost) limited to the hours a query asks for, e.g.:
+
+  Destination: s3
+  FileFormat: parquet
+  HiveCompatiblePartitions: true
+  PerHourPartition: true
+  LogFormat: [srcaddr, dstaddr, srcport, dstport, protocol, bytes, action,
+              subnet-id, start, end]
+
+Objects are then keyed as
+  <prefix>/AWSLogs/aws-account-id=<account>/aws-service=vpcflowlogs/
+      aws-region=<region>/year=<yyyy>/month=<mm>/day=<dd>/hour=<hh>/<file>
+so 'MSCK REPAIR TABLE' or partition projection picks up the partitions.
+
+Targets attaches flow logs to several VPCs, subnets or network interfaces
+at once, all delivering to the same destination (and log group and role).
+Each target may override TrafficType and MaxAggregationInterval, e.g. to
+capture rejected traffic on a hot subnet at one minute resolution:
+
+  MaxAggregationInterval: 600
+  Targets:
+    - ResourceId: vpc-0123456789abcdef0
+    - ResourceId: subnet-0123456789abcdef0
+      TrafficType: REJECT
+      MaxAggregationInterval: 60
+    - ResourceId: eni-0123456789abcdef0
+
+ResourceType is inferred from the id prefix unless given.
 """
 
 import sys
@@ -8,16 +40,23 @@ from troposphere import (
     Join,
     Output,
     Ref,
+    AWSProperty,
     iam,
     logs,
     ec2,
+    s3,
 )
 from troposphere.iam import Policy as TropoPolicy
-from sceptremods.templates import BaseTemplate
+from troposphere.validators import boolean
+from sceptremods.templates import BaseTemplate, is_plain
+from sceptremods.util.props import with_props
 from sceptremods.util.policies import (
     flowlogs_assumerole_policy,
+    s3_arn,
     vpc_flow_log_cloudwatch_policy,
+    vpc_flow_log_s3_bucket_policy,
 )
+from sceptremods.util.elb import validate_log_prefix
 
 
 #
@@ -28,6 +67,30 @@ JOINED_TRAFFIC_TYPES = '/'.join(ALLOWED_TRAFFIC_TYPES)
 CLOUDWATCH_ROLE_NAME = "Role"
 FLOW_LOG_GROUP_NAME = "LogGroup"
 FLOW_LOG_STREAM_NAME = "LogStream"
+FLOW_LOG_BUCKET_NAME = "LogBucket"
+DESTINATION_TYPES = ["cloud-watch-logs", "s3"]
+FILE_FORMATS = ["plain-text", "parquet"]
+AGGREGATION_INTERVALS = [60, 600]
+DEFAULT_AGGREGATION_INTERVAL = 600
+# Flow log ResourceType per resource id prefix
+RESOURCE_TYPES = {
+    "vpc": "VPC",
+    "subnet": "Subnet",
+    "eni": "NetworkInterface",
+}
+TARGET_KEYS = ["ResourceId", "ResourceType", "TrafficType", "MaxAggregationInterval"]
+# Fields of the default (version 2) flow log format, in order
+DEFAULT_FLOW_LOG_FIELDS = [
+    "version", "account-id", "interface-id", "srcaddr", "dstaddr",
+    "srcport", "dstport", "protocol", "packets", "bytes", "start", "end",
+    "action", "log-status",
+]
+FLOW_LOG_FIELDS = DEFAULT_FLOW_LOG_FIELDS + [
+    "vpc-id", "subnet-id", "instance-id", "tcp-flags", "type",
+    "pkt-srcaddr", "pkt-dstaddr", "region", "az-id", "sublocation-type",
+    "sublocation-id", "pkt-src-aws-service", "pkt-dst-aws-service",
+    "flow-direction", "traffic-path",
+]
 LOG_RETENTION_VALUES = [
     1, 3, 5, 7, 14, 30, 60, 90, 120, 150,
     180, 365, 400, 545, 731, 1827, 3653
@@ -55,12 +118,122 @@ def validate_traffic_type(traffic_type):
         )
     return traffic_type
 
+def validate_destination(destination):
+    if destination not in DESTINATION_TYPES:
+        raise ValueError(
+            "Destination must be one of the following: {}".format(
+             '/'.join(DESTINATION_TYPES))
+        )
+    return destination
+
+def validate_file_format(file_format):
+    if file_format not in FILE_FORMATS:
+        raise ValueError(
+            "FileFormat must be one of the following: {}".format(
+             '/'.join(FILE_FORMATS))
+        )
+    return file_format
+
+def validate_log_format(fields):
+    unknown = [f for f in fields if f not in FLOW_LOG_FIELDS]
+    if unknown:
+        raise ValueError(
+            "Unknown flow log fields {}. Must be among: {}".format(
+                unknown, ' '.join(FLOW_LOG_FIELDS))
+        )
+    if len(set(fields)) != len(fields):
+        raise ValueError("LogFormat lists a field more than once")
+    return fields
+
+def validate_aggregation_interval(interval):
+    if interval not in AGGREGATION_INTERVALS:
+        raise ValueError(
+            "MaxAggregationInterval must be one of: {}".format(
+                AGGREGATION_INTERVALS)
+        )
+    return interval
+
+def resource_type(resource_id):
+    """Infer the flow log ResourceType from a resource id prefix."""
+    prefix = resource_id.split('-', 1)[0]
+    if prefix not in RESOURCE_TYPES:
+        raise ValueError(
+            "Cannot infer ResourceType of '{}'. Resource ids must start "
+            "with one of: {}".format(resource_id, '/'.join(
+                p + '-' for p in sorted(RESOURCE_TYPES)))
+        )
+    return RESOURCE_TYPES[prefix]
+
+def validate_targets(targets):
+    seen = set()
+    for target in targets:
+        if not isinstance(target, dict) or 'ResourceId' not in target:
+            raise ValueError(
+                "Each of Targets must be a dict with a ResourceId key"
+            )
+        unknown = set(target) - set(TARGET_KEYS)
+        if unknown:
+            raise ValueError(
+                "Unknown keys {} in target {}. Valid keys: {}".format(
+                    sorted(unknown), target['ResourceId'], TARGET_KEYS)
+            )
+        if target['ResourceId'] in seen:
+            raise ValueError(
+                "Target {} listed more than once".format(target['ResourceId'])
+            )
+        seen.add(target['ResourceId'])
+        if 'ResourceType' in target:
+            if target['ResourceType'] not in RESOURCE_TYPES.values():
+                raise ValueError(
+                    "ResourceType must be one of the following: {}".format(
+                        '/'.join(sorted(RESOURCE_TYPES.values())))
+                )
+        else:
+            resource_type(target['ResourceId'])
+        if 'TrafficType' in target:
+            validate_traffic_type(target['TrafficType'])
+        if 'MaxAggregationInterval' in target:
+            validate_aggregation_interval(target['MaxAggregationInterval'])
+    return targets
+
+def flow_log_title(resource_id):
+    """Return the FlowLog resource title for a target resource id."""
+    return FLOW_LOG_STREAM_NAME + ''.join(
+        part.capitalize() for part in resource_id.split('-') if part.isalnum()
+    )
+
+def log_format(fields):
+    """Return the LogFormat string for a list of flow log field names."""
+    return ' '.join('${%s}' % field for field in fields)
+
+
+#
+# Properties missing from older troposphere releases
+#
+class DestinationOptions(AWSProperty):
+    props = {
+        'FileFormat': (str, True),
+        'HiveCompatiblePartitions': (boolean, True),
+        'PerHourPartition': (boolean, True),
+    }
+
+
+FlowLog = with_props(
+    ec2.FlowLog,
+    DestinationOptions=(DestinationOptions, False),
+)
+
 
 #
 # The template class
 #
 class FlowLogs(BaseTemplate):
 
+    OUTPUTS = [
+        "LogGroupName", "LogGroupArn", "RoleName", "RoleArn", "LogStreamName",
+        "LogBucketName", "LogDestination",
+    ]
+
     VARSPEC = {
         "Retention": {
             "type": int,
@@ -81,6 +254,59 @@ class FlowLogs(BaseTemplate):
             "default": "ALL",
             "validator": validate_traffic_type,
         },
+        "Targets": {
+            "type": list,
+            "description": "List of dicts with keys ResourceId and optional ResourceType, TrafficType, MaxAggregationInterval. Replaces VpcId when given.",
+            "default": list(),
+            "validator": validate_targets,
+        },
+        "MaxAggregationInterval": {
+            "type": int,
+            "description": "Seconds over which a flow is aggregated into a record. Must be one of: {}".format(AGGREGATION_INTERVALS),
+            "default": DEFAULT_AGGREGATION_INTERVAL,
+            "validator": validate_aggregation_interval,
+        },
+        "Destination": {
+            "type": str,
+            "description": "Where flow logs are delivered. Must be one of the "
+                           "following: {}".format('/'.join(DESTINATION_TYPES)),
+            "default": "cloud-watch-logs",
+            "validator": validate_destination,
+        },
+        "LogBucket": {
+            "type": str,
+            "description": "Name of an existing S3 bucket for s3 delivery. When empty a bucket is created whose objects expire after Retention days.",
+            "default": "",
+        },
+        "LogPrefix": {
+            "type": str,
+            "description": "S3 key prefix for s3 delivery, without leading or trailing '/'.",
+            "default": "",
+            "validator": validate_log_prefix,
+        },
+        "FileFormat": {
+            "type": str,
+            "description": "Format of flow log files delivered to s3. Must be one of the "
+                           "following: {}".format('/'.join(FILE_FORMATS)),
+            "default": "parquet",
+            "validator": validate_file_format,
+        },
+        "HiveCompatiblePartitions": {
+            "type": bool,
+            "description": "Use Hive compatible (key=value) S3 prefixes for s3 delivery.",
+            "default": True,
+        },
+        "PerHourPartition": {
+            "type": bool,
+            "description": "Partition s3 flow logs per hour instead of per day.",
+            "default": True,
+        },
+        "LogFormat": {
+            "type": list,
+            "description": "Flow log fields to record, in order, e.g. [srcaddr, dstaddr, bytes, action]. Empty uses the default format.",
+            "default": list(),
+            "validator": validate_log_format,
+        },
         'Tags': {
             'type': dict,
             'default': dict(),
@@ -89,10 +315,26 @@ class FlowLogs(BaseTemplate):
     }
 
 
-    def create_template(self):
-        t = self.template
-        variables = self.validate_user_data()
+    @classmethod
+    def stack_outputs(cls, user_data):
+        """With Targets, each target has its own LogStream<Id>Name output."""
+        targets = (user_data or dict()).get('Targets')
+        if not targets:
+            return cls.OUTPUTS
+        if not is_plain(targets):
+            return None
+        return [o for o in cls.OUTPUTS if o != "%sName" % FLOW_LOG_STREAM_NAME] + [
+            "%sName" % flow_log_title(target.get("ResourceId", ""))
+            for target in targets if isinstance(target, dict)
+        ]
+
 
+    def create_cloudwatch_destination(self, variables):
+        """
+        Add the log group and delivery role.  Return the FlowLog
+        properties delivering to them.
+        """
+        t = self.template
         self.log_group = t.add_resource(
             logs.LogGroup(
                 FLOW_LOG_GROUP_NAME,
@@ -142,24 +384,146 @@ class FlowLogs(BaseTemplate):
                 Value=role_arn
             )
         )
+        return dict(
+            DeliverLogsPermissionArn=role_arn,
+            LogGroupName=Ref(FLOW_LOG_GROUP_NAME),
+        )
 
-        self.log_stream = t.add_resource(
-            ec2.FlowLog(
-                FLOW_LOG_STREAM_NAME,
-                DeliverLogsPermissionArn=role_arn,
-                LogGroupName=Ref(FLOW_LOG_GROUP_NAME),
+    def create_s3_destination(self, variables):
+        """
+        Add the log bucket unless LogBucket names an existing one.
+        Return the FlowLog properties delivering to it.
+        """
+        t = self.template
+        properties = dict()
+        if variables["LogBucket"]:
+            bucket_name = variables["LogBucket"]
+            bucket_arn = s3_arn(bucket_name)
+        else:
+            self.log_bucket = t.add_resource(
+                s3.Bucket(
+                    FLOW_LOG_BUCKET_NAME,
+                    DeletionPolicy="Retain",
+                    BucketEncryption=s3.BucketEncryption(
+                        ServerSideEncryptionConfiguration=[
+                            s3.ServerSideEncryptionRule(
+                                ServerSideEncryptionByDefault=s3.ServerSideEncryptionByDefault(
+                                    SSEAlgorithm="AES256",
+                                )
+                            )
+                        ]
+                    ),
+                    PublicAccessBlockConfiguration=s3.PublicAccessBlockConfiguration(
+                        BlockPublicAcls=True,
+                        BlockPublicPolicy=True,
+                        IgnorePublicAcls=True,
+                        RestrictPublicBuckets=True,
+                    ),
+                    LifecycleConfiguration=s3.LifecycleConfiguration(
+                        Rules=[
+                            s3.LifecycleRule(
+                                Id="ExpireFlowLogs",
+                                Status="Enabled",
+                                ExpirationInDays=variables["Retention"],
+                            )
+                        ]
+                    ),
+                )
+            )
+            bucket_name = Ref(self.log_bucket)
+            bucket_arn = GetAtt(self.log_bucket, "Arn")
+            # deliver only once the policy exists, lest AWS attach its own
+            bucket_policy = t.add_resource(
+                s3.BucketPolicy(
+                    "%sPolicy" % FLOW_LOG_BUCKET_NAME,
+                    Bucket=bucket_name,
+                    PolicyDocument=vpc_flow_log_s3_bucket_policy(
+                        bucket_arn, variables["LogPrefix"]
+                    ),
+                )
+            )
+            properties["DependsOn"] = bucket_policy.title
+
+        if variables["LogPrefix"]:
+            destination = Join("", [bucket_arn, "/", variables["LogPrefix"]])
+        else:
+            destination = bucket_arn
+        t.add_output(
+            Output(
+                "%sName" % FLOW_LOG_BUCKET_NAME,
+                Value=bucket_name
+            )
+        )
+        t.add_output(
+            Output(
+                "LogDestination",
+                Value=destination
+            )
+        )
+        properties.update(
+            LogDestinationType="s3",
+            LogDestination=destination,
+            DestinationOptions=DestinationOptions(
+                FileFormat=variables["FileFormat"],
+                HiveCompatiblePartitions=variables["HiveCompatiblePartitions"],
+                PerHourPartition=variables["PerHourPartition"],
+            ),
+        )
+        return properties
+
+    def create_template(self):
+        variables = self.validate_user_data()
+
+        if variables["Destination"] == "s3":
+            destination = self.create_s3_destination(variables)
+        else:
+            destination = self.create_cloudwatch_destination(variables)
+        if variables["LogFormat"]:
+            destination["LogFormat"] = log_format(variables["LogFormat"])
+
+        if variables["Targets"]:
+            targets = [
+                (flow_log_title(target["ResourceId"]), target)
+                for target in variables["Targets"]
+            ]
+        else:
+            targets = [(FLOW_LOG_STREAM_NAME, dict(
                 ResourceId=variables["VpcId"],
                 ResourceType="VPC",
-                TrafficType=variables["TrafficType"],
+            ))]
+        self.log_streams = []
+        for title, target in targets:
+            self.log_streams.append(
+                self.create_flow_log(title, target, destination, variables)
+            )
+        self.log_stream = self.log_streams[0]
+
+    def create_flow_log(self, title, target, destination, variables):
+        """Add a flow log for one target resource, with its output."""
+        t = self.template
+        properties = dict(destination)
+        interval = target.get(
+            "MaxAggregationInterval", variables["MaxAggregationInterval"])
+        if interval != DEFAULT_AGGREGATION_INTERVAL:
+            properties["MaxAggregationInterval"] = interval
+        log_stream = t.add_resource(
+            FlowLog(
+                title,
+                ResourceId=target["ResourceId"],
+                ResourceType=(target.get("ResourceType")
+                              or resource_type(target["ResourceId"])),
+                TrafficType=target.get("TrafficType", variables["TrafficType"]),
+                **properties
             )
         )
 
         t.add_output(
             Output(
-                "%sName" % FLOW_LOG_STREAM_NAME,
-                Value=Ref(self.log_stream)
+                "%sName" % title,
+                Value=Ref(log_stream)
             )
         )
+        return log_stream
 
 
 #
@@ -0,0 +1,269 @@
+"""
+Static per-region facts about AWS Elastic Load Balancing, helpers for ELB
+access log buckets, and the ALB listener rule priority allocator.
+"""
+
+import hashlib
+
+from troposphere import AccountId, Join, NoValue, Ref, Region, s3
+
+# Canonical hosted zone IDs of application load balancers.  Route53 alias
+# records pointing at an ALB need these.
+ALB_HOSTED_ZONE_IDS = {
+    "us-east-1": "Z35SXDOTRQ7X7K",
+    "us-east-2": "Z3AADJGX6KTTL2",
+    "us-west-1": "Z368ELLRRE2KJ0",
+    "us-west-2": "Z1H1FL5HABSF5",
+    "ca-central-1": "ZQSVJUPU6J1EY",
+    "eu-central-1": "Z215JYRZR1TBD5",
+    "eu-west-1": "Z32O12XQLNTSW2",
+    "eu-west-2": "ZHURV8PSTC4K8",
+    "eu-west-3": "Z3Q77PNBQS71R4",
+    "ap-northeast-1": "Z14GRHDCWA56QT",
+    "ap-northeast-2": "ZWKZPGTI48KDX",
+    "ap-southeast-1": "Z1LMS91P8CMLE5",
+    "ap-southeast-2": "Z1GM3OXH4ZPM65",
+    "ap-south-1": "ZP97RAFLXTNZK",
+    "sa-east-1": "Z2P70J7HTTTPLU",
+}
+
+
+# AWS accounts of the ELB service that deliver access logs to S3, per region.
+ELB_ACCOUNT_IDS = {
+    "us-east-1": "127311923021",
+    "us-east-2": "033677994240",
+    "us-west-1": "027434742980",
+    "us-west-2": "797873946194",
+    "af-south-1": "098369216593",
+    "ap-east-1": "754344448648",
+    "ap-south-1": "718504428378",
+    "ap-northeast-1": "582318560864",
+    "ap-northeast-2": "600734575887",
+    "ap-northeast-3": "383597477331",
+    "ap-southeast-1": "114774131450",
+    "ap-southeast-2": "783225319266",
+    "ap-southeast-3": "589379963580",
+    "ca-central-1": "985666609251",
+    "eu-central-1": "054676820928",
+    "eu-west-1": "156460612806",
+    "eu-west-2": "652711504416",
+    "eu-west-3": "009996457667",
+    "eu-south-1": "635631232127",
+    "eu-north-1": "897822967062",
+    "me-south-1": "076674570225",
+    "sa-east-1": "507241528517",
+    "us-gov-west-1": "048591011584",
+    "us-gov-east-1": "190560391635",
+    "cn-north-1": "638102146993",
+    "cn-northwest-1": "037604701340",
+}
+
+LOG_STORAGE_CLASSES = [
+    "STANDARD_IA",
+    "ONEZONE_IA",
+    "INTELLIGENT_TIERING",
+    "GLACIER",
+    "DEEP_ARCHIVE",
+]
+
+
+def arn_region(arn):
+    """Return the region field of an AWS ARN, or None."""
+    parts = str(arn).split(':')
+    if len(parts) > 3 and parts[0] == 'arn':
+        return parts[3]
+    return None
+
+
+#
+# ELB access log buckets
+#
+def elb_account_id_mapping():
+    """Return ELB_ACCOUNT_IDS as a cloudformation region mapping."""
+    return dict((region, {"ELBAccountId": account_id})
+            for region, account_id in sorted(ELB_ACCOUNT_IDS.items()))
+
+
+def validate_log_prefix(prefix):
+    if prefix.startswith('/') or prefix.endswith('/') or 'AWSLogs' in prefix:
+        raise ValueError(
+            "Log prefix '{}' must not begin or end with '/' or contain "
+            "'AWSLogs'".format(prefix)
+        )
+    return prefix
+
+
+def validate_log_transitions(transitions):
+    days = 0
+    for transition in transitions:
+        if not isinstance(transition, dict) or sorted(transition) != [
+                'Days', 'StorageClass']:
+            raise ValueError(
+                "Log transitions must be dictionaries with keys 'Days' and "
+                "'StorageClass'"
+            )
+        if transition['StorageClass'] not in LOG_STORAGE_CLASSES:
+            raise ValueError("Log transition 'StorageClass' must be one of "
+                    "{}".format(LOG_STORAGE_CLASSES))
+        if not isinstance(transition['Days'], int) or transition['Days'] <= days:
+            raise ValueError(
+                "Log transition 'Days' must be positive integers in "
+                "ascending order"
+            )
+        days = transition['Days']
+
+
+def validate_log_retention(days):
+    if days < 0:
+        raise ValueError("Log retention days must not be negative")
+
+
+def log_key_prefix(prefix):
+    """The key prefix under which ELB writes access logs."""
+    return '/'.join([p for p in [prefix, 'AWSLogs'] if p])
+
+
+def log_policy_resource(bucket, prefix):
+    """Bucket policy resource arn to which ELB may write access logs."""
+    return Join("/", [
+        Join("", ["arn:aws:s3:::", Ref(bucket)]),
+        log_key_prefix(prefix),
+        AccountId,
+        "*"
+    ])
+
+
+def log_location_template(bucket, prefix):
+    """
+    S3 location of access logs with the date partition as '${day}'
+    (yyyy/MM/dd).  ELB fixes this layout, so Athena can use it for partition
+    projection (storage.location.template) rather than listing partitions.
+    """
+    return Join("", [
+        "s3://", Ref(bucket), "/", log_key_prefix(prefix), "/", AccountId,
+        "/elasticloadbalancing/", Region, "/${day}",
+    ])
+
+
+def log_lifecycle_configuration(prefix, retention_days, transitions):
+    """
+    Return an S3 lifecycle configuration expiring access logs after
+    'retention_days' and moving them through storage class 'transitions'.
+    NoValue when neither is set.
+    """
+    if not retention_days and not transitions:
+        return NoValue
+    if retention_days and transitions and retention_days <= transitions[-1]['Days']:
+        raise ValueError("Log retention days must exceed the last transition days")
+    return s3.LifecycleConfiguration(Rules=[s3.LifecycleRule(
+        Id="AccessLogRetention",
+        Status="Enabled",
+        Prefix=log_key_prefix(prefix) + "/",
+        ExpirationInDays=retention_days or NoValue,
+        Transitions=[
+            s3.LifecycleRuleTransition(
+                StorageClass=transition["StorageClass"],
+                TransitionInDays=transition["Days"],
+            ) for transition in transitions
+        ] or NoValue,
+    )])
+
+
+#
+# ALB listener rule priorities
+#
+MAX_RULE_PRIORITY = 50000
+# Priorities are split into bands by rule specificity so that more specific
+# rules are evaluated first: rules with a host header before rules without,
+# then deeper literal paths before shallower ones.
+PRIORITY_BANDS = 20
+BAND_WIDTH = MAX_RULE_PRIORITY // PRIORITY_BANDS
+MAX_PATH_DEPTH = PRIORITY_BANDS // 2 - 1
+
+
+def rule_key(host_headers, path_patterns):
+    """Return a canonical, hashable form of a set of rule conditions."""
+    return (tuple(sorted(host_headers)), tuple(sorted(path_patterns)))
+
+
+def path_depth(path_pattern):
+    """
+    Rank how specific a path pattern is: two points per literal path
+    segment before the first wildcard, one for a partial segment.
+    """
+    literal = path_pattern.split('*')[0].split('?')[0]
+    segments = literal.split('/')
+    partial = 0
+    if literal != path_pattern:
+        # a wildcard ends the literal part mid segment
+        partial = int(bool(segments.pop()))
+    return 2 * len([s for s in segments if s]) + partial
+
+
+def rule_band(host_headers, path_patterns):
+    depth = min([path_depth(p) for p in path_patterns] or [0])
+    band = MAX_PATH_DEPTH - min(depth, MAX_PATH_DEPTH)
+    if not host_headers:
+        band += PRIORITY_BANDS // 2
+    return band
+
+
+def stable_hash(key):
+    return int(hashlib.sha1(repr(key).encode('utf-8')).hexdigest(), 16)
+
+
+def allocate_priorities(rules, existing=()):
+    """
+    Return a conflict free listener rule priority for each rule in 'rules',
+    a list of (host_headers, path_patterns, priority) tuples where a
+    priority of 0 asks for automatic allocation.
+
+    Automatic priorities come from a stable hash of the rule conditions
+    within the band for its specificity, so adding or removing one rule
+    does not renumber the others.  'existing' is an optional snapshot of
+    rules already on the listener, as dicts with keys Priority, HostHeaders
+    and PathPatterns.  Their priorities are avoided, except that a rule
+    with identical conditions keeps its existing priority.
+    """
+    taken = set()
+    existing_priorities = dict()
+    for rule in existing:
+        taken.add(rule['Priority'])
+        existing_priorities[rule_key(
+            rule.get('HostHeaders', []), rule.get('PathPatterns', []))
+        ] = rule['Priority']
+
+    keys = [rule_key(hosts, paths) for hosts, paths, _ in rules]
+    if len(set(keys)) != len(keys):
+        raise ValueError("Listener rules must have distinct conditions")
+    priorities = [None] * len(rules)
+    explicit = set()
+    for index, (_, _, priority) in enumerate(rules):
+        if priority:
+            if priority in explicit:
+                raise ValueError(
+                    "Listener rule priority {} used twice".format(priority))
+            explicit.add(priority)
+            priorities[index] = priority
+    taken.update(explicit)
+    for index, key in enumerate(keys):
+        if priorities[index] is None and key in existing_priorities:
+            if existing_priorities[key] not in explicit:
+                priorities[index] = existing_priorities.pop(key)
+
+    for index in sorted(range(len(rules)), key=lambda i: keys[i]):
+        if priorities[index] is not None:
+            continue
+        hosts, paths, _ = rules[index]
+        base = rule_band(hosts, paths) * BAND_WIDTH + 1
+        offset = stable_hash(keys[index])
+        for probe in range(BAND_WIDTH):
+            priority = base + (offset + probe) % BAND_WIDTH
+            if priority not in taken:
+                break
+        else:
+            raise ValueError(
+                "No free listener rule priority for conditions {}".format(keys[index]))
+        taken.add(priority)
+        priorities[index] = priority
+    return priorities
@@ -0,0 +1,156 @@
+"""
+Resolve external facts that template modules need at render time.
+
+Template classes declare the facts they need in BaseTemplate.LOOKUPS.
+BaseTemplate.prefetch() resolves them all concurrently before
+create_template() runs, so that rendering itself makes no AWS calls.
+
+Resolvers look in static tables first, then in a cache, and only then
+make a live AWS call.  Live results are kept in memory and in a json cache
+file (SCEPTREMODS_LOOKUP_CACHE, default ~/.sceptremods/lookup-cache.json).
+Facts which change, such as listener rules, are cached only for a few
+minutes.  With SCEPTREMODS_OFFLINE set, a fact missing from tables and
+cache raises RuntimeError instead of calling AWS, and cached facts are used
+however old.
+"""
+
+import os
+import json
+import time
+import threading
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+
+from sceptremods.util import acm
+from sceptremods.util.elb import ALB_HOSTED_ZONE_IDS, arn_region
+
+
+CACHE_FILE = os.path.expanduser(os.environ.get(
+    'SCEPTREMODS_LOOKUP_CACHE', '~/.sceptremods/lookup-cache.json'))
+
+# seconds a snapshot of listener rules is reused
+LISTENER_RULES_TTL = 300
+
+_cache = None
+_lock = threading.Lock()
+
+
+def offline():
+    return bool(os.environ.get('SCEPTREMODS_OFFLINE'))
+
+
+def load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE) as f:
+                _cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            _cache = dict()
+    return _cache
+
+
+def save_cache():
+    try:
+        cache_dir = os.path.dirname(CACHE_FILE)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_file = '{}.{}'.format(CACHE_FILE, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump(_cache, f, indent=2, sort_keys=True)
+        os.rename(tmp_file, CACHE_FILE)
+    except (IOError, OSError):
+        pass
+
+
+def cached(namespace, key, func, *args, **kwargs):
+    """
+    Return the cached value of 'key' in 'namespace', calling func(*args)
+    and caching the result when not found.  With keyword 'ttl', values
+    are stored with the time fetched and refetched once 'ttl' seconds old,
+    unless offline.
+    """
+    ttl = kwargs.get('ttl')
+    with _lock:
+        cache = load_cache()
+        if key in cache.get(namespace, dict()):
+            entry = cache[namespace][key]
+            if ttl is None:
+                return entry
+            # entries cached without a time are refetched
+            if isinstance(entry, dict) and 'time' in entry and (
+                    offline() or time.time() - entry['time'] < ttl):
+                return entry['value']
+    if offline():
+        raise RuntimeError(
+            "Offline lookup of {} '{}' not found in cache {}".format(
+                namespace, key, CACHE_FILE)
+        )
+    value = func(*args)
+    with _lock:
+        entry = value if ttl is None else dict(value=value, time=time.time())
+        load_cache().setdefault(namespace, dict())[key] = entry
+        save_cache()
+    return value
+
+
+def resolve(lookups, variables, jobs=8):
+    """
+    Resolve the LOOKUPS of a template class concurrently.  Each lookup is a
+    function taking the validated user_data.  Returns a dict of facts.
+    """
+    if not lookups:
+        return dict()
+    with ThreadPoolExecutor(max_workers=min(jobs, len(lookups))) as executor:
+        futures = dict((name, executor.submit(lookup, variables))
+                for name, lookup in lookups.items())
+    return dict((name, future.result()) for name, future in futures.items())
+
+
+#
+# resolvers
+#
+def elb_hosted_zone_id(elb_arn):
+    """Return the canonical hosted zone Id of an application load balancer."""
+    region = arn_region(elb_arn)
+    if region in ALB_HOSTED_ZONE_IDS:
+        return ALB_HOSTED_ZONE_IDS[region]
+    return cached('elb_hosted_zone_id', elb_arn,
+            acm.get_elb_hosted_zone_id, elb_arn, region)
+
+
+def describe_listener_rules(listener_arn, region=None):
+    elb_client = boto3.client('elbv2', region_name=region)
+    paginator = elb_client.get_paginator('describe_rules')
+    rules = []
+    for page in paginator.paginate(ListenerArn=listener_arn):
+        for rule in page['Rules']:
+            if rule['IsDefault']:
+                continue
+            conditions = dict()
+            for condition in rule['Conditions']:
+                field = condition['Field']
+                config = dict(
+                    [('host-header', 'HostHeaderConfig'),
+                    ('path-pattern', 'PathPatternConfig')]
+                ).get(field)
+                values = condition.get('Values') or condition.get(
+                    config, dict()).get('Values', [])
+                conditions.setdefault(field, []).extend(values)
+            rules.append(dict(
+                Priority=int(rule['Priority']),
+                HostHeaders=conditions.get('host-header', []),
+                PathPatterns=conditions.get('path-pattern', []),
+            ))
+    return rules
+
+
+def listener_rules(listener_arn):
+    """
+    Return a snapshot of the rules on an ALB listener as dicts with keys
+    Priority, HostHeaders and PathPatterns.  Snapshots are reused for
+    LISTENER_RULES_TTL seconds, so rules other stacks add are soon seen.
+    """
+    return cached('listener_rules', listener_arn,
+            describe_listener_rules, listener_arn, arn_region(listener_arn),
+            ttl=LISTENER_RULES_TTL)
@@ -3,15 +3,18 @@
 from awacs.aws import (
     Action,
     Allow,
+    Condition,
     Policy,
     Principal,
     Statement,
+    StringEquals,
 )
 from awacs import (
     sts,
     s3,
     logs,
     ec2,
+    secretsmanager,
 )
 from troposphere import (
     Join,
@@ -186,3 +189,52 @@ def vpc_flow_log_cloudwatch_policy(log_group_arn):
             ),
         ]
     )
+
+
+def vpc_flow_log_s3_bucket_policy(bucket_arn, prefix=''):
+    """ Allow flow log delivery into bucket under optional key prefix. """
+    key_prefix = [prefix, '/'] if prefix else []
+    return Policy(
+        Statement=[
+            Statement(
+                Effect=Allow,
+                Principal=Principal('Service', ['delivery.logs.amazonaws.com']),
+                Action=[s3.PutObject],
+                Resource=[Join('', [bucket_arn, '/'] + key_prefix + [
+                    'AWSLogs/', AccountId, '/*'])],
+                Condition=Condition(StringEquals({
+                    's3:x-amz-acl': 'bucket-owner-full-control',
+                    'aws:SourceAccount': AccountId,
+                })),
+            ),
+            Statement(
+                Effect=Allow,
+                Principal=Principal('Service', ['delivery.logs.amazonaws.com']),
+                Action=[s3.GetBucketAcl, s3.ListBucket],
+                Resource=[bucket_arn],
+                Condition=Condition(StringEquals({
+                    'aws:SourceAccount': AccountId,
+                })),
+            ),
+        ]
+    )
+
+
+def rds_monitoring_assumerole_policy():
+    return make_simple_assume_policy("monitoring.rds.amazonaws.com")
+
+
+def rds_proxy_assumerole_policy():
+    return make_simple_assume_policy("rds.amazonaws.com")
+
+
+def rds_proxy_secret_policy(secret_arns):
+    return Policy(
+        Statement=[
+            Statement(
+                Effect=Allow,
+                Action=[secretsmanager.GetSecretValue],
+                Resource=secret_arns,
+            ),
+        ]
+    )
@@ -0,0 +1,77 @@
+"""
+Convert plain user_data dictionaries into troposphere property objects.
+
+Which properties of a troposphere class take AWSProperty objects (or lists
+of them) is read once per class from its 'props' metadata and cached.
+convert_properties() then walks the data recursively, so nested attributes
+such as LinuxParameters.Devices convert in one pass.
+
+with_props() extends a troposphere class with properties missing from
+older troposphere releases.
+"""
+
+from inspect import isclass
+
+from troposphere import AWSProperty
+
+
+_converters = dict()
+
+
+def property_converters(cls):
+    """
+    Return a dict mapping each property of troposphere class 'cls' that
+    takes AWSProperty objects to a tuple (property class, is_list).
+    """
+    if cls in _converters:
+        return _converters[cls]
+    converters = _converters[cls] = dict()
+    for name, (expected_type, _) in cls.props.items():
+        is_list = isinstance(expected_type, list) and len(expected_type) == 1
+        if is_list:
+            expected_type = expected_type[0]
+        if isclass(expected_type) and issubclass(expected_type, AWSProperty):
+            converters[name] = (expected_type, is_list)
+    return converters
+
+
+def convert_property(cls, value):
+    """Return 'value' as an instance of troposphere property class 'cls'."""
+    if isinstance(value, dict):
+        return cls(**convert_properties(cls, value))
+    return value
+
+
+def convert_properties(cls, values):
+    """
+    Return a copy of dict 'values' with every value of a property of
+    troposphere class 'cls' that takes AWSProperty objects converted to
+    those objects.  Values which are not dicts (e.g. already converted
+    objects or intrinsic functions) are left as is.  'values' is not
+    modified.
+    """
+    converters = property_converters(cls)
+    converted = dict()
+    for name, value in values.items():
+        if name in converters:
+            property_cls, is_list = converters[name]
+            if is_list and isinstance(value, list):
+                value = [convert_property(property_cls, v) for v in value]
+            else:
+                value = convert_property(property_cls, value)
+        converted[name] = value
+    return converted
+
+
+def with_props(cls, **props):
+    """
+    Return a subclass of troposphere class 'cls' which also accepts
+    'props', unless troposphere already defines them.
+    """
+    missing = dict((name, prop) for name, prop in props.items()
+            if name not in cls.props)
+    if not missing:
+        return cls
+    merged = dict(cls.props)
+    merged.update(missing)
+    return type(cls.__name__, (cls,), dict(props=merged))
@@ -0,0 +1,154 @@
+"""
+Helpers shared by the rds and aurora template modules.
+"""
+
+from troposphere import AWSProperty, GetAtt, Join, Ref, StackName, iam, rds
+from troposphere.iam import Policy as TropoPolicy
+from troposphere.validators import double, integer
+
+from sceptremods.util.props import with_props
+from sceptremods.util.policies import (
+    rds_monitoring_assumerole_policy,
+    rds_proxy_assumerole_policy,
+    rds_proxy_secret_policy,
+)
+
+
+MONITORING_INTERVALS = [0, 1, 5, 10, 15, 30, 60]
+STORAGE_TYPES = ['standard', 'gp2', 'gp3', 'io1', 'io2']
+ENHANCED_MONITORING_POLICY = (
+    'arn:aws:iam::aws:policy/service-role/AmazonRDSEnhancedMonitoringRole'
+)
+# RDS Proxy engine family per database engine
+ENGINE_FAMILIES = {
+    'postgres': 'POSTGRESQL',
+    'aurora-postgresql': 'POSTGRESQL',
+    'mysql': 'MYSQL',
+    'mariadb': 'MYSQL',
+    'aurora-mysql': 'MYSQL',
+}
+
+
+#
+# Properties missing from older troposphere releases
+#
+class ServerlessV2ScalingConfiguration(AWSProperty):
+    props = {
+        'MinCapacity': (double, True),
+        'MaxCapacity': (double, True),
+    }
+
+
+DBInstance = with_props(rds.DBInstance, StorageThroughput=(integer, False))
+DBCluster = with_props(
+    rds.DBCluster,
+    ServerlessV2ScalingConfiguration=(ServerlessV2ScalingConfiguration, False),
+)
+
+
+#
+# sceptre_user_data validation functions
+#
+def validate_monitoring_interval(value):
+    if value not in MONITORING_INTERVALS:
+        raise ValueError(
+            "'MonitoringInterval' must be one of {}".format(MONITORING_INTERVALS))
+
+
+def validate_performance_insights_retention(value):
+    if value not in [7, 731] + [31 * months for months in range(1, 24)]:
+        raise ValueError(
+            "'PerformanceInsightsRetention' must be 7, 731 or a multiple "
+            "of 31 up to 713 days"
+        )
+
+
+def validate_storage_type(value):
+    if value and value not in STORAGE_TYPES:
+        raise ValueError("'StorageType' must be one of {}".format(STORAGE_TYPES))
+
+
+def parameter_group_family(engine, engine_version):
+    """
+    Derive the DB parameter group family from the engine and its version,
+    e.g. postgres 9.6.1 -> postgres9.6, postgres 13.4 -> postgres13,
+    aurora-mysql 5.7.mysql_aurora.2.10.2 -> aurora-mysql5.7.
+    """
+    parts = engine_version.split('.')
+    if engine in ['postgres', 'aurora-postgresql']:
+        if parts[0].isdigit() and int(parts[0]) >= 10:
+            return engine + parts[0]
+        return engine + '.'.join(parts[:2])
+    if engine in ['mysql', 'mariadb', 'aurora-mysql']:
+        return engine + '.'.join(parts[:2])
+    raise ValueError(
+        "Cannot derive a parameter group family for engine '{}'.  Set "
+        "'DBParameterGroupFamily'".format(engine)
+    )
+
+
+def engine_family(engine):
+    if engine not in ENGINE_FAMILIES:
+        raise ValueError(
+            "RDS Proxy does not support engine '{}'".format(engine))
+    return ENGINE_FAMILIES[engine]
+
+
+#
+# shared resources
+#
+def add_monitoring_role(template):
+    """Add an IAM role allowing RDS enhanced monitoring."""
+    return template.add_resource(iam.Role(
+        "MonitoringRole",
+        AssumeRolePolicyDocument=rds_monitoring_assumerole_policy(),
+        ManagedPolicyArns=[ENHANCED_MONITORING_POLICY],
+        Path="/",
+    ))
+
+
+def add_db_proxy(template, engine, secret_arn, subnets, security_groups,
+        instance_ids=None, cluster_ids=None):
+    """
+    Add an RDS Proxy pooling connections to the given DB instances or
+    clusters.  Clients authenticate with the credentials in Secrets Manager
+    secret 'secret_arn'.
+    """
+    role = template.add_resource(iam.Role(
+        "ProxyRole",
+        AssumeRolePolicyDocument=rds_proxy_assumerole_policy(),
+        Path="/",
+        Policies=[
+            TropoPolicy(
+                PolicyName="rds_proxy_secret_policy",
+                PolicyDocument=rds_proxy_secret_policy([secret_arn]),
+            ),
+        ],
+    ))
+    proxy = template.add_resource(rds.DBProxy(
+        "DBProxy",
+        DBProxyName=Join('-', [StackName, 'proxy']),
+        EngineFamily=engine_family(engine),
+        Auth=[rds.AuthFormat(
+            AuthScheme='SECRETS',
+            IAMAuth='DISABLED',
+            SecretArn=secret_arn,
+        )],
+        RoleArn=GetAtt(role, 'Arn'),
+        RequireTLS=True,
+        VpcSubnetIds=subnets,
+        VpcSecurityGroupIds=security_groups,
+    ))
+    target_group = dict(
+        DBProxyName=Ref(proxy),
+        TargetGroupName='default',
+    )
+    if instance_ids:
+        target_group['DBInstanceIdentifiers'] = instance_ids
+    if cluster_ids:
+        target_group['DBClusterIdentifiers'] = cluster_ids
+    template.add_resource(rds.DBProxyTargetGroup(
+        "DBProxyTargetGroup",
+        **target_group
+    ))
+    return proxy
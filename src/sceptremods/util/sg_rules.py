@@ -0,0 +1,399 @@
+"""
+Normalize, deduplicate and compact EC2 security group ingress rules.
+
+Ingress rules arrive as sceptre_user_data dictionaries:
+
+    dict(port='80-90', proto='tcp', source_ip='10.1.0.0/16')
+    dict(source_sg='PublicSG')
+
+normalize_rule() turns these into hashable Rule tuples.  compact_rules()
+then removes duplicates, merges overlapping or adjacent port ranges per
+source, and aggregates cidr blocks sharing the same protocol and ports into
+supernets.  Everything is a sort followed by linear passes.  split_rules()
+chunks whatever remains to fit the per group rule limit.
+
+Large cidr allowlists are read from files with read_rule_file().  Entries
+are streamed into a RuleArray, which keeps cidr sourced rules in packed
+arrays at a few bytes per rule, and compact_rules() works from those arrays
+directly.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from array import array
+from collections import namedtuple
+
+
+# AWS default quota of inbound rules per security group
+MAX_RULES_PER_GROUP = 60
+
+ALL_PROTOCOLS = '-1'
+PORT_RANGE_PROTOCOLS = ['tcp', 'udp', '6', '17']
+# for these the 'port' is an icmp type and code, each -1 for any
+ICMP_PROTOCOLS = ['icmp', 'icmpv6', '1', '58']
+# a port or icmp type, optionally followed by '-' and a to port or icmp code
+PORT_RANGE = re.compile(r'^(-?\d+)(?:-(-?\d+))?$')
+RULE_KEYS = ['port', 'proto', 'source_ip', 'source_sg']
+
+CIDR = 'cidr'
+SECURITY_GROUP = 'sg'
+
+Rule = namedtuple('Rule', ['proto', 'from_port', 'to_port', 'source_type', 'source'])
+
+
+#
+# cidr helpers.  cidr blocks are (network, prefixlen) integer pairs.
+#
+def parse_cidr(cidrblock):
+    """Return (network, prefixlen) for an ipv4 cidr string."""
+    try:
+        if '/' in cidrblock:
+            address, prefixlen = cidrblock.split('/')
+            prefixlen = int(prefixlen)
+        else:
+            address, prefixlen = cidrblock, 32
+        octets = [int(q) for q in address.split('.')]
+    except (AttributeError, ValueError):
+        raise ValueError("'{}' not a valid cidr block".format(cidrblock))
+    if (len(octets) != 4 or not 0 <= prefixlen <= 32
+            or [q for q in octets if not 0 <= q <= 255]):
+        raise ValueError("'{}' not a valid cidr block".format(cidrblock))
+    network = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    if network & host_mask(prefixlen):
+        raise ValueError(
+            "'{}' has host bits set. Did you mean '{}'?".format(
+                cidrblock,
+                format_cidr(network & ~host_mask(prefixlen), prefixlen))
+        )
+    return network, prefixlen
+
+
+def format_cidr(network, prefixlen):
+    return '{}.{}.{}.{}/{}'.format(
+        (network >> 24) & 255,
+        (network >> 16) & 255,
+        (network >> 8) & 255,
+        network & 255,
+        prefixlen,
+    )
+
+
+def host_mask(prefixlen):
+    return (1 << (32 - prefixlen)) - 1
+
+
+def pack_cidr(network, prefixlen):
+    """Pack a cidr block into one integer preserving (network, prefixlen) order."""
+    return network << 6 | prefixlen
+
+
+def unpack_cidr(packed):
+    return packed >> 6, packed & 63
+
+
+def collapse_cidrs(cidrs):
+    """
+    Aggregate (network, prefixlen) pairs into the smallest equivalent list
+    of supernets.
+    """
+    return collapse_sorted_cidrs(sorted(set(cidrs)))
+
+
+def collapse_sorted_cidrs(cidrs):
+    """
+    Aggregate sorted, unique (network, prefixlen) pairs into supernets.
+    Blocks contained in a preceding block are dropped and sibling blocks
+    merge into their parent, repeatedly, using a stack.
+    """
+    stack = list()
+    for network, prefixlen in cidrs:
+        if stack:
+            top_network, top_prefixlen = stack[-1]
+            if network & ~host_mask(top_prefixlen) == top_network:
+                continue
+        stack.append((network, prefixlen))
+        while len(stack) > 1:
+            (low, low_prefixlen), (high, high_prefixlen) = stack[-2:]
+            if low_prefixlen != high_prefixlen or low_prefixlen == 0:
+                break
+            sibling_bit = 1 << (32 - low_prefixlen)
+            if low & sibling_bit or high != low | sibling_bit:
+                break
+            stack[-2:] = [(low, low_prefixlen - 1)]
+    return stack
+
+
+def merge_port_ranges(ranges):
+    """Merge overlapping or adjacent (from_port, to_port) ranges."""
+    merged = list()
+    for from_port, to_port in sorted(set(ranges)):
+        if merged and from_port <= merged[-1][1] + 1:
+            if to_port > merged[-1][1]:
+                merged[-1] = (merged[-1][0], to_port)
+        else:
+            merged.append((from_port, to_port))
+    return merged
+
+
+#
+# rules
+#
+def parse_ports(port, proto):
+    if proto == ALL_PROTOCOLS:
+        return -1, -1
+    if port is None or port == '':
+        if proto in PORT_RANGE_PROTOCOLS:
+            return 0, 65535
+        return -1, -1
+    match = PORT_RANGE.match(str(port).strip())
+    if not match:
+        raise ValueError("'{}' not a valid port or port range".format(port))
+    from_port = int(match.group(1))
+    to_port = int(match.group(2) or from_port)
+    # RuleArray packs each port into 17 bits, so bound them all
+    if proto in PORT_RANGE_PROTOCOLS:
+        valid = 0 <= from_port <= to_port <= 65535
+    elif proto in ICMP_PROTOCOLS:
+        valid = -1 <= from_port <= 255 and -1 <= to_port <= 255
+    else:
+        valid = -1 <= from_port <= to_port <= 65535
+    if not valid:
+        raise ValueError("'{}' not a valid port or port range for protocol "
+                         "'{}'".format(port, proto))
+    return from_port, to_port
+
+
+def normalize_rule(rule):
+    """Convert an ingress rule dictionary into a Rule tuple."""
+    unknown = [key for key in rule if key not in RULE_KEYS]
+    if unknown:
+        raise ValueError(
+            "Ingress rule keys {} not in {}".format(unknown, RULE_KEYS)
+        )
+    if bool(rule.get('source_ip')) == bool(rule.get('source_sg')):
+        raise ValueError(
+            "Ingress rule {} must have one of 'source_ip' or "
+            "'source_sg'".format(rule)
+        )
+    proto = str(rule.get('proto') or ALL_PROTOCOLS).lower()
+    if proto == 'all':
+        proto = ALL_PROTOCOLS
+    from_port, to_port = parse_ports(rule.get('port'), proto)
+    if rule.get('source_ip'):
+        return Rule(proto, from_port, to_port, CIDR, parse_cidr(rule['source_ip']))
+    return Rule(proto, from_port, to_port, SECURITY_GROUP, rule['source_sg'])
+
+
+class RuleArray(object):
+    """
+    Column store for cidr sourced rules.  Each rule costs under 20 bytes in
+    typed arrays instead of a few hundred bytes as a tuple of python
+    objects.  Protocol names are interned.
+    """
+
+    def __init__(self):
+        self.protos = list()
+        self.proto = array('B')
+        self.from_port = array('i')
+        self.to_port = array('i')
+        self.network = array('L')
+        self.prefixlen = array('B')
+
+    def __len__(self):
+        return len(self.proto)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Rule(
+                self.protos[self.proto[i]],
+                self.from_port[i],
+                self.to_port[i],
+                CIDR,
+                (self.network[i], self.prefixlen[i]),
+            )
+
+    def append(self, rule):
+        if rule.source_type != CIDR:
+            raise ValueError("RuleArray only holds cidr sourced rules")
+        if rule.proto not in self.protos:
+            self.protos.append(rule.proto)
+        self.proto.append(self.protos.index(rule.proto))
+        self.from_port.append(rule.from_port)
+        self.to_port.append(rule.to_port)
+        self.network.append(rule.source[0])
+        self.prefixlen.append(rule.source[1])
+
+    def compact(self):
+        """
+        Return compacted Rules.  Rows are packed into one sortable integer
+        per rule, (protocol, cidr, ports), so that a single sort groups
+        them by source for port range merging.  Cidr blocks are then
+        grouped by (protocol, ports) into arrays and collapsed.
+        """
+        unrestricted = set()
+        if ALL_PROTOCOLS in self.protos:
+            all_index = self.protos.index(ALL_PROTOCOLS)
+            unrestricted = set(
+                pack_cidr(self.network[i], self.prefixlen[i])
+                for i in range(len(self)) if self.proto[i] == all_index
+            )
+
+        keys = sorted(
+            (self.proto[i] << 38 | pack_cidr(self.network[i], self.prefixlen[i])) << 34
+            | (self.from_port[i] + 1) << 17
+            | (self.to_port[i] + 1)
+            for i in range(len(self))
+        )
+
+        by_ports = dict()
+        def add(proto, ranges, packed):
+            for port_range in ranges:
+                key = (proto, port_range)
+                # 'd' holds the 38 bit packed cidrs exactly, and unlike 'Q'
+                # exists on python 2
+                by_ports.setdefault(key, array('d')).append(packed)
+
+        source_key = ranges = None
+        for key in keys:
+            if key >> 34 != source_key:
+                if ranges:
+                    add(proto, merge_port_ranges(ranges), packed)
+                source_key = key >> 34
+                proto = self.protos[source_key >> 38]
+                packed = source_key & ((1 << 38) - 1)
+                ranges = list()
+            if proto != ALL_PROTOCOLS and packed in unrestricted:
+                continue
+            ports = ((key >> 17 & 0x1ffff) - 1, (key & 0x1ffff) - 1)
+            if proto in PORT_RANGE_PROTOCOLS:
+                ranges.append(ports)
+            else:
+                add(proto, [ports], packed)
+        if ranges:
+            add(proto, merge_port_ranges(ranges), packed)
+
+        rules = list()
+        for (proto, (from_port, to_port)), packed_cidrs in by_ports.items():
+            cidrs = (unpack_cidr(int(packed)) for packed in sorted(packed_cidrs))
+            for cidr in collapse_sorted_cidrs(cidrs):
+                rules.append(Rule(proto, from_port, to_port, CIDR, cidr))
+        return rules
+
+
+def compact_rules(rules, rule_array=None):
+    """
+    Return a sorted, deduplicated and compacted list of Rule tuples
+    equivalent to 'rules' plus any cidr sourced rules in 'rule_array'.
+    """
+    if rule_array is None:
+        rule_array = RuleArray()
+    sg_rules = set()
+    for r in rules:
+        if r.source_type == CIDR:
+            rule_array.append(r)
+        else:
+            sg_rules.add(r)
+
+    # an all protocols rule covers anything else from the same source
+    unrestricted = set(r.source for r in sg_rules if r.proto == ALL_PROTOCOLS)
+    by_source = dict()
+    compacted = list()
+    for r in sg_rules:
+        if r.proto != ALL_PROTOCOLS and r.source in unrestricted:
+            continue
+        if r.proto in PORT_RANGE_PROTOCOLS:
+            key = (r.proto, r.source)
+            by_source.setdefault(key, list()).append((r.from_port, r.to_port))
+        else:
+            compacted.append(r)
+
+    # merge port ranges per protocol and source
+    for (proto, source), ranges in by_source.items():
+        for from_port, to_port in merge_port_ranges(ranges):
+            compacted.append(Rule(proto, from_port, to_port, SECURITY_GROUP, source))
+
+    return sorted(compacted + rule_array.compact())
+
+
+#
+# rule files
+#
+def iter_rule_file(path):
+    """
+    Stream ingress rule dictionaries from a rule file.  The format is
+    chosen by file extension:
+
+      .csv          rows of 'source_ip[,port[,proto]]', or any column order
+                    given a header row naming these fields.
+      .json         a list of cidr strings or of ingress rule dictionaries.
+                    The list is loaded whole.
+      .jsonl        one cidr string or rule dictionary per line.
+      anything else one cidr per line.  '#' starts a comment.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with io.open(path, encoding='utf-8') as f:
+        if extension == '.csv':
+            fields = ['source_ip', 'port', 'proto']
+            for row in csv.reader(f):
+                row = [cell.strip() for cell in row]
+                if not row or not row[0] or row[0].startswith('#'):
+                    continue
+                if 'source_ip' in row:
+                    fields = row
+                    continue
+                yield dict((k, v) for k, v in zip(fields, row) if v)
+        elif extension == '.json':
+            for entry in json.load(f):
+                yield entry
+        elif extension == '.jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for line in f:
+                cidr = line.split('#', 1)[0].strip()
+                if cidr:
+                    yield cidr
+
+
+def read_rule_file(path, defaults=None, rule_array=None):
+    """
+    Parse a rule file into a RuleArray.  Entries which are plain cidr
+    strings, or which lack 'port' or 'proto', take those from 'defaults'.
+    """
+    if rule_array is None:
+        rule_array = RuleArray()
+    defaults = defaults or dict()
+    for line_number, entry in enumerate(iter_rule_file(path), 1):
+        if not isinstance(entry, dict):
+            entry = dict(source_ip=entry)
+        rule = dict(defaults)
+        rule.update(entry)
+        try:
+            rule_array.append(normalize_rule(rule))
+        except ValueError as e:
+            raise ValueError("{} entry {}: {}".format(path, line_number, e))
+    return rule_array
+
+
+def split_rules(rules, limit=MAX_RULES_PER_GROUP):
+    """Split a list of rules into chunks of at most 'limit' rules."""
+    return [rules[i:i + limit] for i in range(0, len(rules), limit)] or [[]]
+
+
+def rule_attributes(rule):
+    """
+    Return the troposphere ingress rule keyword args for a cidr sourced
+    Rule.  Security group sourced rules get 'SourceSecurityGroupId' from
+    the caller, which knows how to reference them.
+    """
+    attributes = dict(IpProtocol=rule.proto)
+    if rule.proto != ALL_PROTOCOLS:
+        attributes['FromPort'] = rule.from_port
+        attributes['ToPort'] = rule.to_port
+    if rule.source_type == CIDR:
+        attributes['CidrIp'] = format_cidr(*rule.source)
+    return attributes
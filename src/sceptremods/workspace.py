@@ -0,0 +1,89 @@
+"""
+Operate on every sceptre project under a workspace directory at once.
+
+discover_projects() finds each 'sceptre' directory holding a 'config'
+directory below a root.  project_version() reads the sceptremods_version a
+project was created or last updated with from its config/config.yaml, and
+sync_workspace() runs filesync over all projects in one thread pool, e.g.:
+
+    projects = discover_projects('~/src/infra')
+    stale = [p for p in projects if project_version(p) != __version__]
+    results = sync_workspace(projects, wrappers, refresh=True, jobs=8)
+"""
+
+import os
+import re
+
+from sceptremods import filesync
+
+
+SKIP_DIRS = ['node_modules', 'venv']
+VERSION_LINE = re.compile(r'^sceptremods_version:\s*[\'"]?([^\s\'"#]+)', re.M)
+
+
+def is_project(path):
+    return os.path.isdir(os.path.join(path, 'config'))
+
+
+def discover_projects(root):
+    """
+    Return the sorted paths of all sceptre project directories under
+    'root'.  Hidden directories are skipped, and nothing below a project
+    is searched.
+    """
+    root = os.path.abspath(os.path.expanduser(root))
+    if os.path.basename(root) == 'sceptre' and is_project(root):
+        return [root]
+    projects = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        if os.path.basename(dirpath) == 'sceptre' and is_project(dirpath):
+            projects.append(dirpath)
+            dirnames[:] = []
+            continue
+        dirnames[:] = sorted(d for d in dirnames
+                if not d.startswith('.') and d not in SKIP_DIRS)
+    return sorted(projects)
+
+
+def project_version(sceptre_dir):
+    """
+    Return the sceptremods_version in a project's config/config.yaml, or
+    None if unset.  The file is scanned rather than parsed, as sceptre
+    config may hold jinja.
+    """
+    config_file = os.path.join(sceptre_dir, 'config', 'config.yaml')
+    if not os.path.isfile(config_file):
+        return None
+    with open(config_file) as f:
+        match = VERSION_LINE.search(f.read())
+    return match.group(1) if match else None
+
+
+def stale_projects(projects, version):
+    """Return a dict of each project not at 'version' to its version."""
+    versions = dict((p, project_version(p)) for p in projects)
+    return dict((p, v) for p, v in versions.items() if v != version)
+
+
+def sync_workspace(projects, wrappers, refresh=False, dry_run=False, jobs=8):
+    """
+    Update, or with 'refresh' refresh the templates of, each project from
+    'wrappers'.  Return a dict of synced directory to its list of Changes.
+    """
+    if refresh:
+        pairs = [(os.path.join(wrappers, 'templates'),
+                  os.path.join(p, 'templates')) for p in projects]
+    else:
+        pairs = [(wrappers, p) for p in projects]
+    return filesync.sync_projects(pairs, refresh, dry_run, jobs)
+
+
+def print_report(root, projects, stale, version):
+    print('{} sceptre projects under {}'.format(len(projects), root))
+    if not stale:
+        print('all projects at sceptremods version {}'.format(version))
+        return
+    print('{} projects not at sceptremods version {}:'.format(len(stale), version))
+    for project in sorted(stale):
+        print('    {:<60} {}'.format(
+            os.path.relpath(project, root), stale[project] or 'unset'))
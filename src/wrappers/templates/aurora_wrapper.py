@@ -0,0 +1,5 @@
+"""Wrapper module for sceptremods.templates.aurora"""
+
+from sceptremods.templates import aurora
+def sceptre_handler(sceptre_user_data):
+    return aurora.sceptre_handler(sceptre_user_data)
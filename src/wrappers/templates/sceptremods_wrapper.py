@@ -0,0 +1,15 @@
+"""
+Generic wrapper module for all sceptremods.templates modules.
+
+The module comes from 'SceptremodsModule' in sceptre_user_data, e.g.:
+
+    template_path: templates/sceptremods_wrapper.py
+    sceptre_user_data:
+      SceptremodsModule: vpc
+
+or else from the name this file is linked to, e.g. vpc_wrapper.py.
+"""
+
+from sceptremods.templates import dispatch
+def sceptre_handler(sceptre_user_data):
+    return dispatch(sceptre_user_data, __file__)
@@ -0,0 +1,66 @@
+import pytest
+import yaml
+
+from testutil import (
+    assert_rendered_template,
+    generate_template_fixture,
+)
+
+
+logging_user_data = """
+PublicSubnets: subnet-a, subnet-b
+PublicSecurityGroup: sg-bogus
+LogBucket: bogus-alb-logs
+LogPrefix: alb
+LogRetentionDays: 365
+LogTransitions:
+  - Days: 30
+    StorageClass: STANDARD_IA
+  - Days: 90
+    StorageClass: GLACIER
+"""
+
+https_user_data = """
+PublicSubnets: subnet-a, subnet-b
+PublicSecurityGroup: sg-bogus
+Certificates:
+  - arn:aws:acm:us-west-2:123456789012:certificate/aaaa
+  - arn:aws:acm:us-west-2:123456789012:certificate/bbbb
+RedirectHttp: True
+IdleTimeout: 30
+DeregistrationDelay: 30
+Stickiness: True
+StickinessDuration: 3600
+LoadBalancingAlgorithm: least_outstanding_requests
+"""
+
+def test_logging_alb():
+    assert_rendered_template('alb', 'logging_alb', yaml.load(logging_user_data))
+
+def test_invalid_log_transitions():
+    user_data = yaml.load(logging_user_data)
+    user_data['LogTransitions'].reverse()
+    with pytest.raises(ValueError):
+        assert_rendered_template('alb', 'logging_alb', user_data)
+
+def test_stack_outputs():
+    from sceptremods.templates.alb import ALB
+    assert ALB.stack_outputs(dict()) == [
+            "LoadBalancerArn", "LoadBalancerUrl", "DefaultListener"]
+    assert "HttpsListener" in ALB.stack_outputs(yaml.load(https_user_data))
+    assert "LogLocationTemplate" in ALB.stack_outputs(yaml.load(logging_user_data))
+
+def test_https_alb():
+    assert_rendered_template('alb', 'https_alb', yaml.load(https_user_data))
+
+def test_invalid_slow_start():
+    user_data = yaml.load(https_user_data)
+    user_data['SlowStart'] = 60
+    with pytest.raises(ValueError):
+        assert_rendered_template('alb', 'https_alb', user_data)
+
+if __name__ == '__main__':
+    generate_template_fixture(
+            'alb', 'logging_alb', yaml.load(logging_user_data))
+    generate_template_fixture(
+            'alb', 'https_alb', yaml.load(https_user_data))
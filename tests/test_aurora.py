@@ -0,0 +1,49 @@
+import pytest
+import yaml
+
+from testutil import (
+    assert_rendered_template,
+    generate_template_fixture,
+)
+
+
+serverless_user_data = """
+AvailabilityZones: [us-west-2a, us-west-2b, us-west-2c]
+Readers: 2
+ServerlessV2Scaling:
+  MinCapacity: 0.5
+  MaxCapacity: 16
+ReplicaAutoScaling:
+  MinCapacity: 2
+  MaxCapacity: 8
+  CpuTarget: 60
+  ConnectionsTarget: 500
+  ScaleInCooldown: 300
+DBParameters:
+  rds.force_ssl: 1
+Proxy: True
+ProxySecretArn: arn:aws:secretsmanager:us-west-2:123456789012:secret:db-AbCdEf
+"""
+
+def test_default_aurora():
+    assert_rendered_template('aurora', 'default_aurora', dict())
+
+def test_serverless_aurora():
+    assert_rendered_template(
+            'aurora', 'serverless_aurora', yaml.load(serverless_user_data))
+
+def test_invalid_aurora():
+    for bad in [
+            dict(Engine='postgres'),
+            dict(ServerlessV2Scaling=dict(MinCapacity=0.25, MaxCapacity=4)),
+            dict(ServerlessV2Scaling=dict(MinCapacity=8, MaxCapacity=4)),
+            dict(ReplicaAutoScaling=dict(MinCapacity=1, MaxCapacity=4)),
+            dict(Proxy=True),
+            ]:
+        with pytest.raises(ValueError):
+            assert_rendered_template('aurora', 'default_aurora', bad)
+
+if __name__ == '__main__':
+    generate_template_fixture('aurora', 'default_aurora', dict())
+    generate_template_fixture(
+            'aurora', 'serverless_aurora', yaml.load(serverless_user_data))
@@ -18,6 +18,36 @@ custom_user_data = """
   AcmCertificateARN: arn:aws:acm:us-east-1:012345678901:certificate/bogus-acm-identification-string
 """
 
+cached_user_data = """
+  ApplicationName: ashley-demo
+  HostedZoneDomainName: blee.red
+  CachePolicySettings:
+    DefaultTTL: 3600
+    QueryStrings: [v]
+  OriginRequestPolicy: CORS-S3Origin
+  OriginShieldRegion: us-west-2
+  Compress: true
+  HttpVersion: http2and3
+  PriceClass: PriceClass_200
+  Precompressed: true
+  CacheBehaviors:
+    - PathPattern: '*.html'
+      DefaultTTL: 300
+      MaxTTL: 3600
+    - PathPattern: 'assets/*'
+      CachePolicy: CachingOptimized
+    - PathPattern: 'docs/*'
+      Compress: false
+    - PathPattern: 'live/*'
+      DefaultTTL: 0
+      MaxTTL: 0
+    - PathPattern: 'api/*'
+      CachePolicy: CachingDisabled
+      OriginRequestPolicy: AllViewer
+      Compress: false
+      Precompressed: false
+"""
+
 def test_default_cloudfront_s3_website():
     assert_rendered_template(
             'cloudfront_s3_website',
@@ -30,6 +60,27 @@ def test_custom_cloudfront_s3_website():
             'custom_cloudfront_s3_website',
             yaml.load(custom_user_data))
 
+def test_cached_cloudfront_s3_website():
+    assert_rendered_template(
+            'cloudfront_s3_website',
+            'cached_cloudfront_s3_website',
+            yaml.load(cached_user_data))
+
+def test_cache_behavior_validation():
+    from sceptremods.templates.cloudfront_s3_website import (
+        validate_cache_behaviors,
+        validate_cache_policy_settings,
+    )
+    with pytest.raises(ValueError):
+        validate_cache_policy_settings(dict(MinTTL=600, DefaultTTL=60))
+    with pytest.raises(ValueError):
+        validate_cache_behaviors([dict(CachePolicy='CachingOptimized')])
+    with pytest.raises(ValueError):
+        validate_cache_behaviors([dict(PathPattern='a/*', TTL=5)])
+    with pytest.raises(ValueError):
+        validate_cache_behaviors([dict(
+            PathPattern='api/*', DefaultTTL=0, MaxTTL=0, Headers=['Origin'])])
+
 if __name__ == '__main__':
     generate_template_fixture(
             'cloudfront_s3_website',
@@ -39,3 +90,7 @@ if __name__ == '__main__':
             'cloudfront_s3_website',
             'custom_cloudfront_s3_website',
             yaml.load(custom_user_data))
+    generate_template_fixture(
+            'cloudfront_s3_website',
+            'cached_cloudfront_s3_website',
+            yaml.load(cached_user_data))
@@ -0,0 +1,120 @@
+import pytest
+import yaml
+
+from testutil import (
+    assert_rendered_template,
+    generate_template_fixture,
+)
+
+
+single_user_data = """
+VpcId: bogus-VpcId-for-testing-only
+Subnets: subnet-a, subnet-b
+SecurityGroup: sg-bogus
+LoadBalancerArn: arn:aws:elasticloadbalancing:us-west-2:123456789012:loadbalancer/app/bogus/0123456789abcdef
+LoadBalancerUrl: bogus.us-west-2.elb.amazonaws.com
+DefaultListener: arn:aws:elasticloadbalancing:us-west-2:123456789012:listener/app/bogus/0123456789abcdef/0123456789abcdef
+HostedZone: example.com
+ServiceFqdn: web.example.com
+ContainerName: web
+ContainerImage: nginx
+"""
+
+multi_service_user_data = single_user_data + """
+Family: shop
+Services:
+  - Name: api
+    ServiceFqdn: api.example.com
+    ContainerImage: example/api
+    HealthCheckAttributes:
+      Matcher:
+        HttpCode: 200-299
+  - Name: admin
+    HostHeaders:
+      - admin.example.com
+    ContainerImage: example/admin
+  - Name: web
+    CapacityProviderStrategy:
+      - CapacityProvider: FARGATE
+        Base: 1
+        Weight: 1
+      - CapacityProvider: FARGATE_SPOT
+        Weight: 3
+    AutoScaling:
+      MinCapacity: 2
+      MaxCapacity: 10
+      CpuTarget: 60
+      RequestCountTarget: 1000
+      ScaleInCooldown: 300
+      ScheduledActions:
+        - Name: nightly
+          Schedule: cron(0 2 * * ? *)
+          MaxCapacity: 4
+    LoadBalancedContainer: nginx
+    Containers:
+      - ContainerName: nginx
+        ContainerImage: nginx
+      - ContainerName: app
+        ContainerImage: example/app
+        ContainerPort: 8080
+        AdditionalContainerAttributes:
+          Environment:
+            - Name: STAGE
+              Value: test
+          LinuxParameters:
+            InitProcessEnabled: true
+            Capabilities:
+              Drop: [NET_RAW]
+          Ulimits:
+            - Name: nofile
+              SoftLimit: 4096
+              HardLimit: 8192
+"""
+
+def test_single_ecs_fargate():
+    assert_rendered_template(
+            'ecs_fargate', 'single_ecs_fargate', yaml.load(single_user_data))
+
+def test_multi_service_ecs_fargate():
+    assert_rendered_template(
+            'ecs_fargate', 'multi_service_ecs_fargate',
+            yaml.load(multi_service_user_data))
+
+def test_duplicate_service_fqdn():
+    from sceptremods.templates.ecs_fargate import ECSFargate
+    user_data = yaml.load(multi_service_user_data)
+    user_data['Services'][1]['ServiceFqdn'] = 'api.example.com'
+    with pytest.raises(ValueError):
+        ECSFargate(user_data).create_template()
+    user_data['Services'][1]['ServiceFqdn'] = 'web.example.com'
+    with pytest.raises(ValueError):
+        ECSFargate(user_data).create_template()
+
+def test_validate_autoscaling():
+    from sceptremods.templates.ecs_fargate import validate_autoscaling
+    validate_autoscaling(dict(MinCapacity=1, MaxCapacity=2, MemoryTarget=70))
+    for bad in [
+            dict(MinCapacity=1, CpuTarget=50),
+            dict(MinCapacity=3, MaxCapacity=2, CpuTarget=50),
+            dict(MinCapacity=1, MaxCapacity=2),
+            dict(MinCapacity=1, MaxCapacity=2, CpuTarget=0),
+            dict(MinCapacity=1, MaxCapacity=2, Bogus=1, CpuTarget=50),
+            dict(MinCapacity=1, MaxCapacity=2, ScheduledActions=[
+                dict(Name='a', Schedule='daily', MinCapacity=1)]),
+            ]:
+        with pytest.raises(ValueError):
+            validate_autoscaling(bad)
+
+def test_stack_outputs():
+    from sceptremods.templates.ecs_fargate import ECSFargate
+    assert ECSFargate.stack_outputs(dict()) == ['ServiceUrl']
+    assert ECSFargate.stack_outputs(yaml.load(multi_service_user_data)) == [
+            service['Name'] + 'ServiceUrl'
+            for service in yaml.load(multi_service_user_data)['Services']]
+
+if __name__ == '__main__':
+    generate_template_fixture(
+            'ecs_fargate', 'single_ecs_fargate', yaml.load(single_user_data))
+    generate_template_fixture(
+            'ecs_fargate', 'multi_service_ecs_fargate',
+            yaml.load(multi_service_user_data))
@@ -0,0 +1,49 @@
+import pytest
+
+from sceptremods.util.elb import (
+    BAND_WIDTH,
+    allocate_priorities,
+    path_depth,
+    rule_band,
+)
+
+
+def test_path_depth():
+    assert [path_depth(p) for p in ['/', '/*', '/api*', '/api/*', '/api/v2*']] == [
+        0, 0, 1, 2, 3]
+
+def test_rule_band():
+    assert rule_band(['a.example.com'], ['/api/*']) < rule_band(['a.example.com'], [])
+    assert rule_band(['a.example.com'], []) < rule_band([], ['/api/*'])
+    assert rule_band([], ['/api/*']) < rule_band([], ['/'])
+
+def test_allocate_priorities():
+    rules = [
+        ([], ['/'], 0),
+        ([], ['/api/*'], 0),
+        (['admin.example.com'], [], 0),
+        ([], ['/web/*'], 7),
+    ]
+    priorities = allocate_priorities(rules)
+    assert priorities[3] == 7
+    assert priorities[2] < priorities[1] < priorities[0]
+    assert len(set(priorities)) == len(priorities)
+    # stable when other rules come and go
+    assert allocate_priorities(rules[1:2]) == priorities[1:2]
+
+def test_allocate_priorities_existing():
+    existing = [
+        dict(Priority=5, PathPatterns=['/api/*']),
+        dict(Priority=allocate_priorities([([], ['/web/*'], 0)])[0],
+                HostHeaders=['other.example.com']),
+    ]
+    priorities = allocate_priorities(
+            [([], ['/api/*'], 0), ([], ['/web/*'], 0)], existing)
+    assert priorities[0] == 5
+    assert priorities[1] not in [rule['Priority'] for rule in existing]
+
+def test_allocate_priorities_conflicts():
+    with pytest.raises(ValueError):
+        allocate_priorities([([], ['/'], 0), ([], ['/'], 0)])
+    with pytest.raises(ValueError):
+        allocate_priorities([([], ['/a'], 3), ([], ['/b'], 3)])
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from sceptremods import filesync
+
+
+@pytest.fixture
+def trees(tmpdir):
+    src = tmpdir.mkdir('wrappers')
+    src.mkdir('templates').join('vpc_wrapper.py').write('vpc = 2\n')
+    src.join('templates').join('sg_wrapper.py').write('sg = 1\n')
+    src.mkdir('hooks').join('hook.py').write('hook = 1\n')
+    dest = tmpdir.mkdir('sceptre')
+    dest.mkdir('templates').join('vpc_wrapper.py').write('vpc = 1\n')
+    dest.join('templates').join('sg_wrapper.py').write('sg = 1\n')
+    dest.join('templates').join('local_wrapper.py').write('local = 1\n')
+    return src, dest
+
+def actions(changes, root):
+    return dict((os.path.relpath(c.dest, str(root)), c.action) for c in changes)
+
+def test_update(trees):
+    src, dest = trees
+    unchanged = dest.join('templates', 'sg_wrapper.py')
+    mtime = unchanged.mtime() - 100
+    unchanged.setmtime(mtime)
+
+    changes = filesync.sync_project(str(src), str(dest), dry_run=True)
+    assert actions(changes, dest) == {
+        'hooks/hook.py': 'create',
+        'templates/sg_wrapper.py': 'unchanged',
+        'templates/vpc_wrapper.py': 'update',
+    }
+    assert not dest.join('hooks').check()
+    diff = filesync.change_diff(changes[-1])
+    assert '-vpc = 1\n' in diff and '+vpc = 2\n' in diff
+
+    filesync.sync_project(str(src), str(dest))
+    assert dest.join('hooks', 'hook.py').read() == 'hook = 1\n'
+    assert dest.join('templates', 'vpc_wrapper.py').read() == 'vpc = 2\n'
+    assert unchanged.mtime() == mtime
+    assert sorted(os.listdir(str(dest.join('templates')))) == [
+        'local_wrapper.py', 'sg_wrapper.py', 'vpc_wrapper.py']
+
+def test_refresh(trees):
+    src, dest = trees
+    results = filesync.sync_projects(
+        [(str(src.join('templates')), str(dest.join('templates')))],
+        refresh=True)
+    assert actions(results[str(dest.join('templates'))], dest) == {
+        'templates/local_wrapper.py': 'orphan',
+        'templates/sg_wrapper.py': 'unchanged',
+        'templates/vpc_wrapper.py': 'update',
+    }
+    assert dest.join('templates', 'vpc_wrapper.py').read() == 'vpc = 2\n'
+    assert not dest.join('hooks').check()
+    with pytest.raises(ValueError):
+        filesync.plan_refresh(str(src.join('bogus')), str(dest))
@@ -0,0 +1,103 @@
+import gzip
+
+import pytest
+
+from sceptremods import flowlogs
+
+
+flow_log_text = """\
+version account-id interface-id srcaddr dstaddr srcport dstport protocol packets bytes start end action log-status
+2 123456789012 eni-1 10.128.1.5 10.128.2.9 44321 443 6 10 5000 1 2 ACCEPT OK
+2 123456789012 eni-1 10.128.1.5 10.128.2.9 44322 443 6 10 3000 1 2 ACCEPT OK
+2 123456789012 eni-2 10.128.2.9 10.128.1.5 443 44321 6 8 2000 1 2 ACCEPT OK
+2 123456789012 eni-1 198.51.100.7 10.128.1.5 51000 22 6 1 40 1 2 REJECT OK
+2 123456789012 eni-1 198.51.100.7 10.128.1.5 51001 22 6 1 40 1 2 REJECT OK
+2 123456789012 eni-1 198.51.100.8 10.128.1.5 51002 3389 6 1 40 1 2 REJECT OK
+2 123456789012 eni-3 - - - - - - - 1 2 - NODATA
+truncated line
+"""
+
+@pytest.fixture(params=['numpy', 'python'])
+def analysis(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setitem(flowlogs._modules, 'numpy', None)
+    return flowlogs.FlowLogAnalysis(
+        subnets=['app=10.128.1.0/24', '10.128.2.0/24'], max_keys=100)
+
+def check_report(analysis, copies=1):
+    assert analysis.records == 8 * copies
+    assert analysis.skipped == 2 * copies
+    assert analysis.bytes == 10120 * copies
+    assert analysis.rejected == 3 * copies
+    assert analysis.talkers.top(2) == [
+        (('10.128.1.5', '10.128.2.9'), 8000 * copies),
+        (('10.128.2.9', '10.128.1.5'), 2000 * copies),
+    ]
+    assert analysis.rejected_flows.top(1) == [
+        (('198.51.100.7', '10.128.1.5', '22', '6'), 2 * copies)]
+    assert analysis.subnet_bytes == {
+        'app': {'in': 2120 * copies, 'out': 8000 * copies},
+        '10.128.2.0/24': {'in': 8000 * copies, 'out': 2000 * copies},
+    }
+    assert '198.51.100.7 -> 10.128.1.5:22/tcp' in '\n'.join(analysis.report())
+
+def test_analyze_text(analysis, tmpdir):
+    log_file = tmpdir.join('flows.log')
+    log_file.write(flow_log_text)
+    gz_file = str(tmpdir.join('flows.log.gz'))
+    with gzip.open(gz_file, 'wt') as f:
+        f.write(flow_log_text)
+    analysis.add_file(str(log_file), chunk_size=3)
+    analysis.add_file(gz_file)
+    check_report(analysis, copies=2)
+
+def test_analyze_parquet(analysis, tmpdir):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    lines = [l.split() for l in flow_log_text.splitlines()]
+    header, rows = lines[0], [r for r in lines[1:] if len(r) == len(lines[0])]
+    columns = dict((name.replace('-', '_'), [r[i] for r in rows])
+                   for i, name in enumerate(header))
+    for name in ['dstport', 'bytes']:
+        columns[name] = [None if v == '-' else int(v) for v in columns[name]]
+    columns['extra'] = [None] * len(rows)
+    path = str(tmpdir.join('flows.parquet'))
+    pq.write_table(pa.table(columns), path)
+    analysis.add_file(path, chunk_size=4)
+    assert analysis.records == 7
+    assert analysis.skipped == 1
+    assert analysis.talkers.top(1) == [(('10.128.1.5', '10.128.2.9'), 8000)]
+
+def test_analyze_malformed_bytes(analysis, tmpdir):
+    log_file = tmpdir.join('flows.log')
+    log_file.write('10.0.0.1 10.0.0.2 REJECT abc\n'
+                   '10.0.0.1 10.0.0.3 ACCEPT -40\n'
+                   '10.0.0.1 10.0.0.3 ACCEPT 40\n')
+    analysis.add_file(
+        str(log_file), flowlogs.parse_fields('srcaddr,dstaddr,action,bytes'))
+    assert analysis.records == 3
+    assert analysis.skipped == 2
+    assert analysis.bytes == 40
+
+def test_analyze_fields_without_header(tmpdir):
+    log_file = tmpdir.join('flows.log')
+    log_file.write('10.0.0.1 10.0.0.2 REJECT 60 subnet-1\n'
+                   '10.0.0.1 10.0.0.3 ACCEPT 40 subnet-2\n')
+    analysis = flowlogs.FlowLogAnalysis()
+    analysis.add_file(
+        str(log_file), flowlogs.parse_fields('srcaddr,dstaddr,action,bytes,subnet-id'))
+    assert analysis.subnet_bytes == {
+        'subnet-1': {'total': 60}, 'subnet-2': {'total': 40}}
+    assert analysis.rejected_flows.top(1) == [
+        (('10.0.0.1', '10.0.0.2', '-', '-'), 1)]
+    with pytest.raises(ValueError):
+        flowlogs.parse_fields('srcaddr bogus')
+
+def test_totals_bounded():
+    totals = flowlogs.Totals(max_keys=4)
+    totals.update([(str(i), i) for i in range(10)])
+    assert not len(totals.totals) > 4
+    assert totals.approximate
+    assert totals.top(1) == [('9', 9)]
@@ -0,0 +1,45 @@
+import pytest
+
+from sceptremods.util import lookups
+
+
+ALB_ARN = ('arn:aws:elasticloadbalancing:us-west-2:123456789012:'
+        'loadbalancer/app/my-alb/50dc6c495c0c9188')
+
+def test_elb_hosted_zone_id_static():
+    assert lookups.elb_hosted_zone_id(ALB_ARN) == 'Z1H1FL5HABSF5'
+
+def test_elb_hosted_zone_id_offline(monkeypatch, tmpdir):
+    monkeypatch.setenv('SCEPTREMODS_OFFLINE', '1')
+    monkeypatch.setattr(lookups, 'CACHE_FILE', str(tmpdir.join('cache.json')))
+    monkeypatch.setattr(lookups, '_cache', None)
+    arn = ALB_ARN.replace('us-west-2', 'xx-north-9')
+    with pytest.raises(RuntimeError):
+        lookups.elb_hosted_zone_id(arn)
+    lookups.load_cache()['elb_hosted_zone_id'] = {arn: 'ZCACHED'}
+    assert lookups.elb_hosted_zone_id(arn) == 'ZCACHED'
+
+def test_resolve():
+    facts = lookups.resolve(dict(
+        Zone=lambda v: lookups.elb_hosted_zone_id(v['Arn']),
+        Unused=lambda v: None,
+    ), dict(Arn=ALB_ARN))
+    assert facts == dict(Zone='Z1H1FL5HABSF5', Unused=None)
+
+def test_listener_rules_ttl(monkeypatch, tmpdir):
+    monkeypatch.setattr(lookups, 'CACHE_FILE', str(tmpdir.join('cache.json')))
+    monkeypatch.setattr(lookups, '_cache', None)
+    snapshots = [[dict(Priority=1, HostHeaders=[], PathPatterns=['/a/*'])], []]
+    monkeypatch.setattr(lookups, 'describe_listener_rules',
+            lambda arn, region: snapshots.pop())
+    now = [1000.0]
+    monkeypatch.setattr(lookups.time, 'time', lambda: now[0])
+    arn = ALB_ARN.replace('loadbalancer', 'listener') + '/f2f7dc8efc522ab2'
+    assert lookups.listener_rules(arn) == []
+    now[0] += lookups.LISTENER_RULES_TTL - 1
+    assert lookups.listener_rules(arn) == []
+    now[0] += 2
+    assert lookups.listener_rules(arn)[0]['Priority'] == 1
+    monkeypatch.setenv('SCEPTREMODS_OFFLINE', '1')
+    now[0] += 86400
+    assert lookups.listener_rules(arn)[0]['Priority'] == 1
@@ -0,0 +1,37 @@
+import copy
+
+from troposphere import ecs
+
+from sceptremods.util.props import convert_properties, property_converters
+
+
+def test_property_converters():
+    converters = property_converters(ecs.ContainerDefinition)
+    assert converters['LinuxParameters'] == (ecs.LinuxParameters, False)
+    assert converters['Ulimits'] == (ecs.Ulimit, True)
+    assert 'Image' not in converters
+    assert property_converters(ecs.ContainerDefinition) is converters
+
+def test_convert_properties():
+    attributes = dict(
+        Essential=True,
+        Environment=[dict(Name='STAGE', Value='test')],
+        LinuxParameters=dict(
+            Devices=[dict(HostPath='/dev/fuse')],
+            Capabilities=dict(Add=['SYS_ADMIN']),
+        ),
+    )
+    original = copy.deepcopy(attributes)
+    converted = convert_properties(ecs.ContainerDefinition, attributes)
+    assert attributes == original
+    assert converted['Essential'] is True
+    assert isinstance(converted['Environment'][0], ecs.Environment)
+    linux_parameters = converted['LinuxParameters']
+    assert isinstance(linux_parameters, ecs.LinuxParameters)
+    assert isinstance(linux_parameters.Devices[0], ecs.Device)
+    assert isinstance(linux_parameters.Capabilities, ecs.KernelCapabilities)
+    assert ecs.ContainerDefinition(
+        Name='web', Image='nginx', **converted).to_dict()['LinuxParameters'] == {
+        'Devices': [{'HostPath': '/dev/fuse'}],
+        'Capabilities': {'Add': ['SYS_ADMIN']},
+    }
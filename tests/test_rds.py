@@ -0,0 +1,48 @@
+import pytest
+import yaml
+
+from testutil import (
+    assert_rendered_template,
+    generate_template_fixture,
+)
+
+
+tuned_user_data = """
+Engine: postgres
+EngineVersion: '13.4'
+AvailabilityZones: [us-west-2a, us-west-2b, us-west-2c]
+ReadReplicas: 2
+ReplicaClass: db.r5.large
+DBParameters:
+  shared_preload_libraries: pg_stat_statements
+PerformanceInsights: True
+MonitoringInterval: 15
+DBAllocatedStorage: 400
+StorageType: gp3
+Iops: 12000
+StorageThroughput: 500
+Proxy: True
+ProxySecretArn: arn:aws:secretsmanager:us-west-2:123456789012:secret:db-AbCdEf
+"""
+
+def test_default_rds():
+    assert_rendered_template('rds', 'default_rds', dict())
+
+def test_tuned_rds():
+    assert_rendered_template('rds', 'tuned_rds', yaml.load(tuned_user_data))
+
+def test_invalid_rds():
+    for bad in [
+            dict(StorageThroughput=500, StorageType='io1'),
+            dict(Iops=1000),
+            dict(Proxy=True),
+            dict(MonitoringInterval=2),
+            dict(ReadReplicas=16),
+            ]:
+        with pytest.raises(ValueError):
+            assert_rendered_template('rds', 'tuned_rds', bad)
+
+if __name__ == '__main__':
+    generate_template_fixture('rds', 'default_rds', dict())
+    generate_template_fixture(
+            'rds', 'tuned_rds', yaml.load(tuned_user_data))
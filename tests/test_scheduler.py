@@ -0,0 +1,126 @@
+import pytest
+
+from sceptremods import scheduler
+
+
+stack_configs = {
+    'vpc.yaml': """
+template_path: templates/vpc_wrapper.py
+sceptre_user_data:
+  VpcCIDR: 10.128.0.0/16
+""",
+    'sg.yaml': """
+template_path: templates/sg_wrapper.py
+sceptre_user_data:
+  VpcId: !stack_output dev/vpc.yaml::VpcId
+""",
+    'alb.yaml': """
+template_path: templates/alb_wrapper.py
+sceptre_user_data:
+  VpcId: !stack_output dev/vpc.yaml::VpcId
+  PublicSubnets: !stack_output dev/vpc.yaml::PublicSubnets
+  PublicSecurityGroup: !stack_output {{ var.env }}/sg::PublicSG
+""",
+    'ecsfargate.yaml': """
+template_path: templates/ecs_fargate_wrapper.py
+sceptre_user_data:
+  VpcId: !stack_output dev/vpc.yaml::VpcId
+  LoadBalancerArn: !stack_output dev/alb.yaml::LoadBalancerArn
+  Bogus: !stack_output dev/alb.yaml::NotAnOutput
+  SecurityGroup: !stack_output_external sceptre-other-dev-sg::PrivateSG
+""",
+    'flowlogs.yaml': """
+template_path: templates/sceptremods_wrapper.py
+sceptre_user_data:
+  SceptremodsModule: vpc_flowlogs
+dependencies:
+  - dev/vpc.yaml
+""",
+}
+
+@pytest.fixture
+def stacks(tmpdir):
+    env_dir = tmpdir.mkdir('config').mkdir('dev')
+    for filename, config in stack_configs.items():
+        env_dir.join(filename).write(config)
+    return scheduler.build_graph(scheduler.discover_stacks(str(tmpdir), 'dev'))
+
+def test_discover_stacks(stacks):
+    assert sorted(stacks) == [
+        'dev/alb', 'dev/ecsfargate', 'dev/flowlogs', 'dev/sg', 'dev/vpc']
+    assert stacks['dev/alb'].module == 'alb'
+    assert stacks['dev/alb'].inputs['PublicSecurityGroup'] == ('dev/sg', 'PublicSG')
+    assert stacks['dev/alb'].dependencies == set(['dev/vpc', 'dev/sg'])
+    assert stacks['dev/flowlogs'].dependencies == set(['dev/vpc'])
+    assert stacks['dev/flowlogs'].module == 'vpc_flowlogs'
+    assert stacks['dev/ecsfargate'].external == set(['sceptre-other-dev-sg'])
+    assert len(stacks['dev/ecsfargate'].warnings) == 2
+
+def test_user_data_outputs(tmpdir):
+    env_dir = tmpdir.mkdir('config').mkdir('dev')
+    env_dir.join('vpc.yaml').write("""
+template_path: templates/vpc_wrapper.py
+sceptre_user_data:
+  CustomSubnets:
+    Data: {net_type: private, gateway_subnet: Public, priority: 2}
+""")
+    env_dir.join('sg.yaml').write("""
+template_path: templates/sg_wrapper.py
+sceptre_user_data:
+  VpcId: !stack_output dev/vpc.yaml::VpcId
+  SecurityGroups:
+    - name: PublicSecurityGroup
+      description: public
+      ingress_rules:
+        - {port: 443, proto: tcp, source_ip: 0.0.0.0/0}
+""")
+    env_dir.join('rds.yaml').write("""
+template_path: templates/rds_wrapper.py
+sceptre_user_data:
+  Subnets: !stack_output dev/vpc.yaml::DataSubnets
+  SecurityGroup: !stack_output dev/sg.yaml::PublicSecurityGroup
+  VpcId: !stack_output dev/sg.yaml::PublicSG
+""")
+    stacks = scheduler.build_graph(scheduler.discover_stacks(str(tmpdir), 'dev'))
+    warnings = stacks['dev/rds'].warnings
+    assert [w for w in warnings if 'declared output' in w] == [
+        "'PublicSG' is not a declared output of module 'sg' (stack dev/sg)"]
+
+def test_waves_and_critical_path(stacks):
+    assert scheduler.waves(stacks) == [
+        ['dev/vpc'], ['dev/flowlogs', 'dev/sg'], ['dev/alb'], ['dev/ecsfargate']]
+    assert scheduler.critical_path(stacks) == (
+        4, ['dev/vpc', 'dev/sg', 'dev/alb', 'dev/ecsfargate'])
+    durations = {'dev/vpc': 60, 'dev/sg': 5, 'dev/alb': 120, 'dev/flowlogs': 300}
+    assert scheduler.critical_path(stacks, durations) == (
+        360, ['dev/vpc', 'dev/flowlogs'])
+
+def test_cycle_detection(stacks):
+    stacks['dev/vpc'].dependencies.add('dev/alb')
+    with pytest.raises(ValueError):
+        scheduler.topological_order(stacks)
+
+def test_run_graph(stacks):
+    started = list()
+    def runner(cmd):
+        name = cmd[-1][:-len('.yaml')]
+        started.append(name)
+        if name == 'dev/sg':
+            return 'failed', 1, 'boom'
+        return 'ok', 1, str()
+    results = scheduler.run_graph(stacks, 'launch', 'sceptre', runner=runner)
+    assert started[0] == 'dev/vpc'
+    assert 'dev/alb' not in started
+    assert results['dev/flowlogs'].status == 'ok'
+    assert results['dev/alb'].status == 'skipped'
+    assert results['dev/ecsfargate'].status == 'skipped'
+
+def test_render_config_fallback():
+    jinja2 = pytest.importorskip('jinja2')
+    text = 'VpcId: !stack_output {{ var.envirnoment }}/vpc::VpcId'
+    with pytest.warns(UserWarning):
+        rendered = scheduler.render_config(text, dict(environment='dev'))
+    assert rendered == 'VpcId: !stack_output __jinja__/vpc::VpcId'
+    assert scheduler.render_config(
+        text.replace('envirnoment', 'environment'), dict(environment='dev')
+        ) == 'VpcId: !stack_output dev/vpc::VpcId'
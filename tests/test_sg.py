@@ -0,0 +1,93 @@
+import pytest
+import yaml
+
+from testutil import (
+    assert_rendered_template,
+    template_object,
+    generate_template_fixture,
+)
+
+
+standalone_user_data = """
+VpcId: custom-bogus-VpcId-for-testing-only
+StandaloneIngressRules: True
+SecurityGroups:
+  - name: PublicSG
+    description: allow inbound web traffic from campus networks
+    ingress_rules:
+      - port: 80
+        proto: tcp
+        source_ip: 10.0.0.0/24
+      - port: 80
+        proto: tcp
+        source_ip: 10.0.1.0/24
+      - port: 443
+        proto: tcp
+        source_ip: 10.0.0.0/23
+  - name: PrivateSG
+    description: allow inbound traffic from public security group on any port
+    ingress_rules:
+      - source_sg: PublicSG
+"""
+
+chained_user_data = """
+VpcId: custom-bogus-VpcId-for-testing-only
+MaxRulesPerGroup: 2
+SecurityGroups:
+  - name: PublicSG
+    description: allow inbound web traffic from campus networks
+    ingress_rules:
+      - port: 80
+        proto: tcp
+        source_ip: 10.0.0.0/24
+      - port: 443
+        proto: tcp
+        source_ip: 10.0.0.0/24
+      - port: 8080
+        proto: tcp
+        source_ip: 10.0.0.0/24
+  - name: PrivateSG
+    description: allow inbound traffic from public and bastion security groups
+    ingress_rules:
+      - source_sg: PublicSG
+      - port: 22
+        proto: tcp
+        source_sg: sg-0123456789abcdef0
+"""
+
+def test_default_sg():
+    assert_rendered_template('sg', 'default_sg', dict())
+
+def test_standalone_sg():
+    assert_rendered_template(
+            'sg', 'standalone_sg', yaml.load(standalone_user_data))
+
+def test_chained_sg():
+    assert_rendered_template(
+            'sg', 'chained_sg', yaml.load(chained_user_data))
+
+def test_standalone_duplicate_rule():
+    user_data = yaml.load(standalone_user_data)
+    user_data['CompactRules'] = False
+    rules = user_data['SecurityGroups'][0]['ingress_rules']
+    rules.append(dict(rules[0]))
+    t = template_object('sg', user_data)
+    t.create_template()
+    resources = t.template.to_dict()['Resources']
+    ingress = [r for r in resources if r.startswith('PublicSGIngress')]
+    assert len(ingress) == 3
+
+def test_self_sourced_chain():
+    user_data = yaml.load(standalone_user_data)
+    user_data['MaxRulesPerGroup'] = 1
+    user_data['SecurityGroups'][0]['ingress_rules'].append(
+            dict(source_sg='PublicSG'))
+    with pytest.raises(ValueError):
+        template_object('sg', user_data).create_template()
+
+if __name__ == '__main__':
+    generate_template_fixture('sg', 'default_sg', dict())
+    generate_template_fixture(
+            'sg', 'standalone_sg', yaml.load(standalone_user_data))
+    generate_template_fixture(
+            'sg', 'chained_sg', yaml.load(chained_user_data))
@@ -0,0 +1,102 @@
+import pytest
+
+from sceptremods.util.sg_rules import (
+    CIDR,
+    Rule,
+    collapse_cidrs,
+    compact_rules,
+    format_cidr,
+    merge_port_ranges,
+    normalize_rule,
+    parse_cidr,
+    read_rule_file,
+    split_rules,
+)
+
+
+def cidrs(*blocks):
+    return [parse_cidr(b) for b in blocks]
+
+def test_parse_cidr():
+    assert parse_cidr('10.1.0.0/16') == (0x0a010000, 16)
+    assert format_cidr(*parse_cidr('192.168.3.4')) == '192.168.3.4/32'
+    for bad in ['10.1.0.0/33', '10.256.0.0/16', 'bogus', '10.1.1.0/16']:
+        with pytest.raises(ValueError):
+            parse_cidr(bad)
+
+def test_collapse_cidrs():
+    collapsed = collapse_cidrs(cidrs(
+        '10.0.0.0/24', '10.0.1.0/24', '10.0.2.0/24', '10.0.3.0/24',
+        '10.0.1.128/25', '10.0.5.0/24', '10.0.0.0/24'))
+    assert [format_cidr(*c) for c in collapsed] == ['10.0.0.0/22', '10.0.5.0/24']
+
+def test_collapse_cidrs_unaligned_siblings():
+    collapsed = collapse_cidrs(cidrs('10.0.1.0/24', '10.0.2.0/24'))
+    assert [format_cidr(*c) for c in collapsed] == ['10.0.1.0/24', '10.0.2.0/24']
+
+def test_merge_port_ranges():
+    assert merge_port_ranges([(80, 80), (81, 90), (85, 86), (443, 443)]) == [
+        (80, 90), (443, 443)]
+
+def test_normalize_rule():
+    assert normalize_rule(dict(port='80-90', proto='TCP', source_ip='10.0.0.0/8')
+            ) == Rule('tcp', 80, 90, CIDR, parse_cidr('10.0.0.0/8'))
+    assert normalize_rule(dict(port='80', source_sg='PublicSG')
+            ) == Rule('-1', -1, -1, 'sg', 'PublicSG')
+    with pytest.raises(ValueError):
+        normalize_rule(dict(port='90-80', proto='tcp', source_ip='10.0.0.0/8'))
+    assert normalize_rule(dict(port='8--1', proto='icmp', source_ip='10.0.0.0/8')
+            )[1:3] == (8, -1)
+    for port, proto in [('-5', 'icmp'), ('3-256', 'icmp'), ('70000', '50'),
+            ('5-3', '50'), ('-2', '50'), ('1-2-3', 'tcp')]:
+        with pytest.raises(ValueError):
+            normalize_rule(dict(port=port, proto=proto, source_ip='10.0.0.0/8'))
+    with pytest.raises(ValueError):
+        normalize_rule(dict(port='80', proto='tcp'))
+    with pytest.raises(ValueError):
+        normalize_rule(dict(port='80', proto='tcp', source='10.0.0.0/8'))
+
+def test_compact_rules():
+    rules = [normalize_rule(r) for r in [
+        dict(port='80', proto='tcp', source_ip='10.0.0.0/24'),
+        dict(port='80', proto='tcp', source_ip='10.0.0.0/24'),
+        dict(port='81-89', proto='tcp', source_ip='10.0.0.0/24'),
+        dict(port='90', proto='tcp', source_ip='10.0.0.0/24'),
+        dict(port='80-90', proto='tcp', source_ip='10.0.1.0/24'),
+        dict(port='22', proto='tcp', source_sg='AdminSG'),
+        dict(source_sg='AdminSG'),
+    ]]
+    assert compact_rules(rules) == [
+        Rule('-1', -1, -1, 'sg', 'AdminSG'),
+        Rule('tcp', 80, 90, CIDR, parse_cidr('10.0.0.0/23')),
+    ]
+
+def test_split_rules():
+    assert split_rules(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert split_rules(list(), 2) == [[]]
+
+def test_read_rule_file(tmpdir):
+    text_file = tmpdir.join('allowlist.txt')
+    text_file.write('# partners\n10.0.0.0/24\n10.0.1.0/24  # second\n\n')
+    csv_file = tmpdir.join('allowlist.csv')
+    csv_file.write('proto,source_ip,port\nudp,10.0.2.0/24,53\n')
+    json_file = tmpdir.join('allowlist.json')
+    json_file.write('["10.0.3.0/24", {"source_ip": "10.0.4.0/24", "port": "22"}]')
+    defaults = dict(port=443, proto='tcp')
+    rule_array = read_rule_file(str(text_file), defaults)
+    read_rule_file(str(csv_file), defaults, rule_array)
+    read_rule_file(str(json_file), defaults, rule_array)
+    assert len(rule_array) == 5
+    assert compact_rules([], rule_array) == [
+        Rule('tcp', 22, 22, CIDR, parse_cidr('10.0.4.0/24')),
+        Rule('tcp', 443, 443, CIDR, parse_cidr('10.0.0.0/23')),
+        Rule('tcp', 443, 443, CIDR, parse_cidr('10.0.3.0/24')),
+        Rule('udp', 53, 53, CIDR, parse_cidr('10.0.2.0/24')),
+    ]
+
+def test_read_rule_file_error(tmpdir):
+    text_file = tmpdir.join('allowlist.txt')
+    text_file.write('10.0.0.0/24\n10.0.1.1/24\n')
+    with pytest.raises(ValueError) as e:
+        read_rule_file(str(text_file))
+    assert 'entry 2' in str(e.value)
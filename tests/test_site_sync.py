@@ -0,0 +1,191 @@
+import gzip
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from sceptremods import site_sync
+
+
+class FakeS3(object):
+    """Just enough of an S3 client for sync_site."""
+
+    def __init__(self):
+        self.objects = dict()
+        self.requests = []
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self.requests.append(('get', Key))
+        if Key not in self.objects:
+            raise ClientError(dict(Error=dict(Code='NoSuchKey')), 'GetObject')
+        body, args = self.objects[Key]
+        if IfNoneMatch == args['ETag']:
+            raise ClientError(dict(Error=dict(Code='304')), 'GetObject')
+        return dict(Body=FakeBody(body), ETag=args['ETag'])
+
+    def put_object(self, Bucket, Key, Body, **args):
+        self.requests.append(('put', Key))
+        args['ETag'] = '"{}"'.format(len(self.requests))
+        self.objects[Key] = (Body, args)
+        return dict(ETag=args['ETag'])
+
+    def upload_file(self, path, bucket, key, ExtraArgs):
+        with open(path, 'rb') as f:
+            self.put_object(bucket, key, f.read(), **ExtraArgs)
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.requests.append(('delete', item['Key']))
+            del self.objects[item['Key']]
+
+
+class FakeBody(object):
+    def __init__(self, body):
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class FakeCloudFront(object):
+    def __init__(self):
+        self.invalidations = []
+
+    def get_distribution_config(self, Id):
+        return dict(DistributionConfig=dict(DefaultRootObject='welcome.html'))
+
+    def create_invalidation(self, DistributionId, InvalidationBatch):
+        self.invalidations.append(InvalidationBatch['Paths']['Items'])
+        return dict(Invalidation=dict(Id='I{}'.format(len(self.invalidations))))
+
+
+@pytest.fixture
+def site(tmpdir, monkeypatch):
+    monkeypatch.setattr(site_sync, 'SITE_CACHE_DIR', str(tmpdir.join('cache')))
+    site_dir = tmpdir.mkdir('site')
+    site_dir.join('welcome.html').write('<h1>hi</h1>')
+    site_dir.join('style.css').write('h1 {}')
+    site_dir.mkdir('docs').join('a.html').write('a')
+    site_dir.join('docs').join('b.html').write('b')
+    site_dir.join('.hidden').write('x')
+    return site_dir
+
+def test_sync_site(site):
+    s3, cloudfront = FakeS3(), FakeCloudFront()
+    def sync(**kwargs):
+        return site_sync.sync_site(
+            str(site), 'bucket', 'E123', prefix='www', jobs=2,
+            s3=s3, cloudfront=cloudfront, **kwargs)
+
+    result = sync()
+    assert result.uploaded == [
+        'docs/a.html', 'docs/b.html', 'style.css', 'welcome.html']
+    assert result.paths == [] and cloudfront.invalidations == []
+    body, args = s3.objects['www/style.css']
+    assert args['ContentType'] == 'text/css; charset=utf-8'
+    assert args['CacheControl'] == 'public, max-age=3600'
+    assert s3.objects['www/welcome.html'][1]['CacheControl'].startswith(
+        'public, max-age=0')
+    manifest = json.loads(s3.objects['www/' + site_sync.MANIFEST_KEY][0])
+    assert sorted(manifest) == result.uploaded
+
+    s3.requests = []
+    result = sync()
+    assert result.uploaded == [] and result.unchanged == 4
+    assert s3.requests == [('get', 'www/' + site_sync.MANIFEST_KEY)]
+
+    site.join('welcome.html').write('<h1>hello</h1>')
+    site.join('docs').join('b.html').remove()
+    result = sync(dry_run=True)
+    assert result.uploaded == ['welcome.html'] and result.deleted == []
+    assert 'www/docs/b.html' in s3.objects
+    result = sync(delete=True)
+    assert result.deleted == ['docs/b.html']
+    assert 'www/docs/b.html' not in s3.objects
+    assert cloudfront.invalidations == [['/', '/docs/b.html', '/welcome.html']]
+
+def test_fingerprint_site(tmpdir, monkeypatch):
+    monkeypatch.setattr(site_sync, 'SITE_CACHE_DIR', str(tmpdir.join('cache')))
+    site_dir = tmpdir.mkdir('site')
+    site_dir.mkdir('img').join('logo.png').write_binary(b'\x89PNG')
+    site_dir.mkdir('css').join('site.css').write(
+        'h1 { background: url("../img/logo.png"); }')
+    site_dir.join('index.html').write(
+        '<link href="css/site.css?v=1" rel=stylesheet>'
+        '<img src=/img/logo.png><a href="https://example.com/img/logo.png">'
+        '<a href="page.html#top">')
+    site_dir.join('page.html').write('<script src="app.js"></script>')
+    site_dir.join('app.js').write('1')
+
+    objects = site_sync.site_objects(str(site_dir), fingerprint=True)
+    logo = site_sync.fingerprint_key('img/logo.png', site_sync.file_hash(
+        str(site_dir.join('img', 'logo.png'))))
+    css = [k for k in objects if k.startswith('css/site.') and k != 'css/site.css']
+    assert len(css) == 1 and len(objects) == 8
+    assert objects[logo].cache_control == site_sync.IMMUTABLE_CACHE_CONTROL
+    assert objects[css[0]].body == objects['css/site.css'].body == (
+        'h1 {{ background: url("../{}"); }}'.format(logo).encode('utf-8'))
+    assert objects['index.html'].body.decode('utf-8') == (
+        '<link href="{}?v=1" rel=stylesheet><img src=/{}>'
+        '<a href="https://example.com/img/logo.png"><a href="page.html#top">'
+        ).format(css[0], logo)
+    assert objects['index.html'].cache_control.startswith('public, max-age=0')
+    assert b'src="app.' in objects['page.html'].body
+
+    s3 = FakeS3()
+    site_sync.sync_site(str(site_dir), 'bucket', s3=s3, fingerprint=True)
+    assert s3.objects[logo][1]['ContentType'] == 'image/png'
+    assert s3.objects['index.html'][0] == objects['index.html'].body
+
+def test_precompress_site(site):
+    pytest.importorskip('brotli')
+    s3 = FakeS3()
+    result = site_sync.sync_site(str(site), 'bucket', s3=s3, precompress=True)
+    assert len(result.uploaded) == 12
+    body, args = s3.objects['style.css.gz']
+    assert gzip.decompress(body) == b'h1 {}'
+    assert args['ContentEncoding'] == 'gzip'
+    assert args['ContentType'] == 'text/css; charset=utf-8'
+    assert s3.objects['welcome.html.br'][1]['ContentEncoding'] == 'br'
+
+    site.join('style.css').write('h2 {}')
+    result = site_sync.sync_site(str(site), 'bucket', s3=s3, precompress=True)
+    assert result.uploaded == ['style.css', 'style.css.br', 'style.css.gz']
+    assert gzip.decompress(s3.objects['style.css.gz'][0]) == b'h2 {}'
+    with pytest.raises(ValueError):
+        site_sync.sync_site(str(site), 'bucket', s3=s3, delete=True)
+    assert 'style.css.br' in s3.objects
+
+def test_parse_cache_control():
+    rules = site_sync.parse_cache_control(['assets/*=public, max-age=600'])
+    assert site_sync.cache_control('assets/app.js', rules) == 'public, max-age=600'
+    assert site_sync.cache_control('index.html', rules).endswith('must-revalidate')
+    with pytest.raises(ValueError):
+        site_sync.parse_cache_control(['assets/*'])
+
+def test_invalidation_paths():
+    keys = ['a/b/1.html', 'a/b/2.html', 'a/b/3.html', 'a/c.html', 'd.html',
+            'my page.html']
+    assert site_sync.invalidation_paths(keys, max_paths=10) == [
+        '/a/b/1.html', '/a/b/2.html', '/a/b/3.html', '/a/c.html', '/d.html',
+        '/my%20page.html']
+    assert site_sync.invalidation_paths(keys, max_paths=4) == [
+        '/a/b/*', '/a/c.html', '/d.html', '/my%20page.html']
+    assert site_sync.invalidation_paths(keys, max_paths=3) == [
+        '/a/*', '/d.html', '/my%20page.html']
+    assert site_sync.invalidation_paths(keys, max_paths=2) == ['/*']
+    assert site_sync.invalidation_paths(['x/y/z.html', 'q.html'], max_paths=1) == ['/*']
+
+def test_delete_after_sync_without_delete(site):
+    s3 = FakeS3()
+    site_sync.sync_site(str(site), 'bucket', s3=s3)
+    site.join('docs').join('b.html').remove()
+    site.join('docs').join('a.html').write('changed')
+    result = site_sync.sync_site(str(site), 'bucket', s3=s3)
+    assert result.uploaded == ['docs/a.html'] and result.deleted == []
+    assert 'docs/b.html' in s3.objects
+    result = site_sync.sync_site(str(site), 'bucket', s3=s3, delete=True)
+    assert result.deleted == ['docs/b.html']
+    assert 'docs/b.html' not in s3.objects
+    manifest = json.loads(s3.objects[site_sync.MANIFEST_KEY][0])
+    assert 'docs/b.html' not in manifest
@@ -27,14 +27,28 @@ CustomSubnets:
     priority: 2
 """
 
+shared_route_tables_user_data = custom_user_data + """
+ShareRouteTables: True
+"""
+
 def test_default_vpc():
     assert_rendered_template('vpc', 'default_vpc', dict())
 
 def test_custom_vpc():
     assert_rendered_template('vpc', 'custom_vpc', yaml.load(custom_user_data))
 
+def test_shared_route_tables_vpc():
+    assert_rendered_template(
+            'vpc',
+            'shared_route_tables_vpc',
+            yaml.load(shared_route_tables_user_data))
+
 if __name__ == '__main__':
     generate_template_fixture('vpc', 'default_vpc', dict())
     generate_template_fixture('vpc', 'custom_vpc', yaml.load(custom_user_data))
+    generate_template_fixture(
+            'vpc',
+            'shared_route_tables_vpc',
+            yaml.load(shared_route_tables_user_data))
 
 
@@ -16,6 +16,25 @@ Tags:
   tag2: value2
 """
 
+s3_user_data = """
+VpcId: custom-bogus-VpcId-for-testing-only
+Destination: s3
+LogPrefix: flowlogs
+Retention: 90
+LogFormat: [srcaddr, dstaddr, srcport, dstport, protocol, bytes, action, subnet-id, start, end]
+"""
+
+targets_user_data = """
+TrafficType: ACCEPT
+Targets:
+  - ResourceId: vpc-0123456789abcdef0
+  - ResourceId: subnet-0123456789abcdef0
+    TrafficType: REJECT
+    MaxAggregationInterval: 60
+  - ResourceId: eni-0123456789abcdef0
+    MaxAggregationInterval: 60
+"""
+
 def test_default_vpc_flowlogs():
     assert_rendered_template('vpc_flowlogs', 'default_vpc_flowlogs', dict())
 
@@ -23,7 +42,41 @@ def test_custom_vpc_flowlogs():
     assert_rendered_template(
             'vpc_flowlogs', 'custom_vpc_flowlogs', yaml.load(custom_user_data))
 
+def test_s3_vpc_flowlogs():
+    assert_rendered_template(
+            'vpc_flowlogs', 's3_vpc_flowlogs', yaml.load(s3_user_data))
+
+def test_s3_vpc_flowlogs_validation():
+    from sceptremods.templates.vpc_flowlogs import (
+        validate_log_format,
+        validate_log_prefix,
+    )
+    with pytest.raises(ValueError):
+        validate_log_format(['srcaddr', 'bogus'])
+    with pytest.raises(ValueError):
+        validate_log_format(['srcaddr', 'srcaddr'])
+    with pytest.raises(ValueError):
+        validate_log_prefix('flowlogs/')
+
+def test_targets_vpc_flowlogs():
+    assert_rendered_template(
+            'vpc_flowlogs', 'targets_vpc_flowlogs', yaml.load(targets_user_data))
+
+def test_targets_validation():
+    from sceptremods.templates.vpc_flowlogs import validate_targets
+    for bad in [
+            [dict(ResourceId='igw-0123')],
+            [dict(ResourceId='vpc-0123', MaxAggregationInterval=300)],
+            [dict(ResourceId='vpc-0123'), dict(ResourceId='vpc-0123')],
+            [dict(ResourceId='vpc-0123', Traffic='ALL')]]:
+        with pytest.raises(ValueError):
+            validate_targets(bad)
+
 if __name__ == '__main__':
     generate_template_fixture('vpc_flowlogs', 'default_vpc_flowlogs', dict())
     generate_template_fixture(
             'vpc_flowlogs', 'custom_vpc_flowlogs', yaml.load(custom_user_data))
+    generate_template_fixture(
+            'vpc_flowlogs', 's3_vpc_flowlogs', yaml.load(s3_user_data))
+    generate_template_fixture(
+            'vpc_flowlogs', 'targets_vpc_flowlogs', yaml.load(targets_user_data))
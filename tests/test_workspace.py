@@ -0,0 +1,36 @@
+import os
+
+from sceptremods import workspace
+
+
+def make_project(path, version=None):
+    config = path.mkdir('sceptre').mkdir('config')
+    lines = ['project_code: sceptre-{}'.format(path.basename)]
+    if version:
+        lines.append('sceptremods_version: {}'.format(version))
+    config.join('config.yaml').write('\n'.join(lines) + '\n')
+    path.join('sceptre').mkdir('templates').join('vpc_wrapper.py').write('old\n')
+    return str(path.join('sceptre'))
+
+def test_workspace(tmpdir):
+    current = make_project(tmpdir.mkdir('net'), '0.0.5')
+    stale = make_project(tmpdir.mkdir('apps').mkdir('web'), "'0.0.2'")
+    unset = make_project(tmpdir.mkdir('db'))
+    make_project(tmpdir.mkdir('.cache'), '0.0.1')
+    tmpdir.mkdir('docs').mkdir('sceptre')
+
+    projects = workspace.discover_projects(str(tmpdir))
+    assert projects == sorted([current, stale, unset])
+    assert workspace.discover_projects(current) == [current]
+    assert workspace.stale_projects(projects, '0.0.5') == {
+        stale: '0.0.2', unset: None}
+
+    wrappers = tmpdir.mkdir('wrappers')
+    wrappers.mkdir('templates').join('vpc_wrapper.py').write('new\n')
+    wrappers.join('templates').join('sg_wrapper.py').write('sg\n')
+    results = workspace.sync_workspace(projects, str(wrappers), refresh=True, jobs=2)
+    assert sorted(results) == sorted(os.path.join(p, 'templates') for p in projects)
+    for project in projects:
+        assert os.listdir(os.path.join(project, 'templates')) == ['vpc_wrapper.py']
+        with open(os.path.join(project, 'templates', 'vpc_wrapper.py')) as f:
+            assert f.read() == 'new\n'
@@ -0,0 +1,39 @@
+import json
+import os
+import importlib.util
+
+import pytest
+
+from sceptremods import templates
+from sceptremods.templates import sg
+
+
+WRAPPER = os.path.join(os.path.dirname(__file__), '..', 'src', 'wrappers',
+        'templates', 'sceptremods_wrapper.py')
+
+def load_wrapper(tmpdir, name):
+    # load a linked copy of the wrapper by path, as sceptre does
+    path = tmpdir.join(name)
+    path.mksymlinkto(os.path.abspath(WRAPPER))
+    spec = importlib.util.spec_from_file_location(name[:-len('.py')], str(path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_sceptremods_wrapper(tmpdir):
+    user_data = dict(VpcId='vpc-123456')
+    expected = json.loads(sg.sceptre_handler(dict(user_data)))
+
+    wrapper = load_wrapper(tmpdir, 'sceptremods_wrapper.py')
+    module_data = dict(user_data, SceptremodsModule='sg')
+    assert json.loads(wrapper.sceptre_handler(module_data)) == expected
+    assert module_data['SceptremodsModule'] == 'sg'
+    with pytest.raises(ValueError):
+        wrapper.sceptre_handler(user_data)
+    with pytest.raises(ValueError):
+        wrapper.sceptre_handler(dict(user_data, SceptremodsModule='bogus'))
+
+    wrapper = load_wrapper(tmpdir, 'sg_wrapper.py')
+    assert json.loads(wrapper.sceptre_handler(dict(user_data))) == expected
+    assert templates.get_handler('sg') is sg.sceptre_handler
+    assert templates.get_template_class('sg') is sg.SG